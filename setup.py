@@ -13,14 +13,14 @@ with open('README.md', 'rb') as f:
 
 install_requires = [
     'psutil',
-    'numpy<=1.14.1',
-    'pandas',
+    'numpy>=1.16',
+    'scipy>=1.6',
+    'pandas>=1.0',
     'matplotlib',
-    'shapely',
-    'geopandas',
+    'shapely>=2.0',
+    'geopandas>=0.10',
+    'pyarrow',
     'scikit-learn',
-    'tensorflow<=1.10.0',
-    'keras',
     'networkx',
     'osmnx',
     'jupyter'
@@ -51,13 +51,23 @@ setup(
         'Topic :: Scientific/Engineering :: Artificial Intelligence',
         'Operating System :: OS Independent',
         'License :: OSI Approved :: MIT License',
-        'Programming Language :: Python :: 2.7',
-        'Programming Language :: Python :: 3.5',
-        'Programming Language :: Python :: 3.6',
+        'Programming Language :: Python :: 3',
+        'Programming Language :: Python :: 3.8',
+        'Programming Language :: Python :: 3.9',
+        'Programming Language :: Python :: 3.10',
+        'Programming Language :: Python :: 3.11',
         'Programming Language :: Python :: Implementation :: CPython',
     ],
+    python_requires='>=3.8',
     install_requires=install_requires,
-    # pip install -e .[dev]
-    extras_require={'dev': ['pytest', 'flake8', 'ipython', 'ipdb']},
+    # pip install -e .[dev] / .[numba] / .[population]
+    extras_require={
+        'dev': ['pytest', 'flake8', 'ipython', 'ipdb'],
+        # Compiled KDE and dispersion kernels (NumPy kernels otherwise)
+        'numba': ['numba'],
+        # Population downscaling network: written against the Keras API of
+        # TensorFlow 1.x, not ported to TensorFlow 2
+        'population': ['tensorflow<=1.10.0', 'keras'],
+    },
     packages=find_packages(exclude=['examples']),
 )
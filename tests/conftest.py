@@ -0,0 +1,121 @@
+###############
+# Repository: https://github.com/lgervasoni/urbansprawl
+# MIT License
+###############
+
+import geopandas as gpd
+import numpy as np
+import pytest
+from shapely.geometry import Point, box
+
+# Arguments of the OSM data processing stages
+default_processing_kwargs = {
+    "retrieve_graph": False,
+    "default_height": 3,
+    "meters_per_level": 3,
+    "associate_landuses_m2": True,
+    "mixed_building_first_floor_activity": True,
+    "minimum_m2_building_area": 9,
+    "date": None,
+    "tile_size": None,
+    "n_jobs": None,
+    "simplify_tolerance": None,
+}
+
+
+def get_downloaded_state(num_buildings=120, seed=0):
+    """
+        Synthetic processing state, as returned by the download stage:
+    Buildings, Points of Interest (within buildings and isolated), building
+    parts and land use polygons over a 3x3 km region (UTM coordinates)
+    """
+    random_state = np.random.RandomState(seed)
+    crs = "EPSG:32631"
+    # South-west corner of the region, within the UTM zone
+    x0, y0 = 500000, 5000000
+    x, y = random_state.uniform(0, 3000, size=(2, num_buildings))
+    x, y = x + x0, y + y0
+    size = random_state.uniform(8, 30, size=num_buildings)
+    df_osm_built = gpd.GeoDataFrame(
+        {
+            "building": random_state.choice(
+                ["yes", "house", "apartments", "commercial", "retail"],
+                size=num_buildings,
+            ),
+            "building:levels": random_state.choice(
+                [None, "2", "5"], size=num_buildings
+            ),
+            "osm_id": np.arange(num_buildings) + 1000,
+            "osm_type": "way",
+        },
+        geometry=[
+            box(x_, y_, x_ + s, y_ + s) for x_, y_, s in zip(x, y, size)
+        ],
+        crs=crs,
+    )
+    # Points of Interest: Within buildings, and isolated
+    rows = random_state.choice(num_buildings, size=40)
+    points = [Point(x[i] + size[i] / 2, y[i] + size[i] / 2) for i in rows]
+    points += [
+        Point(x0 + x_, y0 + y_)
+        for x_, y_ in random_state.uniform(0, 3000, (10, 2))
+    ]
+    df_osm_pois = gpd.GeoDataFrame(
+        {
+            "amenity": random_state.choice(
+                ["restaurant", "school", "bank"], size=len(points)
+            ),
+            "osm_id": np.arange(len(points)) + 5000,
+            "osm_type": "node",
+        },
+        geometry=points,
+        crs=crs,
+    )
+    # Building parts: Within buildings
+    rows = random_state.choice(num_buildings, size=20, replace=False)
+    df_osm_building_parts = gpd.GeoDataFrame(
+        {
+            "building:part": "yes",
+            "building:levels": random_state.choice(["1", "3"], size=20),
+            "shop": random_state.choice([None, "bakery"], size=20),
+            "osm_id": np.arange(20) + 8000,
+            "osm_type": "way",
+        },
+        geometry=[
+            box(x[i] + 1, y[i] + 1, x[i] + size[i] / 2, y[i] + size[i] / 2)
+            for i in rows
+        ],
+        crs=crs,
+    )
+    df_osm_lu = gpd.GeoDataFrame(
+        {
+            "landuse": ["residential", "commercial", "industrial", "retail"],
+            "osm_id": [1, 2, 3, 4],
+        },
+        geometry=[
+            box(x0, y0, x0 + 1500, y0 + 1500),
+            box(x0 + 1500, y0, x0 + 3000, y0 + 1500),
+            box(x0, y0 + 1500, x0 + 1500, y0 + 3000),
+            box(x0 + 1500, y0 + 1500, x0 + 3000, y0 + 3000),
+        ],
+        crs=crs,
+    )
+    return {
+        "date_query": None,
+        "region": {},
+        "crs": crs,
+        "df_osm_built": df_osm_built,
+        "df_osm_lu": df_osm_lu,
+        "df_osm_pois": df_osm_pois,
+        "df_osm_building_parts": df_osm_building_parts,
+    }
+
+
+@pytest.fixture
+def downloaded_state():
+    return get_downloaded_state
+
+
+@pytest.fixture
+def processing_kwargs():
+    return dict(default_processing_kwargs)
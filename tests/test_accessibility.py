@@ -0,0 +1,242 @@
+###############
+# Repository: https://github.com/lgervasoni/urbansprawl
+# MIT License
+###############
+
+from bisect import bisect
+
+import geopandas as gpd
+import networkx as nx
+import numpy as np
+import pytest
+from shapely.geometry import Point
+
+from urbansprawl.sprawl import accessibility_parallel, kernels
+from urbansprawl.sprawl.accessibility import compute_grid_accessibility
+
+
+def get_test_graph(num_nodes=60, num_edges=150, seed=0):
+    """
+        Random directed graph with continuous edge lengths (no ties), an
+    isolated node and random activities per node
+    """
+    random_state = np.random.RandomState(seed)
+    G = nx.DiGraph()
+    G.add_nodes_from(range(num_nodes))
+    for u, v in random_state.randint(0, num_nodes - 1, size=(num_edges, 2)):
+        if u != v:
+            G.add_edge(u, v, length=random_state.uniform(10, 500))
+    for node in G.nodes:
+        G.nodes[node]["num_activities"] = int(random_state.poisson(1.5))
+    return G
+
+
+def set_test_graph_arrays(G):
+    """
+        Set the CSR graph arrays of the current process from input graph
+    """
+    indptr, indices, lengths = [0], [], []
+    for node in G.nodes:
+        for neighbour, data in sorted(G[node].items()):
+            indices.append(neighbour)
+            lengths.append(data["length"])
+        indptr.append(len(indices))
+    accessibility_parallel.set_graph_arrays(
+        {
+            "num_activities": np.array(
+                [G.nodes[node]["num_activities"] for node in G.nodes]
+            ),
+            "indptr": np.array(indptr, dtype=np.int64),
+            "indices": np.array(indices, dtype=np.int64),
+            "lengths": np.array(lengths, dtype=np.float64),
+        }
+    )
+
+
+def traversal_count_activities(G, N0, arguments):
+    """
+        Former (networkx) traversal of the fixed distance metric
+    """
+    visited_nodes = set()
+    neighboring_nodes_id = []
+    neighboring_nodes_cost = []
+    num_activities_travelled = 0
+    N_visit = N0
+    shortest_path_length_N0_ = nx.single_source_dijkstra_path_length(
+        G,
+        source=N0,
+        cutoff=arguments["fixed_distance_max_travel_distance"],
+        weight="length",
+    )
+    while True:
+        visited_nodes.add(N_visit)
+        num_activities_travelled += G.nodes[N_visit]["num_activities"]
+        if (
+            num_activities_travelled
+            >= arguments["fixed_distance_max_num_activities"]
+        ):
+            return arguments["fixed_distance_max_num_activities"]
+        for N_i in G.neighbors(N_visit):
+            if (N_i not in neighboring_nodes_id) and (
+                N_i not in visited_nodes
+            ):
+                cost = shortest_path_length_N0_.get(N_i)
+                if cost:
+                    idx_to_insert = bisect(neighboring_nodes_cost, cost)
+                    neighboring_nodes_id.insert(idx_to_insert, N_i)
+                    neighboring_nodes_cost.insert(idx_to_insert, cost)
+        if neighboring_nodes_id:
+            N_visit = neighboring_nodes_id.pop(0)
+            neighboring_nodes_cost.pop(0)
+        else:
+            return num_activities_travelled
+
+
+def traversal_minimum_cost(G, N0, arguments):
+    """
+        Former (networkx) traversal of the fixed activities metric
+    """
+    visited_nodes = []
+    neighboring_nodes_id = []
+    neighboring_nodes_cost = []
+    activities_travelled = 0
+    N_visit = N0
+    costs = nx.single_source_dijkstra_path_length(G, N0, weight="length")
+    while not activities_travelled >= arguments["fixed_activities_min_number"]:
+        visited_nodes.append(N_visit)
+        activities_travelled += G.nodes[N_visit]["num_activities"]
+        for N_i in G.neighbors(N_visit):
+            if (N_i not in neighboring_nodes_id) and (
+                N_i not in visited_nodes
+            ):
+                cost = costs[N_i]
+                idx_to_insert = bisect(neighboring_nodes_cost, cost)
+                neighboring_nodes_id.insert(idx_to_insert, N_i)
+                neighboring_nodes_cost.insert(idx_to_insert, cost)
+        if neighboring_nodes_id:
+            N_visit = neighboring_nodes_id.pop(0)
+            cost_travel = neighboring_nodes_cost.pop(0)
+            if cost_travel > arguments["fixed_activities_max_travel_distance"]:
+                return arguments["fixed_activities_max_travel_distance"]
+        else:
+            return np.nan
+    return costs[visited_nodes[-1]]
+
+
+@pytest.fixture
+def graph():
+    G = get_test_graph()
+    set_test_graph_arrays(G)
+    yield G
+    accessibility_parallel.clear_graph_arrays()
+
+
+@pytest.mark.parametrize("max_travel_distance", [300, 1000, 5000])
+@pytest.mark.parametrize("min_number", [1, 5, 20])
+def test_minimum_cost_activities_travel(
+    graph, max_travel_distance, min_number
+):
+    arguments = {
+        "fixed_distance": False,
+        "fixed_activities": True,
+        "fixed_activities_min_number": min_number,
+        "fixed_activities_max_travel_distance": max_travel_distance,
+    }
+    nodes = np.arange(graph.number_of_nodes())
+    expected = [
+        traversal_minimum_cost(graph, node, arguments) for node in nodes
+    ]
+    np.testing.assert_allclose(
+        accessibility_parallel.compute_accessibility_chunk(nodes, arguments),
+        expected,
+    )
+
+
+@pytest.mark.parametrize("max_travel_distance", [300, 1000, 5000])
+@pytest.mark.parametrize("max_num_activities", [5, 250])
+def test_count_activities_fixed_distance(
+    graph, max_travel_distance, max_num_activities
+):
+    arguments = {
+        "fixed_distance": True,
+        "fixed_activities": False,
+        "fixed_distance_max_travel_distance": max_travel_distance,
+        "fixed_distance_max_num_activities": max_num_activities,
+    }
+    nodes = np.arange(graph.number_of_nodes())
+    expected = [
+        traversal_count_activities(graph, node, arguments) for node in nodes
+    ]
+    np.testing.assert_allclose(
+        accessibility_parallel.compute_accessibility_chunk(nodes, arguments),
+        expected,
+    )
+
+
+def get_test_street_network(num_rows=8, spacing=100.0, seed=0):
+    """
+        Street network grid (both directions), activity buildings and POIs
+    near its nodes, and reference points
+    """
+    random_state = np.random.RandomState(seed)
+    G = nx.MultiDiGraph()
+    for i in range(num_rows):
+        for j in range(num_rows):
+            G.add_node(i * num_rows + j, x=i * spacing, y=j * spacing)
+    for i in range(num_rows):
+        for j in range(num_rows):
+            for i_, j_ in [(i + 1, j), (i, j + 1)]:
+                if (i_ < num_rows) and (j_ < num_rows):
+                    length = spacing * random_state.uniform(1, 1.5)
+                    u, v = i * num_rows + j, i_ * num_rows + j_
+                    G.add_edge(u, v, length=length)
+                    G.add_edge(v, u, length=length)
+    extent = spacing * (num_rows - 1)
+
+    def get_points(num_points):
+        return [
+            Point(*p)
+            for p in random_state.uniform(0, extent, size=(num_points, 2))
+        ]
+
+    df_osm_built = gpd.GeoDataFrame(
+        {"classification": random_state.choice(["activity", "mixed"], 60)},
+        geometry=[p.buffer(5) for p in get_points(60)],
+    )
+    df_osm_pois = gpd.GeoDataFrame(
+        {"classification": ["activity"] * 30}, geometry=get_points(30)
+    )
+    df_indices = gpd.GeoDataFrame(geometry=get_points(40))
+    return G, df_osm_built, df_osm_pois, df_indices
+
+
+@pytest.mark.parametrize("fixed_distance", [True, False])
+def test_compute_grid_accessibility_processes(fixed_distance):
+    if kernels.numba is not None:
+        # Threads started by compiled kernels: Workers must not be forked
+        kernels.gaussian_density(
+            np.zeros((100, 2)), np.zeros((100, 2)), np.ones((100, 1)), 1.0
+        )
+    kw_args = {
+        "fixed_distance": fixed_distance,
+        "fixed_activities": not fixed_distance,
+        "max_edge_length": 200,
+        "max_node_distance": 250,
+        "fixed_distance_max_travel_distance": 300,
+        "fixed_distance_max_num_activities": 250,
+        "fixed_activities_min_number": 10,
+        "fixed_activities_max_travel_distance": 5000,
+    }
+    results = []
+    for n_jobs in [1, 2]:
+        G, df_osm_built, df_osm_pois, df_indices = get_test_street_network()
+        compute_grid_accessibility(
+            df_indices,
+            G,
+            df_osm_built,
+            df_osm_pois,
+            dict(kw_args, n_jobs=n_jobs),
+        )
+        results.append(df_indices["accessibility"].values)
+    assert np.isfinite(results[0]).any()
+    np.testing.assert_allclose(results[1], results[0])
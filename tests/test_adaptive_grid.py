@@ -0,0 +1,189 @@
+###############
+# Repository: https://github.com/lgervasoni/urbansprawl
+# MIT License
+###############
+
+import numpy as np
+import pytest
+
+from urbansprawl.osm import core as osm_core
+from urbansprawl.sprawl import core
+
+indices_computation = {
+    "dispersion": True,
+    "landusemix": True,
+    "accessibility": False,
+}
+dispersion_args = {"radius_search": 750, "use_median": False}
+landusemix_args = {
+    "walkable_distance": 600,
+    "compute_activity_types_kde": True,
+    "weighted_kde": True,
+    "pois_weight": 9,
+    "log_weighted": True,
+    "kde_engine": "exact",
+    "kde_tolerance": 1e-8,
+    "kde_n_jobs": None,
+    "kde_float32": False,
+}
+index_columns = [
+    "dispersion",
+    "landusemix",
+    "landusemix_categories",
+    "landuse_intensity",
+]
+
+
+def get_processed_frames(state, kwargs):
+    """
+        Processed buildings, building parts and Points of Interest
+    """
+    for stage, process_stage in osm_core.processing_stages[1:]:
+        process_stage(state, None, kwargs)
+    return (
+        state["df_osm_built"],
+        state["df_osm_building_parts"],
+        state["df_osm_pois"],
+    )
+
+
+def compute_grid(frames, step):
+    """
+        Sprawling indices on the regular grid of the buildings bounding box
+    """
+    df_osm_built, df_osm_building_parts, df_osm_pois = frames
+    df_indices = core.get_indices_grid(
+        df_osm_built, df_osm_building_parts, df_osm_pois, step
+    )
+    core.compute_grid_indices(
+        df_indices,
+        None,
+        df_osm_built,
+        df_osm_pois,
+        indices_computation,
+        None,
+        landusemix_args,
+        dispersion_args,
+    )
+    return df_indices
+
+
+def compute_adaptive_grid(frames, step, adaptive_grid_args):
+    """
+        Sprawling indices on the adaptive grid refined from the regular grid
+    """
+    df_osm_built, df_osm_building_parts, df_osm_pois = frames
+    return core.compute_adaptive_grid_indices(
+        core.get_indices_grid(
+            df_osm_built, df_osm_building_parts, df_osm_pois, step
+        ),
+        None,
+        df_osm_built,
+        df_osm_pois,
+        step,
+        adaptive_grid_args,
+        indices_computation,
+        None,
+        landusemix_args,
+        dispersion_args,
+    )
+
+
+def sort_cells(df_indices):
+    return df_indices.sort_values(["col", "row"]).reset_index(drop=True)
+
+
+@pytest.fixture
+def frames(downloaded_state, processing_kwargs):
+    return get_processed_frames(downloaded_state(), processing_kwargs)
+
+
+def test_adaptive_grid_not_refined(frames):
+    # No threshold: The coarse grid
+    expected = compute_grid(frames, 400)
+    df_grid = compute_adaptive_grid(frames, 400, {"min_step": 100})
+    assert (df_grid["level"] == 0).all()
+    assert (df_grid["step"] == 400).all()
+    assert (df_grid.geometry.values == expected.geometry.values).all()
+    for column in index_columns:
+        np.testing.assert_allclose(df_grid[column], expected[column])
+
+
+def test_adaptive_grid_fully_refined(frames):
+    # Every cell refined twice: The regular grid of step 100, offset so that
+    # each coarse cell holds 4x4 fine cells
+    step = 400
+    df_grid = sort_cells(
+        compute_adaptive_grid(
+            frames, step, {"min_step": 100, "density_threshold": -1}
+        )
+    )
+    assert (df_grid["level"] == 2).all()
+    assert (df_grid["step"] == 100).all()
+
+    df_coarse = core.get_indices_grid(*frames, step)
+    west, south = df_coarse.total_bounds[:2] - step * 3 / 8.0
+    num_cols, num_rows = 4 * (df_coarse["col"].max() + 1), 4 * (
+        df_coarse["row"].max() + 1
+    )
+    df_indices = core.get_indices_grid_from_bbox(
+        [
+            west,
+            south,
+            west + (num_cols - 0.5) * 100,
+            south + (num_rows - 0.5) * 100,
+        ],
+        100,
+        df_coarse.crs,
+    )
+    df_osm_built, _, df_osm_pois = frames
+    core.compute_grid_indices(
+        df_indices,
+        None,
+        df_osm_built,
+        df_osm_pois,
+        indices_computation,
+        None,
+        landusemix_args,
+        dispersion_args,
+    )
+    expected = sort_cells(df_indices)
+
+    assert len(df_grid) == len(expected)
+    for column in ["col", "row"]:
+        assert (df_grid[column].values == expected[column].values).all()
+    np.testing.assert_allclose(df_grid.geometry.x, expected.geometry.x)
+    np.testing.assert_allclose(df_grid.geometry.y, expected.geometry.y)
+    np.testing.assert_allclose(df_grid["dispersion"], expected["dispersion"])
+    # Land use mix estimated at arbitrary points (tree engine): Neglected
+    # kernel values within the tolerance
+    for column in index_columns[1:]:
+        np.testing.assert_allclose(
+            df_grid[column], expected[column], rtol=1e-6, atol=1e-6
+        )
+
+
+def test_adaptive_grid_partition(frames):
+    # Refined cells: Leaves cover the coarse grid cells, without overlap
+    step = 400
+    df_coarse = core.get_indices_grid(*frames, step)
+    df_grid = compute_adaptive_grid(
+        frames, step, {"min_step": 100, "gradient_threshold": 0.1}
+    )
+    assert df_grid["level"].nunique() > 1
+    np.testing.assert_allclose(
+        (df_grid["step"] ** 2).sum(), len(df_coarse) * step ** 2
+    )
+    # Leaves within distinct fine cells
+    fine_cells = set()
+    for level, df_level in df_grid.groupby("level"):
+        factor = 2 ** (2 - level)
+        for col, row in zip(df_level["col"], df_level["row"]):
+            cells = {
+                (col * factor + i, row * factor + j)
+                for i in range(factor)
+                for j in range(factor)
+            }
+            assert not (cells & fine_cells)
+            fine_cells |= cells
+    assert len(fine_cells) == 16 * len(df_coarse)
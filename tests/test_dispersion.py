@@ -0,0 +1,61 @@
+###############
+# Repository: https://github.com/lgervasoni/urbansprawl
+# MIT License
+###############
+
+import geopandas as gpd
+import numpy as np
+import pytest
+from shapely.geometry import Point, box
+
+from urbansprawl.osm.utils import closest_distance_column
+from urbansprawl.sprawl.dispersion import compute_grid_dispersion
+from urbansprawl.sprawl.kernels import numba
+from urbansprawl.sprawl.utils import get_bandwidth_suffix
+
+backends = ["numpy"] + ([] if numba is None else ["numba"])
+
+
+def get_test_frames(num_buildings=400, seed=0):
+    """
+        Random square buildings (closest distances with ties) and a regular
+        grid of reference points
+    """
+    random_state = np.random.RandomState(seed)
+    x, y = random_state.uniform(0, 2000, size=(2, num_buildings))
+    df_osm_built = gpd.GeoDataFrame(
+        {
+            closest_distance_column: np.round(
+                random_state.uniform(0, 50, size=num_buildings)
+            )
+        },
+        geometry=[box(x_ - 5, y_ - 5, x_ + 5, y_ + 5) for x_, y_ in zip(x, y)],
+        crs="EPSG:32631",
+    )
+    xv, yv = np.meshgrid(np.arange(0, 2001, 100), np.arange(0, 2001, 100))
+    df_indices = gpd.GeoDataFrame(
+        geometry=[Point(x_, y_) for x_, y_ in zip(xv.ravel(), yv.ravel())],
+        crs="EPSG:32631",
+    )
+    return df_indices, df_osm_built
+
+
+@pytest.mark.parametrize("backend", backends)
+@pytest.mark.parametrize("use_median", [True, False])
+def test_dispersion_radii(backend, use_median):
+    df_indices, df_osm_built = get_test_frames()
+    # Unsorted radii: Columns follow the requested radii
+    radii = [250, 75, 500]
+    kwargs = {"use_median": use_median, "kernels_backend": backend}
+    compute_grid_dispersion(
+        df_indices, df_osm_built, dict(kwargs, radius_search=radii)
+    )
+    for radius in radii:
+        df_radius = df_indices[["geometry"]].copy()
+        compute_grid_dispersion(
+            df_radius, df_osm_built, dict(kwargs, radius_search=radius)
+        )
+        np.testing.assert_allclose(
+            df_indices["dispersion" + get_bandwidth_suffix(radius)],
+            df_radius["dispersion"],
+        )
@@ -0,0 +1,245 @@
+###############
+# Repository: https://github.com/lgervasoni/urbansprawl
+# MIT License
+###############
+
+import numpy as np
+import pandas as pd
+import pytest
+from scipy.spatial.distance import cdist
+
+from urbansprawl.sprawl import kernels, utils
+
+
+def baseline_kde(X, weights, bandwidth, Y):
+    """
+        Former estimation: Gaussian kernel over all pairwise distances,
+    rescaled to sum 1
+    """
+    PDF = np.sum(
+        np.exp(-0.5 * (cdist(Y, X, "euclidean") / bandwidth) ** 2)
+        * (weights / np.sum(weights)),
+        axis=1,
+    )
+    return PDF / PDF.sum()
+
+
+def baseline_kde_matrix(X, Weights, bandwidth, Y):
+    """
+        Former estimation of each weights column
+    """
+    return np.column_stack(
+        [baseline_kde(X, w, bandwidth, Y) for w in np.asarray(Weights).T]
+    )
+
+
+@pytest.fixture
+def points():
+    """
+        Weighted points (three densities) and a regular grid of evaluation
+    points (step 50 m) covering part of them
+    """
+    random_state = np.random.RandomState(0)
+    X = random_state.uniform(0, 5000, size=(1500, 2))
+    Weights = pd.DataFrame(
+        random_state.uniform(1, 10, size=(1500, 3)),
+        columns=["activity", "residential", "mixed"],
+    )
+    cols, rows = np.meshgrid(np.arange(40), np.arange(30), indexing="ij")
+    cols, rows = cols.ravel(), rows.ravel()
+    Y = np.column_stack([1000 + 50.0 * cols, 800 + 50.0 * rows])
+    return X, Weights, Y, cols, rows
+
+
+def assert_relative_close(densities, expected, rtol):
+    """
+        Maximum error, relative to the maximum density
+    """
+    densities = np.asarray(densities)
+    assert densities.shape == expected.shape
+    assert np.abs(densities - expected).max() <= rtol * expected.max()
+
+
+@pytest.mark.parametrize("bandwidth", [200, 400])
+def test_fft_kde(points, bandwidth):
+    X, Weights, Y, cols, rows = points
+    grid = utils.get_grid_indices(Y, cols, rows)
+    expected = baseline_kde_matrix(X, Weights, bandwidth, Y)
+    densities = utils.BinnedFFTKernelDensityEstimation(
+        X, Weights, bandwidth, Y, grid=grid
+    )
+    assert list(densities.columns) == list(Weights.columns)
+    # Linear binning error bound: (h / bandwidth)^2 / 4, h <= bandwidth / 8
+    assert_relative_close(densities, expected, (1 / 8) ** 2 / 4)
+    # Full kernel support
+    assert_relative_close(
+        utils.BinnedFFTKernelDensityEstimation(
+            X, Weights, bandwidth, Y, grid=grid, tolerance=0
+        ),
+        expected,
+        (1 / 8) ** 2 / 4,
+    )
+    # Several bandwidths
+    densities = utils.BinnedFFTKernelDensityEstimation(
+        X, Weights, [bandwidth, 2 * bandwidth], Y, grid=grid
+    )
+    assert_relative_close(
+        densities[2 * bandwidth],
+        baseline_kde_matrix(X, Weights, 2 * bandwidth, Y),
+        (1 / 8) ** 2 / 4,
+    )
+
+
+def test_fft_kde_points(points):
+    # Arbitrary points (no grid): Truncated estimation
+    X, Weights, Y, _, _ = points
+    Y = Y + np.random.RandomState(1).uniform(-10, 10, size=Y.shape)
+    assert_relative_close(
+        utils.BinnedFFTKernelDensityEstimation(X, Weights, 300, Y),
+        baseline_kde_matrix(X, Weights, 300, Y),
+        1e-6,
+    )
+
+
+@pytest.mark.parametrize("fill", [1.0, 0.5, 0.05])
+def test_separable_kde(points, fill):
+    # Grid with holes: Points covering a fraction of the evaluated cells
+    X, Weights, Y, cols, rows = points
+    selected = np.random.RandomState(1).uniform(size=len(Y)) < fill
+    Y, cols, rows = Y[selected], cols[selected], rows[selected]
+    grid = utils.get_grid_indices(Y, cols, rows)
+    assert grid is not None
+    expected = baseline_kde_matrix(X, Weights, 400, Y)
+    assert_relative_close(
+        utils.SeparableKernelDensityEstimation(X, Weights, 400, Y, grid=grid),
+        expected,
+        1e-12,
+    )
+    # Exact engine, given the grid
+    assert_relative_close(
+        utils.WeightedKernelDensityEstimation(X, Weights, 400, Y, grid=grid),
+        expected,
+        1e-12,
+    )
+    # Single precision
+    assert_relative_close(
+        utils.SeparableKernelDensityEstimation(
+            X, Weights, 400, Y, grid=grid, dtype=np.float32
+        ),
+        expected,
+        1e-5,
+    )
+
+
+def test_grid_indices(points):
+    _, _, Y, cols, rows = points
+    cols_, rows_, step, origin = utils.get_grid_indices(Y, cols, rows)
+    assert step == pytest.approx(50)
+    np.testing.assert_allclose(origin, [1000, 800])
+    # Points off the grid
+    Y = Y + np.random.RandomState(1).uniform(-10, 10, size=Y.shape)
+    assert utils.get_grid_indices(Y, cols, rows) is None
+
+
+@pytest.mark.parametrize("backend", ["numpy", "auto"])
+def test_tree_kde(points, backend):
+    X, Weights, Y, _, _ = points
+    Y = Y + np.random.RandomState(1).uniform(-10, 10, size=Y.shape)
+    expected = baseline_kde_matrix(X, Weights, 400, Y)
+    # Kernel values lower than the tolerance are neglected
+    assert_relative_close(
+        utils.TreeKernelDensityEstimation(
+            X, Weights, 400, Y, backend=backend
+        ),
+        expected,
+        1e-6,
+    )
+    # No truncation
+    assert_relative_close(
+        utils.TreeKernelDensityEstimation(
+            X, Weights, 400, Y, tolerance=0, backend=backend
+        ),
+        expected,
+        1e-12,
+    )
+    # Several bandwidths, single weights column
+    densities = utils.TreeKernelDensityEstimation(
+        X, Weights["activity"], [200, 600], Y, backend=backend
+    )
+    for bandwidth in [200, 600]:
+        assert isinstance(densities[bandwidth], pd.Series)
+        assert_relative_close(
+            densities[bandwidth],
+            baseline_kde(X, Weights["activity"].values, bandwidth, Y),
+            1e-6,
+        )
+
+
+@pytest.mark.parametrize("n_jobs", [1, 4])
+@pytest.mark.parametrize("max_mb_per_chunk", [None, 0.05])
+def test_kde_chunks(points, n_jobs, max_mb_per_chunk):
+    # Many small chunks, evaluated by several threads
+    X, Weights, Y, cols, rows = points
+    grid = utils.get_grid_indices(Y, cols, rows)
+    expected = baseline_kde_matrix(X, Weights, 400, Y)
+    kwargs = {"max_mb_per_chunk": max_mb_per_chunk, "n_jobs": n_jobs}
+    for densities, rtol in [
+        (
+            utils.WeightedKernelDensityEstimation(
+                X, Weights, 400, Y, backend="numpy", **kwargs
+            ),
+            1e-12,
+        ),
+        (
+            utils.WeightedKernelDensityEstimation(
+                X, Weights, 400, Y, backend="numpy", dtype=np.float32, **kwargs
+            ),
+            1e-5,
+        ),
+        (
+            utils.WeightedKernelDensityEstimation(
+                X, Weights, 400, Y, grid=grid, **kwargs
+            ),
+            1e-12,
+        ),
+        (
+            utils.TreeKernelDensityEstimation(
+                X, Weights, 400, Y, backend="numpy", **kwargs
+            ),
+            1e-6,
+        ),
+    ]:
+        assert_relative_close(densities, expected, rtol)
+
+
+@pytest.mark.skipif(kernels.numba is None, reason="Numba is not installed")
+def test_numba_kde(points):
+    # Compiled kernels: Same densities as the NumPy kernels
+    X, Weights, Y, _, _ = points
+    Y = Y + np.random.RandomState(1).uniform(-10, 10, size=Y.shape)
+    # The compiled tree kernel also skips the pairs beyond the cutoff of the
+    # smaller bandwidth: Differences within the neglected kernel values
+    for engine, bandwidth, rtol in [
+        (utils.WeightedKernelDensityEstimation, 300, 1e-12),
+        (utils.WeightedKernelDensityEstimation, 600, 1e-12),
+        (utils.TreeKernelDensityEstimation, 300, 1e-6),
+        (utils.TreeKernelDensityEstimation, 600, 1e-10),
+    ]:
+        densities = [
+            engine(X, Weights, [300, 600], Y, backend=backend)[bandwidth]
+            for backend in ["numba", "numpy"]
+        ]
+        assert_relative_close(densities[0], densities[1].values, rtol)
+    assert_relative_close(
+        utils.WeightedKernelDensityEstimation(
+            X, Weights, 400, Y, backend="numba"
+        ),
+        baseline_kde_matrix(X, Weights, 400, Y),
+        1e-12,
+    )
+
+
+def test_kernels_backend():
+    assert kernels.get_kernels_backend("numpy") == "numpy"
+    with pytest.raises(ValueError):
+        kernels.get_kernels_backend("cuda")
@@ -0,0 +1,131 @@
+###############
+# Repository: https://github.com/lgervasoni/urbansprawl
+# MIT License
+###############
+
+import os
+import pickle
+
+import numpy as np
+import pandas as pd
+import pytest
+from shapely.geometry import box
+
+from urbansprawl.osm import core, utils
+from urbansprawl.osm.surface import landuses_m2_keys, sum_landuses
+
+processing_key = "0123456789ab"
+processing_stages = list(core.processing_stages)
+
+
+def not_downloaded(state, city_ref, kwargs):
+    raise AssertionError("Resumed processing must not download data")
+
+
+class ProcessingInterrupted(Exception):
+    pass
+
+
+def interrupted(state, city_ref, kwargs):
+    raise ProcessingInterrupted
+
+
+@pytest.fixture
+def storage_folder(tmp_path, monkeypatch):
+    monkeypatch.setattr(utils, "storage_folder", str(tmp_path))
+    return tmp_path
+
+
+def get_stages(replaced):
+    """
+        Processing stages, replacing the functions of input stages
+    """
+    return [
+        (stage, replaced.get(stage, process_stage))
+        for stage, process_stage in processing_stages
+    ]
+
+
+def test_resume_processing(
+    storage_folder, monkeypatch, downloaded_state, processing_kwargs
+):
+    # Reference: Stages run in memory
+    expected = downloaded_state()
+    for stage, process_stage in processing_stages[1:]:
+        process_stage(expected, None, processing_kwargs)
+
+    # Downloaded data checkpointed; processing interrupted before computing
+    # the surfaces
+    utils.store_checkpoint(
+        downloaded_state(),
+        utils.get_checkpoint_filename("city", processing_key, "download"),
+    )
+    monkeypatch.setattr(
+        core,
+        "processing_stages",
+        get_stages({"download": not_downloaded, "surfaces": interrupted}),
+    )
+    with pytest.raises(ProcessingInterrupted):
+        core.run_processing_stages(
+            {}, "city", processing_kwargs, processing_key
+        )
+    # Only the last checkpoint is kept
+    checkpoint_folder = os.path.dirname(
+        utils.get_checkpoint_filename("city", processing_key, "")
+    )
+    assert os.listdir(checkpoint_folder) == ["association.pkl"]
+
+    # Resumed after the association: Unpickled frames
+    monkeypatch.setattr(
+        core, "processing_stages", get_stages({"download": not_downloaded})
+    )
+    state = core.run_processing_stages(
+        {}, "city", processing_kwargs, processing_key
+    )
+
+    df_osm_built, df_expected = state["df_osm_built"], expected["df_osm_built"]
+    assert (df_osm_built.osm_id.values == df_expected.osm_id.values).all()
+    assert (df_osm_built.classification == df_expected.classification).all()
+    assert (df_expected.classification == "mixed").any()
+    for column in [
+        "m2_activity",
+        "m2_residential",
+        utils.closest_distance_column,
+    ]:
+        np.testing.assert_allclose(df_osm_built[column], df_expected[column])
+    for column, key in [
+        ("containing_parts", "df_osm_building_parts"),
+        ("containing_poi", "df_osm_pois"),
+    ]:
+        association = utils.get_structure_association(
+            df_osm_built, column, state[key]
+        )
+        expected_association = utils.get_structure_association(
+            df_expected, column, expected[key]
+        )
+        assert (association.offsets == expected_association.offsets).all()
+        assert (association.indices == expected_association.indices).all()
+
+
+@pytest.mark.parametrize(
+    "classification, expected",
+    [("activity", [200, 0]), ("mixed", [100, 100]), ("residential", [0, 200])],
+)
+def test_sum_landuses_unpickled(classification, expected):
+    # Classification strings loaded from a checkpoint are equal, but not
+    # identical, to the literals
+    row = pickle.loads(
+        pickle.dumps(
+            pd.Series(
+                {
+                    "classification": classification,
+                    "geometry": box(0, 0, 10, 10),
+                    "building_levels": 2,
+                    "activity_category": ["shop"],
+                }
+            )
+        )
+    )
+    landuses_m2 = {landuse: 0 for landuse in landuses_m2_keys}
+    sum_landuses(row, landuses_m2)
+    assert [landuses_m2["activity"], landuses_m2["residential"]] == expected
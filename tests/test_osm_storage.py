@@ -0,0 +1,216 @@
+###############
+# Repository: https://github.com/lgervasoni/urbansprawl
+# MIT License
+###############
+
+from datetime import datetime
+
+import geopandas as gpd
+import numpy as np
+import pytest
+import shapely
+from shapely.geometry import box
+
+from urbansprawl.osm import core, utils
+
+geo_formats = ["geojson", "parquet", "feather"]
+
+
+@pytest.fixture
+def processed_frames(downloaded_state, processing_kwargs):
+    """
+        Buildings, building parts and Points of Interest processed from the
+    synthetic downloaded data
+    """
+    state = downloaded_state()
+    for stage, process_stage in core.processing_stages[1:]:
+        process_stage(state, None, processing_kwargs)
+    return (
+        state["df_osm_built"],
+        state["df_osm_building_parts"],
+        state["df_osm_pois"],
+    )
+
+
+@pytest.fixture
+def storage_folder(tmp_path, monkeypatch):
+    monkeypatch.setattr(utils, "storage_folder", str(tmp_path))
+    return tmp_path
+
+
+def store_frames(frames, geo_format, monkeypatch):
+    """
+        Store input frames in the storage folder, return their filenames
+    """
+    monkeypatch.setattr(utils, "geo_format", geo_format)
+    filenames = utils.get_dataframes_filenames("city", "0123456789ab")
+    for df, filename in zip(frames, filenames):
+        utils.store_geodataframe(df, filename)
+    return filenames
+
+
+def get_associated_osm_ids(df_osm_built, df_osm_structures, column):
+    """
+        OSM ids of the structures associated to each building
+    """
+    association = utils.get_structure_association(
+        df_osm_built, column, df_osm_structures
+    )
+    osm_ids = df_osm_structures["osm_id"].values
+    return {
+        osm_id: sorted(osm_ids[association[i]])
+        for i, osm_id in enumerate(df_osm_built["osm_id"].values)
+    }
+
+
+def assert_frames_equal(loaded, expected):
+    """
+        Same rows, geometries, land use surfaces and structure associations
+    """
+    for df, df_expected in zip(loaded, expected):
+        assert df.crs == df_expected.crs
+        assert (df["osm_id"].values == df_expected["osm_id"].values).all()
+        assert (
+            df.classification.fillna("").values
+            == df_expected.classification.fillna("").values
+        ).all()
+        assert shapely.equals_exact(
+            np.asarray(df.geometry.values),
+            np.asarray(df_expected.geometry.values),
+            tolerance=1e-3,
+        ).all()
+    for column in ["m2_activity", "m2_residential"]:
+        np.testing.assert_allclose(loaded[0][column], expected[0][column])
+    for df_structures, df_expected_structures, column in [
+        (loaded[1], expected[1], "containing_parts"),
+        (loaded[2], expected[2], "containing_poi"),
+    ]:
+        assert get_associated_osm_ids(
+            loaded[0], df_structures, column
+        ) == get_associated_osm_ids(
+            expected[0], df_expected_structures, column
+        )
+
+
+@pytest.mark.parametrize("geo_format", geo_formats)
+def test_storage_round_trip(
+    storage_folder, monkeypatch, processed_frames, geo_format
+):
+    filenames = store_frames(processed_frames, geo_format, monkeypatch)
+    assert_frames_equal(utils.load_osm_data(*filenames), processed_frames)
+
+
+def get_selection_args(frames, selection):
+    """
+        Lat-long selection arguments (bbox or polygon) of a square within
+    the synthetic region
+    """
+    x0, y0 = frames[0].total_bounds[:2]
+    region = gpd.GeoSeries(
+        [box(x0 + 700, y0 + 900, x0 + 1900, y0 + 2100)], crs=frames[0].crs
+    ).to_crs(4326)
+    if selection == "bbox":
+        return {"bbox": tuple(region.total_bounds)}
+    return {"polygon": region.iloc[0]}
+
+
+@pytest.mark.parametrize("selection", ["bbox", "polygon"])
+@pytest.mark.parametrize("geo_format", geo_formats)
+def test_partial_read(
+    storage_folder, monkeypatch, processed_frames, geo_format, selection
+):
+    # Several row groups: Only some of them are read
+    monkeypatch.setattr(utils, "columnar_row_group_size", 16)
+    filenames = store_frames(processed_frames, geo_format, monkeypatch)
+    selection_args = get_selection_args(processed_frames, selection)
+
+    loaded = utils.load_osm_data(*filenames, **selection_args)
+    # Same selection as in memory
+    assert_frames_equal(
+        loaded, utils.select_osm_data(*processed_frames, **selection_args)
+    )
+
+    df_osm_built = processed_frames[0]
+    region = (
+        gpd.GeoSeries(
+            [selection_args.get("polygon") or box(*selection_args["bbox"])],
+            crs=4326,
+        )
+        .to_crs(df_osm_built.crs)
+        .iloc[0]
+    )
+    intersecting = df_osm_built.osm_id[df_osm_built.intersects(region)]
+    assert set(loaded[0].osm_id) == set(intersecting)
+    assert 0 < len(loaded[0]) < len(df_osm_built)
+    # Loaded buildings keep all their structures
+    for df_structures, df_all_structures, column in [
+        (loaded[1], processed_frames[1], "containing_parts"),
+        (loaded[2], processed_frames[2], "containing_poi"),
+    ]:
+        associated = get_associated_osm_ids(
+            df_osm_built, df_all_structures, column
+        )
+        assert get_associated_osm_ids(loaded[0], df_structures, column) == {
+            osm_id: associated[osm_id] for osm_id in loaded[0].osm_id
+        }
+
+
+def test_processing_key(processing_kwargs):
+    region_args = {"place": "City", "which_result": 1, "polygon": None}
+    key = utils.get_processing_key(region_args, processing_kwargs)
+    # Ordering, unset arguments and arguments not affecting the data
+    reordered = dict(reversed(list(processing_kwargs.items())))
+    reordered.update(
+        {"retrieve_graph": True, "tile_size": 1000, "n_jobs": 4, "other": None}
+    )
+    unset = {"place": "City", "which_result": 1}
+    assert utils.get_processing_key(unset, reordered) == key
+    for region_changes, kwargs_changes in [
+        ({"place": "Other city"}, {}),
+        ({"polygon": box(0, 0, 1, 1)}, {}),
+        ({}, {"date": datetime(2018, 1, 1)}),
+        ({}, {"minimum_m2_building_area": 20}),
+        ({}, {"simplify_tolerance": 0.5}),
+    ]:
+        assert (
+            utils.get_processing_key(
+                dict(region_args, **region_changes),
+                dict(processing_kwargs, **kwargs_changes),
+            )
+            != key
+        )
+
+
+def test_stored_processing_key(
+    storage_folder, monkeypatch, processed_frames, processing_kwargs
+):
+    region_args = {"place": "City", "which_result": 1}
+    key = utils.get_processing_key(region_args, processing_kwargs)
+    filenames = utils.get_dataframes_filenames("city", key)
+    for df, filename in zip(processed_frames, filenames):
+        utils.store_geodataframe(df, filename)
+    utils.update_manifest("city", key, region_args, processing_kwargs)
+    assert utils.load_manifest()["city"][key]["files"] == list(filenames)
+
+    def not_downloaded(state, city_ref, kwargs):
+        raise AssertionError("Stored data must not be processed again")
+
+    monkeypatch.setattr(
+        core,
+        "processing_stages",
+        [("download", not_downloaded)] + core.processing_stages[1:],
+    )
+    # Same key: Stored data
+    assert_frames_equal(
+        core.get_processed_osm_data(
+            "city", region_args, dict(processing_kwargs, n_jobs=2)
+        ),
+        processed_frames,
+    )
+    # Other processing arguments: Processed again
+    with pytest.raises(AssertionError, match="processed again"):
+        core.get_processed_osm_data(
+            "city",
+            region_args,
+            dict(processing_kwargs, minimum_m2_building_area=20),
+        )
@@ -0,0 +1,61 @@
+###############
+# Repository: https://github.com/lgervasoni/urbansprawl
+# MIT License
+###############
+
+import numpy as np
+import pytest
+
+from urbansprawl.osm import core
+from urbansprawl.osm.utils import get_structure_association
+
+
+def run_serial_stages(state, kwargs):
+    """
+        Tiled processing stages, run on the whole region
+    """
+    for stage, process_stage in core.processing_stages:
+        if stage in core.tiled_processing_stages:
+            process_stage(state, None, kwargs)
+    return state
+
+
+def get_osm_id_sets(state, column, key):
+    """
+        OSM ids of the structures associated to each building
+    """
+    association = get_structure_association(
+        state["df_osm_built"], column, state[key]
+    )
+    osm_ids = state[key]["osm_id"].values
+    return {
+        osm_id: set(osm_ids[association[i]])
+        for i, osm_id in enumerate(state["df_osm_built"]["osm_id"])
+    }
+
+
+@pytest.mark.parametrize("tile_size", [700, 1500])
+def test_tiled_processing(downloaded_state, processing_kwargs, tile_size):
+    serial = run_serial_stages(downloaded_state(), processing_kwargs)
+    tiled = downloaded_state()
+    core.process_osm_tiles(
+        tiled, None, dict(processing_kwargs, tile_size=tile_size, n_jobs=2)
+    )
+
+    df_serial = serial["df_osm_built"].set_index("osm_id").sort_index()
+    df_tiled = tiled["df_osm_built"].set_index("osm_id").sort_index()
+    assert (df_tiled.index == df_serial.index).all()
+    assert (df_tiled.classification == df_serial.classification).all()
+    # Some surface per land use
+    assert (df_serial.m2_activity > 0).any()
+    assert (df_serial.m2_residential > 0).any()
+    for column in ["m2_activity", "m2_residential"]:
+        np.testing.assert_allclose(df_tiled[column], df_serial[column])
+
+    for column, key in [
+        ("containing_parts", "df_osm_building_parts"),
+        ("containing_poi", "df_osm_pois"),
+    ]:
+        assert get_osm_id_sets(tiled, column, key) == get_osm_id_sets(
+            serial, column, key
+        )
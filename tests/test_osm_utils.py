@@ -0,0 +1,94 @@
+###############
+# Repository: https://github.com/lgervasoni/urbansprawl
+# MIT License
+###############
+
+import geopandas as gpd
+import numpy as np
+import pytest
+from shapely.geometry import Point, box
+
+from urbansprawl.osm.utils import (
+    associate_structures,
+    closest_distance_column,
+    compute_closest_building_distance,
+    get_structure_association,
+)
+
+
+def get_test_frames(index_name=None):
+    """
+        Buildings and POIs with non-contiguous OSM ids
+    """
+    df_buildings = gpd.GeoDataFrame(
+        geometry=[box(0, 0, 2, 2), box(5, 5, 6, 6), box(10, 10, 11, 11)],
+        index=[30, 10, 20],
+    )
+    df_pois = gpd.GeoDataFrame(
+        geometry=[Point(1, 1), Point(5.5, 5.5), Point(9, 9), Point(1.5, 0.5)],
+        index=[7, 9, 8, 6],
+    )
+    df_buildings.index.name = index_name
+    df_pois.index.name = index_name
+    return df_buildings, df_pois
+
+
+@pytest.mark.parametrize("index_name", [None, "osm_id"])
+def test_associate_structures(index_name):
+    df_buildings, df_pois = get_test_frames(index_name)
+    associate_structures(
+        df_buildings, df_pois, operation="contains", column="containing_poi"
+    )
+    association = get_structure_association(
+        df_buildings, "containing_poi", df_pois
+    )
+    # Former list column: POIs within each building, as OSM ids
+    expected = [
+        sorted(df_pois.index[df_pois.within(geometry)])
+        for geometry in df_buildings.geometry
+    ]
+    assert [
+        sorted(df_pois.index[association[i]]) for i in range(len(df_buildings))
+    ] == expected
+
+
+def get_test_buildings(num_buildings=200, seed=0):
+    """
+        Random square buildings, with duplicated, touching and overlapping
+    buildings
+    """
+    random_state = np.random.RandomState(seed)
+    x, y = random_state.uniform(0, 1000, size=(2, num_buildings))
+    size = random_state.uniform(5, 20, size=num_buildings)
+    geometries = [
+        box(x_, y_, x_ + s, y_ + s) for x_, y_, s in zip(x, y, size)
+    ]
+    geometries += [
+        geometries[0],
+        box(x[1] + size[1], y[1], x[1] + size[1] + 5, y[1] + 5),
+        box(x[2] + 1, y[2] + 1, x[2] + 30, y[2] + 30),
+    ]
+    return gpd.GeoDataFrame(
+        geometry=geometries, index=np.arange(len(geometries))[::-1] * 10
+    )
+
+
+@pytest.mark.parametrize("num_rows", [1, None])
+def test_closest_building_distance(num_rows):
+    # A single building: No other building
+    df_osm_built = get_test_buildings().iloc[:num_rows].copy()
+    compute_closest_building_distance(df_osm_built)
+    # Former computation: Minimum distance to every other building
+    geometries = df_osm_built.geometry.values
+    expected = [
+        min(
+            [
+                geometry.distance(other)
+                for j, other in enumerate(geometries)
+                if j != i
+            ],
+            default=np.nan,
+        )
+        for i, geometry in enumerate(geometries)
+    ]
+    np.testing.assert_allclose(df_osm_built[closest_distance_column], expected)
@@ -10,6 +10,7 @@ from .sprawl.core import (
     compute_grid_accessibility,
     compute_grid_dispersion,
 )
+from .sprawl.landusemix import compute_grid_landusemix_sweep
 from .sprawl.core import get_indices_grid, process_spatial_indices
 
 # Disaggrated population estimates
@@ -33,3 +33,49 @@ def expand_grid_point(point, factor, xoffset, yoffset):
         for y_ in ys:
             points.append(Point(x_, y_))
     return points
+
+
+def expand_grid_cells(cells, step, factor=2):
+    """Expand square grid cells by an integer factor: vectorized version of
+    `expand_grid_point`, keeping track of the integer row/column of each new
+    cell within the refined grid
+
+    Parameters
+    ----------
+    cells : geopandas.GeoDataFrame
+        Cells to expand (centre point geometries), with `row` and `col`
+    columns
+    step : float
+        Cells width and height
+    factor : int
+        Number of new cells to generate on each row/column
+    Returns
+    -------
+    geopandas.GeoDataFrame
+        New cells, with their `row`, `col` and `parent` (position of the
+    expanded cell)
+    """
+    import geopandas as gpd
+
+    offsets = (np.arange(factor) - 0.5 * (factor - 1)) * step / factor
+    # New cells ordered by parent, then column, then row
+    parent, col_offset, row_offset = [
+        a.ravel()
+        for a in np.meshgrid(
+            np.arange(len(cells)),
+            np.arange(factor),
+            np.arange(factor),
+            indexing="ij",
+        )
+    ]
+    x = cells.geometry.x.values[parent] + offsets[col_offset]
+    y = cells.geometry.y.values[parent] + offsets[row_offset]
+    return gpd.GeoDataFrame(
+        {
+            "row": cells["row"].values[parent] * factor + row_offset,
+            "col": cells["col"].values[parent] * factor + col_offset,
+            "parent": parent,
+        },
+        geometry=gpd.points_from_xy(x, y),
+        crs=cells.crs,
+    )
@@ -161,7 +161,7 @@ def compute_landuse_inference(df_buildings, df_landuse):
     df_landuse["area"] = df_landuse.apply(lambda x: x.geometry.area, axis=1)
 
     # Get geometries to infer within Land use polygons matching
-    sjoin = gpd.sjoin(df_buildings_to_infer, df_landuse, op="within")
+    sjoin = gpd.sjoin(df_buildings_to_infer, df_landuse, predicate="within")
 
     # Add index column to sort values
     sjoin["index"] = sjoin.index
@@ -3,11 +3,11 @@
 # MIT License
 ###############
 
-import osmnx as ox
-import pandas as pd
 import numpy as np
+import pandas as pd
 import time
 import os.path
+from shapely.geometry import box
 from osmnx import log
 
 from .overpass import (
@@ -25,11 +25,27 @@ from .classification import (
 )
 from .surface import compute_landuses_m2
 from .utils import (
-    load_geodataframe,
     store_geodataframe,
+    load_osm_data,
+    select_osm_data,
+    sort_geodataframe_spatially,
+    get_utm_crs,
+    project_geodataframe,
+    simplify_geodataframe,
     get_dataframes_filenames,
+    get_processing_key,
+    update_manifest,
+    get_checkpoint_filename,
+    store_checkpoint,
+    load_checkpoint,
+    remove_checkpoints,
     associate_structures,
+    compute_closest_building_distance,
     sanity_check_height_tags,
+    explode_dict_column,
+    StructureAssociation,
+    set_structure_association,
+    get_structure_association,
 )
 
 
@@ -98,17 +114,23 @@ def get_processed_osm_data(
         "mixed_building_first_floor_activity": True,
         "minimum_m2_building_area": 9,
         "date": None,
+        "tile_size": None,
+        "n_jobs": None,
+        "simplify_tolerance": None,
     },
+    select_bbox=None,
+    select_polygon=None,
 ):
     """
         Retrieves buildings, building parts, and Points of Interest associated
     with a residential/activity land use from OpenStreetMap data for input city
 
         If a name for input city is given, the data will be loaded (if it was
-        previously stored)
+        previously stored with the same region and processing arguments)
 
         If no stored files exist, it will query and process the data and store
-        it under the city name
+        it under the city name and a key of the region and processing
+        arguments (registered in the storage manifest)
 
         Queries data for input region (polygon, place, point/address and
         distance around, or bounding box coordinates)
@@ -170,6 +192,25 @@ def get_processed_osm_data(
         (otherwise filtered)
                         date : datetime.datetime
                                 query the database at a certain time-stamp
+                        tile_size : float
+                                if set, the processing is split in square
+        tiles of this size (meters) processed in parallel (see
+        process_osm_tiles)
+                        n_jobs : int
+                                number of processes for the tiled processing
+        (default: number of CPUs)
+                        simplify_tolerance : float
+                                if set, buildings, building parts and land
+        use polygons are simplified with this tolerance (meters), preserving
+        their topology
+        select_bbox : tuple
+                (west, south, east, north) lat-long bounding box: only the
+        buildings intersecting it (and their building parts and Points of
+        Interest) are returned
+        select_polygon : shapely Polygon or MultiPolygon
+                lat-long shape: only the buildings intersecting it (and their
+        building parts and Points of Interest) are returned (unlike
+        region_args polygon, the region which is queried and stored)
 
         Returns
         ----------
@@ -181,23 +222,45 @@ def get_processed_osm_data(
         """
     log("OSM data requested for city: " + str(city_ref))
 
-    start_time = time.time()
+    # Region of the returned data
+    selection_args = {"bbox": select_bbox, "polygon": select_polygon}
 
     if city_ref:
+        processing_key = get_processing_key(region_args, kwargs)
         geo_poly_file, geo_poly_parts_file, geo_point_file = get_dataframes_filenames(
-            city_ref
+            city_ref, processing_key
         )
 
         ##########################
         # Stored file ?
         ##########################
         if os.path.isfile(geo_poly_file):  # File exists
-            log("Found stored files for city " + city_ref)
+            log(
+                "Found stored files for city "
+                + city_ref
+                + " (key "
+                + processing_key
+                + ")"
+            )
             # Load local GeoDataFrames
-            return (
-                load_geodataframe(geo_poly_file),
-                load_geodataframe(geo_poly_parts_file),
-                load_geodataframe(geo_point_file),
+            return load_osm_data(
+                geo_poly_file,
+                geo_poly_parts_file,
+                geo_point_file,
+                **selection_args
+            )
+        # Legacy files, stored without a key: Not loaded, as the region and
+        # processing arguments they were computed with are unknown
+        legacy_poly_file = get_dataframes_filenames(city_ref)[0]
+        if os.path.isfile(legacy_poly_file):
+            log(
+                "Found stored files without processing key for city "
+                + city_ref
+                + " ("
+                + legacy_poly_file
+                + "): Bypassed, the data will be retrieved and stored "
+                + "under key "
+                + processing_key
             )
 
             # Get keyword arguments for input region of interest
@@ -240,24 +303,190 @@ def get_processed_osm_data(
     else:
         date_query = ""
 
-        ##########################
-        # Overpass query: Buildings
-        ##########################
-        # Query and update bounding box / polygon
+    state = {
+        "date_query": date_query,
+        "region": {
+            "polygon": polygon,
+            "place": place,
+            "which_result": which_result,
+            "point": point,
+            "address": address,
+            "distance": distance,
+            "north": north,
+            "south": south,
+            "east": east,
+            "west": west,
+        },
+    }
+
+    ##########################
+    # Processing stages (resumed from the last checkpoint, if any)
+    ##########################
+    state = run_processing_stages(
+        state,
+        city_ref,
+        kwargs,
+        processing_key=processing_key if city_ref else None,
+    )
+    df_osm_built, df_osm_building_parts, df_osm_pois = (
+        state["df_osm_built"],
+        state["df_osm_building_parts"],
+        state["df_osm_pois"],
+    )
+
+    ##########################
+    # Store file ?
+    ##########################
+    if city_ref:  # File exists
+        # Save GeoDataFrames
+        store_geodataframe(df_osm_built, geo_poly_file)
+        store_geodataframe(df_osm_building_parts, geo_poly_parts_file)
+        store_geodataframe(df_osm_pois, geo_point_file)
+        update_manifest(city_ref, processing_key, region_args, kwargs)
+        remove_checkpoints(city_ref, processing_key)
+        log(
+            "Stored OSM data files for city: "
+            + city_ref
+            + " (key "
+            + processing_key
+            + ")"
+        )
+
+    return select_osm_data(
+        df_osm_built,
+        df_osm_building_parts,
+        df_osm_pois,
+        **selection_args
+    )
+
+
+####################################################
+# Processing stages
+####################################################
+
+
+def run_processing_stages(state, city_ref, kwargs, processing_key=None):
+    """
+        Run the OSM data processing stages
+        If a processing key is given, the state is checkpointed after each
+        stage, and the processing resumes after the last checkpointed stage
+
+        Parameters
+        ----------
+        state : dict
+                processing state: date query and region of interest arguments
+        city_ref : str
+                Name of input city / region
+        kwargs : dict
+                additional arguments to drive the process (see
+        get_processed_osm_data)
+        processing_key : string
+                key of the processing variant (see get_processing_key)
+
+        Returns
+        ----------
+        dict
+                processing state, containing the processed buildings, building
+        parts, and Points of Interest
+        """
+    first_stage = 0
+    if processing_key:
+        for i, (stage, _) in reversed(list(enumerate(processing_stages))):
+            checkpoint_file = get_checkpoint_filename(
+                city_ref, processing_key, stage
+            )
+            if os.path.isfile(checkpoint_file):
+                log("Resuming OSM data processing after stage: " + stage)
+                state = load_checkpoint(checkpoint_file)
+                first_stage = i + 1
+                break
+
+    previous_stage = processing_stages[first_stage - 1][0] if first_stage else None
+    i = first_stage
+    while i < len(processing_stages):
+        stage, process_stage = processing_stages[i]
+        if kwargs.get("tile_size") and (stage == tiled_processing_stages[0]):
+            # Tiled stages, run on each tile in parallel
+            process_osm_tiles(state, city_ref, kwargs)
+            stage = tiled_processing_stages[-1]
+            i = [name for name, _ in processing_stages].index(stage)
+        else:
+            process_stage(state, city_ref, kwargs)
+
+        if processing_key:
+            store_checkpoint(
+                state, get_checkpoint_filename(city_ref, processing_key, stage)
+            )
+            # Only the last checkpoint is needed to resume
+            if previous_stage:
+                previous_checkpoint_file = get_checkpoint_filename(
+                    city_ref, processing_key, previous_stage
+                )
+                if os.path.isfile(previous_checkpoint_file):
+                    os.remove(previous_checkpoint_file)
+        previous_stage = stage
+        i += 1
+    return state
+
+
+def download_osm_data(state, city_ref, kwargs):
+    """
+        Overpass queries: Buildings, land use polygons, Points of Interest
+    and building parts
+
+        Parameters
+        ----------
+        state : dict
+                processing state
+        city_ref : str
+                Name of input city / region
+        kwargs : dict
+                additional arguments to drive the process
+
+        Returns
+        ----------
+
+        """
+    start_time = time.time()
+    date_query, region = state["date_query"], state["region"]
+
+    ##########################
+    # Overpass query: Buildings
+    ##########################
+    # Query and update bounding box / polygon
     df_osm_built, polygon, north, south, east, west = create_buildings_gdf_from_input(
         date=date_query,
-        polygon=polygon,
-        place=place,
-        which_result=which_result,
-        point=point,
-        address=address,
-        distance=distance,
-        north=north,
-        south=south,
-        east=east,
-        west=west,
+        polygon=region["polygon"],
+        place=region["place"],
+        which_result=region["which_result"],
+        point=region["point"],
+        address=region["address"],
+        distance=region["distance"],
+        north=region["north"],
+        south=region["south"],
+        east=region["east"],
+        west=region["west"],
     )
+    region.update(
+        {
+            "polygon": polygon,
+            "north": north,
+            "south": south,
+            "east": east,
+            "west": west,
+        }
+    )
+    # Projection: UTM zone of the buildings (as osmnx.project_gdf), for all
+    # data frames. Without buildings, UTM zone of the region of interest
+    if len(df_osm_built):
+        crs = get_utm_crs(df_osm_built.geometry.values)
+    elif polygon is not None:
+        crs = get_utm_crs([polygon])
+    else:
+        crs = get_utm_crs([box(west, south, east, north)])
+    df_osm_built = project_geodataframe(df_osm_built, to_crs=crs)
     df_osm_built["osm_id"] = df_osm_built.index
+    df_osm_built["osm_type"] = "way"
     df_osm_built.reset_index(drop=True, inplace=True)
     df_osm_built.gdf_name = (
         str(city_ref) + "_buildings" if city_ref is not None else "buildings"
@@ -272,6 +501,7 @@ def get_processed_osm_data(
         south=south,
         east=east,
         west=west,
+        to_crs=crs,
     )
     df_osm_lu["osm_id"] = df_osm_lu.index
     # Drop useless columns
@@ -299,8 +529,10 @@ def get_processed_osm_data(
         south=south,
         east=east,
         west=west,
+        to_crs=crs,
     )
     df_osm_pois["osm_id"] = df_osm_pois.index
+    df_osm_pois["osm_type"] = "node"
     df_osm_pois.reset_index(drop=True, inplace=True)
     df_osm_pois.gdf_name = (
         str(city_ref) + "_points" if city_ref is not None else "points"
@@ -315,6 +547,7 @@ def get_processed_osm_data(
         south=south,
         east=east,
         west=west,
+        to_crs=crs,
     )
     # Filter: 1) rows not needed (roof, etc) and 2) building that already exists in `buildings` extract
     if "building" in df_osm_building_parts.columns:
@@ -337,6 +570,7 @@ def get_processed_osm_data(
             & (~df_osm_building_parts["building:part"].isnull())
         ]
     df_osm_building_parts["osm_id"] = df_osm_building_parts.index
+    df_osm_building_parts["osm_type"] = "way"
     df_osm_building_parts.reset_index(drop=True, inplace=True)
     df_osm_building_parts.gdf_name = (
         str(city_ref) + "_building_parts"
@@ -349,6 +583,41 @@ def get_processed_osm_data(
         + time.strftime("%H:%M:%S", time.gmtime(time.time() - start_time))
     )
 
+    state.update(
+        {
+            "crs": crs,
+            "df_osm_built": df_osm_built,
+            "df_osm_lu": df_osm_lu,
+            "df_osm_pois": df_osm_pois,
+            "df_osm_building_parts": df_osm_building_parts,
+        }
+    )
+
+
+def sanity_check_osm_data(state, city_ref, kwargs):
+    """
+        Sanity check of height tags, and removal of the columns which do not
+    provide valuable information
+
+        Parameters
+        ----------
+        state : dict
+                processing state
+        city_ref : str
+                Name of input city / region
+        kwargs : dict
+                additional arguments to drive the process
+
+        Returns
+        ----------
+
+        """
+    df_osm_built, df_osm_pois, df_osm_building_parts = (
+        state["df_osm_built"],
+        state["df_osm_pois"],
+        state["df_osm_building_parts"],
+    )
+
     ####################################################
     # Sanity check of height tags
     ####################################################
@@ -357,24 +626,12 @@ def get_processed_osm_data(
     sanity_check_height_tags(df_osm_built)
     sanity_check_height_tags(df_osm_building_parts)
 
-    def remove_nan_dict(x):  # Remove entries with NaN values
-        return {k: v for k, v in x.items() if pd.notnull(v)}
-
-    df_osm_built["height_tags"] = df_osm_built[
-        [c for c in height_tags if c in df_osm_built.columns]
-    ].apply(lambda x: remove_nan_dict(x.to_dict()), axis=1)
-    df_osm_building_parts["height_tags"] = df_osm_building_parts[
-        [c for c in height_tags if c in df_osm_building_parts.columns]
-    ].apply(lambda x: remove_nan_dict(x.to_dict()), axis=1)
-
     ###########
     # Remove columns which do not provide valuable information
     ###########
-    columns_of_interest = columns_osm_tag + [
-        "osm_id",
-        "geometry",
-        "height_tags",
-    ]
+    columns_of_interest = (
+        columns_osm_tag + ["osm_id", "osm_type", "geometry"] + height_tags
+    )
     df_osm_built.drop(
         [
             col
@@ -394,7 +651,7 @@ def get_processed_osm_data(
         inplace=True,
     )
 
-    columns_of_interest = columns_osm_tag + ["osm_id", "geometry"]
+    columns_of_interest = columns_osm_tag + ["osm_id", "osm_type", "geometry"]
     df_osm_pois.drop(
         [
             col
@@ -410,20 +667,40 @@ def get_processed_osm_data(
         + time.strftime("%H:%M:%S", time.gmtime(time.time() - start_time))
     )
 
+
+def classify_osm_data(state, city_ref, kwargs):
+    """
+        Classification of buildings, Points of Interest and building parts
+
+        Parameters
+        ----------
+        state : dict
+                processing state
+        city_ref : str
+                Name of input city / region
+        kwargs : dict
+                additional arguments to drive the process
+
+        Returns
+        ----------
+
+        """
+    df_osm_built, df_osm_pois, df_osm_building_parts = (
+        state["df_osm_built"],
+        state["df_osm_pois"],
+        state["df_osm_building_parts"],
+    )
+
     ###########
     # Classification
     ###########
     start_time = time.time()
 
-    df_osm_built["classification"], df_osm_built["key_value"] = list(
-        zip(*df_osm_built.apply(classify_tag, axis=1))
-    )
-    df_osm_pois["classification"], df_osm_pois["key_value"] = list(
-        zip(*df_osm_pois.apply(classify_tag, axis=1))
-    )
-    df_osm_building_parts["classification"], df_osm_building_parts[
-        "key_value"
-    ] = list(zip(*df_osm_building_parts.apply(classify_tag, axis=1)))
+    # (Spatial tiles may hold no building parts or Points of Interest)
+    for df_osm in [df_osm_built, df_osm_pois, df_osm_building_parts]:
+        classified = df_osm.apply(classify_tag, axis=1, result_type="reduce")
+        df_osm["classification"] = [c for c, _ in classified]
+        df_osm["key_value"] = [key_value for _, key_value in classified]
 
     # Remove unnecessary buildings
     df_osm_built.drop(
@@ -450,6 +727,32 @@ def get_processed_osm_data(
         + time.strftime("%H:%M:%S", time.gmtime(time.time() - start_time))
     )
 
+
+def project_osm_data(state, city_ref, kwargs):
+    """
+        Removal of the already used tags, projection, and removal of small
+    buildings
+
+        Parameters
+        ----------
+        state : dict
+                processing state
+        city_ref : str
+                Name of input city / region
+        kwargs : dict
+                additional arguments to drive the process
+
+        Returns
+        ----------
+
+        """
+    df_osm_built, df_osm_lu, df_osm_pois, df_osm_building_parts = (
+        state["df_osm_built"],
+        state["df_osm_lu"],
+        state["df_osm_pois"],
+        state["df_osm_building_parts"],
+    )
+
     ###########
     # Remove already used tags
     ###########
@@ -474,11 +777,13 @@ def get_processed_osm_data(
     ###########
     # Project, drop small buildings and reset indices
     ###########
-    # Project to UTM coordinates within the same zone
-    df_osm_built = ox.project_gdf(df_osm_built)
-    df_osm_lu = ox.project_gdf(df_osm_lu, to_crs=df_osm_built.crs)
-    df_osm_pois = ox.project_gdf(df_osm_pois, to_crs=df_osm_built.crs)
-    df_osm_building_parts = ox.project_gdf(
+    # Project to UTM coordinates within the same zone (no-op for data
+    # assembled in the region projection)
+    crs = state.get("crs")
+    df_osm_built = project_geodataframe(df_osm_built, to_crs=crs)
+    df_osm_lu = project_geodataframe(df_osm_lu, to_crs=df_osm_built.crs)
+    df_osm_pois = project_geodataframe(df_osm_pois, to_crs=df_osm_built.crs)
+    df_osm_building_parts = project_geodataframe(
         df_osm_building_parts, to_crs=df_osm_built.crs
     )
 
@@ -490,11 +795,93 @@ def get_processed_osm_data(
         inplace=True,
     )
 
+    # Spatially sort the rows: Allows partial reads of the stored files
+    df_osm_built = sort_geodataframe_spatially(df_osm_built)
+    df_osm_pois = sort_geodataframe_spatially(df_osm_pois)
+    df_osm_building_parts = sort_geodataframe_spatially(df_osm_building_parts)
+
     log(
         "Done: Geometries re-projection. Elapsed time (H:M:S): "
         + time.strftime("%H:%M:%S", time.gmtime(time.time() - start_time))
     )
 
+    state.update(
+        {
+            "df_osm_built": df_osm_built,
+            "df_osm_lu": df_osm_lu,
+            "df_osm_pois": df_osm_pois,
+            "df_osm_building_parts": df_osm_building_parts,
+        }
+    )
+
+
+def simplify_osm_geometries(state, city_ref, kwargs):
+    """
+        Simplify buildings, building parts and land use polygons (opt-in,
+    see simplify_tolerance argument)
+
+        Parameters
+        ----------
+        state : dict
+                processing state
+        city_ref : str
+                Name of input city / region
+        kwargs : dict
+                additional arguments to drive the process
+
+        Returns
+        ----------
+
+        """
+    tolerance = kwargs.get("simplify_tolerance")
+    if not tolerance:
+        return
+    start_time = time.time()
+
+    for key in ["df_osm_built", "df_osm_building_parts", "df_osm_lu"]:
+        if key not in state:
+            continue
+        state[key], report = simplify_geodataframe(state[key], tolerance)
+        log(
+            "Simplified "
+            + key
+            + ": "
+            + str(report["vertices"])
+            + " -> "
+            + str(report["simplified_vertices"])
+            + " vertices, maximum relative area error: "
+            + "{:.2%}".format(report["max_area_error"])
+        )
+
+    log(
+        "Done: Geometries simplification. Elapsed time (H:M:S): "
+        + time.strftime("%H:%M:%S", time.gmtime(time.time() - start_time))
+    )
+
+
+def infer_osm_landuses(state, city_ref, kwargs):
+    """
+        Infer buildings land use (under uncertainty)
+
+        Parameters
+        ----------
+        state : dict
+                processing state
+        city_ref : str
+                Name of input city / region
+        kwargs : dict
+                additional arguments to drive the process
+
+        Returns
+        ----------
+
+        """
+    df_osm_built, df_osm_lu, df_osm_pois = (
+        state["df_osm_built"],
+        state["df_osm_lu"],
+        state["df_osm_pois"],
+    )
+
     ####################################################
     # Infer buildings land use (under uncertainty)
     ####################################################
@@ -502,7 +889,7 @@ def get_processed_osm_data(
 
     compute_landuse_inference(df_osm_built, df_osm_lu)
     # Free space
-    del df_osm_lu
+    del df_osm_lu, state["df_osm_lu"]
 
     assert (
         len(df_osm_built[df_osm_built.key_value == {"inferred": "other"}]) == 0
@@ -515,6 +902,31 @@ def get_processed_osm_data(
         + time.strftime("%H:%M:%S", time.gmtime(time.time() - start_time))
     )
 
+
+def associate_osm_structures(state, city_ref, kwargs):
+    """
+        Associate for each building its containing building parts and Points
+    of Interest, and classify activity types
+
+        Parameters
+        ----------
+        state : dict
+                processing state
+        city_ref : str
+                Name of input city / region
+        kwargs : dict
+                additional arguments to drive the process
+
+        Returns
+        ----------
+
+        """
+    df_osm_built, df_osm_pois, df_osm_building_parts = (
+        state["df_osm_built"],
+        state["df_osm_pois"],
+        state["df_osm_building_parts"],
+    )
+
     ####################################################
     # Associate for each building, its containing building parts and Points of interest
     ####################################################
@@ -534,15 +946,10 @@ def get_processed_osm_data(
     )
 
     # Classify activity types
-    df_osm_built["activity_category"] = df_osm_built.apply(
-        lambda x: classify_activity_category(x.key_value), axis=1
-    )
-    df_osm_pois["activity_category"] = df_osm_pois.apply(
-        lambda x: classify_activity_category(x.key_value), axis=1
-    )
-    df_osm_building_parts["activity_category"] = df_osm_building_parts.apply(
-        lambda x: classify_activity_category(x.key_value), axis=1
-    )
+    for df_osm in [df_osm_built, df_osm_pois, df_osm_building_parts]:
+        df_osm["activity_category"] = df_osm.key_value.apply(
+            classify_activity_category
+        )
 
     log(
         "Done: Building parts association and activity categorization. "
@@ -550,6 +957,31 @@ def get_processed_osm_data(
         + time.strftime("%H:%M:%S", time.gmtime(time.time() - start_time))
     )
 
+
+def compute_osm_surfaces(state, city_ref, kwargs):
+    """
+        Measure the surface dedicated to each land use per building, and
+    finalize the land use columns
+
+        Parameters
+        ----------
+        state : dict
+                processing state
+        city_ref : str
+                Name of input city / region
+        kwargs : dict
+                additional arguments to drive the process
+
+        Returns
+        ----------
+
+        """
+    df_osm_built, df_osm_pois, df_osm_building_parts = (
+        state["df_osm_built"],
+        state["df_osm_pois"],
+        state["df_osm_building_parts"],
+    )
+
     ####################################################
     # Associate effective number of levels,
     # and measure the surface dedicated to each land use per building
@@ -574,11 +1006,7 @@ def get_processed_osm_data(
         # Set the composed classification given, for each building,
         # its containing Points of Interest and building parts classification
         df_osm_built.loc[
-            df_osm_built.apply(
-                lambda x: x.landuses_m2["activity"] > 0
-                and x.landuses_m2["residential"] > 0,
-                axis=1,
-            ),
+            (df_osm_built.m2_activity > 0) & (df_osm_built.m2_residential > 0),
             "classification",
         ] = "mixed"
 
@@ -600,6 +1028,79 @@ def get_processed_osm_data(
         "activity_category",
     ] = np.nan
 
+
+def explode_osm_tags(state, city_ref, kwargs):
+    """
+        Set the key:value tags defining the classification as categorical
+    columns
+        Not tiled: Categories are shared by the whole region
+
+        Parameters
+        ----------
+        state : dict
+                processing state
+        city_ref : str
+                Name of input city / region
+        kwargs : dict
+                additional arguments to drive the process
+
+        Returns
+        ----------
+
+        """
+    for key in ["df_osm_built", "df_osm_pois", "df_osm_building_parts"]:
+        explode_dict_column(state[key], "key_value", "key_value_", "category")
+
+
+def compute_osm_closest_distances(state, city_ref, kwargs):
+    """
+        Measure the distance of each building to its nearest building
+        Stored with the processed data: Dispersion indices reuse it
+
+        Parameters
+        ----------
+        state : dict
+                processing state
+        city_ref : str
+                Name of input city / region
+        kwargs : dict
+                additional arguments to drive the process
+
+        Returns
+        ----------
+
+        """
+    start_time = time.time()
+
+    # Whole region (not tiled): Nearest buildings may lie in other tiles
+    compute_closest_building_distance(state["df_osm_built"])
+
+    log(
+        "Done: Buildings closest distance. Elapsed time (H:M:S): "
+        + time.strftime("%H:%M:%S", time.gmtime(time.time() - start_time))
+    )
+
+
+def retrieve_osm_graph(state, city_ref, kwargs):
+    """
+        Overpass query: Street network graph
+
+        Parameters
+        ----------
+        state : dict
+                processing state
+        city_ref : str
+                Name of input city / region
+        kwargs : dict
+                additional arguments to drive the process
+
+        Returns
+        ----------
+
+        """
+    date_query, region = state["date_query"], state["region"]
+    df_osm_built = state["df_osm_built"]
+
     ##########################
     # Overpass query: Street network graph
     ##########################
@@ -609,11 +1110,11 @@ def get_processed_osm_data(
         get_route_graph(
             city_ref,
             date=date_query,
-            polygon=polygon,
-            north=north,
-            south=south,
-            east=east,
-            west=west,
+            polygon=region["polygon"],
+            north=region["north"],
+            south=region["south"],
+            east=region["east"],
+            west=region["west"],
             force_crs=df_osm_built.crs,
         )
 
@@ -622,14 +1123,262 @@ def get_processed_osm_data(
             + time.strftime("%H:%M:%S", time.gmtime(time.time() - start_time))
         )
 
-        ##########################
-        # Store file ?
-        ##########################
-    if city_ref:  # File exists
-        # Save GeoDataFrames
-        store_geodataframe(df_osm_built, geo_poly_file)
-        store_geodataframe(df_osm_building_parts, geo_poly_parts_file)
-        store_geodataframe(df_osm_pois, geo_point_file)
-        log("Stored OSM data files for city: " + city_ref)
 
-    return df_osm_built, df_osm_building_parts, df_osm_pois
+# Processing stages of get_processed_osm_data: (name, function)
+processing_stages = [
+    ("download", download_osm_data),
+    ("sanity_check", sanity_check_osm_data),
+    ("classification", classify_osm_data),
+    ("projection", project_osm_data),
+    ("simplification", simplify_osm_geometries),
+    ("inference", infer_osm_landuses),
+    ("association", associate_osm_structures),
+    ("surfaces", compute_osm_surfaces),
+    ("tags", explode_osm_tags),
+    ("closest_distances", compute_osm_closest_distances),
+    ("graph", retrieve_osm_graph),
+]
+# Stages run independently on each spatial tile (see process_osm_tiles)
+tiled_processing_stages = [
+    "sanity_check",
+    "classification",
+    "projection",
+    "simplification",
+    "inference",
+    "association",
+    "surfaces",
+]
+
+
+####################################################
+# Tiled processing
+####################################################
+
+
+def get_osm_tiles(state, tile_size):
+    """
+        Split the downloaded data in square tiles
+
+        Each building belongs to the tile containing its centroid. Each tile
+        also holds the land use polygons, building parts and Points of
+        Interest intersecting the bounding box of its buildings (halo):
+        Those are the only ones involved in its buildings land use inference
+        and structures association. Building parts and Points of Interest are
+        additionally owned by the (nearest) tile containing their centroid,
+        so that each of them is processed at least once
+
+        Parameters
+        ----------
+        state : dict
+                processing state, containing the downloaded data
+        tile_size : float
+                tiles size (meters)
+
+        Returns
+        ----------
+        list
+                processing state of each tile
+        """
+    from scipy.spatial import cKDTree
+
+    df_osm_built = state["df_osm_built"]
+
+    def get_cells(df):
+        centroids = df.geometry.centroid
+        return np.column_stack(
+            [
+                np.floor(centroids.x.values / tile_size),
+                np.floor(centroids.y.values / tile_size),
+            ]
+        )
+
+    # Tiles: Cells containing at least one building
+    tiles, built_tiles = np.unique(
+        get_cells(df_osm_built), axis=0, return_inverse=True
+    )
+    built_tiles = built_tiles.ravel()
+
+    # Owner (nearest) tile of building parts and Points of Interest
+    owners = {}
+    for key in ["df_osm_building_parts", "df_osm_pois"]:
+        if len(state[key]):
+            owners[key] = cKDTree(tiles).query(get_cells(state[key]))[1]
+        else:
+            owners[key] = np.zeros(0, dtype=int)
+
+    tiles_state = []
+    for tile in range(len(tiles)):
+        df_tile_built = df_osm_built.iloc[np.flatnonzero(built_tiles == tile)]
+        halo = box(*df_tile_built.total_bounds)
+        tile_state = {
+            "date_query": state["date_query"],
+            "region": state["region"],
+            "crs": state.get("crs"),
+            "df_osm_built": df_tile_built.reset_index(drop=True),
+        }
+        for key in ["df_osm_lu", "df_osm_building_parts", "df_osm_pois"]:
+            rows = state[key].sindex.query(halo, predicate="intersects")
+            if key in owners:
+                rows = np.union1d(rows, np.flatnonzero(owners[key] == tile))
+            tile_state[key] = (
+                state[key].iloc[np.sort(rows)].reset_index(drop=True)
+            )
+        tiles_state.append(tile_state)
+    return tiles_state
+
+
+def process_osm_tile(args):
+    """
+        Run the tiled processing stages on a tile
+
+        Parameters
+        ----------
+        args : tuple
+                tile processing state, city reference, and processing
+        arguments
+
+        Returns
+        ----------
+        dict
+                processed tile frames (structure associations are pickled
+        with the data frames attributes)
+        """
+    state, city_ref, kwargs = args
+    for stage, process_stage in processing_stages:
+        if stage in tiled_processing_stages:
+            process_stage(state, city_ref, kwargs)
+    return {
+        key: state[key]
+        for key in ["df_osm_built", "df_osm_building_parts", "df_osm_pois"]
+    }
+
+
+def process_osm_tiles(state, city_ref, kwargs):
+    """
+        Run the tiled processing stages on spatial tiles, in parallel
+        Each building is processed once, within its tile. Tiles results are
+        merged: rows processed by several tiles are kept once, and
+        structure associations refer to the merged data frames
+
+        Parameters
+        ----------
+        state : dict
+                processing state, containing the downloaded data
+        city_ref : str
+                Name of input city / region
+        kwargs : dict
+                additional arguments to drive the process (see
+        get_processed_osm_data)
+
+        Returns
+        ----------
+
+        """
+    from multiprocessing import get_context, cpu_count
+
+    start_time = time.time()
+    keys = ["df_osm_built", "df_osm_building_parts", "df_osm_pois"]
+    gdf_names = {key: getattr(state[key], "gdf_name", None) for key in keys}
+
+    # Spatially sorted rows: Merged tile results keep this order
+    for key in keys:
+        state[key] = sort_geodataframe_spatially(state[key])
+
+    tiles_state = get_osm_tiles(state, kwargs["tile_size"])
+    n_jobs = kwargs.get("n_jobs") or cpu_count()
+    log(
+        "Processing "
+        + str(len(tiles_state))
+        + " tiles using "
+        + str(n_jobs)
+        + " processes"
+    )
+    # Spawned workers: Forking a process whose compiled kernels (Numba) or
+    # tree queries already started threads may deadlock
+    with get_context("spawn").Pool(
+        min(n_jobs, max(len(tiles_state), 1))
+    ) as pool:
+        results = pool.map(
+            process_osm_tile,
+            [(tile_state, city_ref, kwargs) for tile_state in tiles_state],
+        )
+
+    def get_osm_keys(df):
+        # Rows identified by their OSM element: (type, id)
+        if "osm_type" not in df.columns:
+            return pd.Index(df["osm_id"].values)
+        return pd.MultiIndex.from_arrays(
+            [df["osm_type"].values, df["osm_id"].values]
+        )
+
+    # Merge: Rows processed by several tiles are kept once, sorted as the
+    # input rows. Position of each tile row in the merged data frames
+    merged, positions = {}, {}
+    for key in keys:
+        df_merged = pd.concat(
+            [result[key] for result in results], ignore_index=True, sort=False
+        )
+        osm_keys = get_osm_keys(df_merged)
+        kept = np.flatnonzero(~osm_keys.duplicated())
+        input_keys = get_osm_keys(state[key])
+        input_keys = input_keys[~input_keys.duplicated()]
+        kept = kept[
+            np.argsort(
+                input_keys.get_indexer(osm_keys[kept]), kind="mergesort"
+            )
+        ]
+        merged[key] = df_merged.iloc[kept]
+        positions[key] = osm_keys[kept].get_indexer(osm_keys)
+
+    # Structure associations: Tile positions to merged positions
+    built_offsets = np.cumsum([0] + [len(r["df_osm_built"]) for r in results])
+    for key, column in [
+        ("df_osm_building_parts", "containing_parts"),
+        ("df_osm_pois", "containing_poi"),
+    ]:
+        structure_offsets = np.cumsum([0] + [len(r[key]) for r in results])
+        rows, indices = [], []
+        for result, built_offset, structure_offset in zip(
+            results, built_offsets, structure_offsets
+        ):
+            association = get_structure_association(
+                result["df_osm_built"], column, result[key]
+            )
+            rows.append(
+                positions["df_osm_built"][association.rows() + built_offset]
+            )
+            indices.append(
+                positions[key][association.indices + structure_offset]
+            )
+        # Pairs found by several tiles are kept once
+        pairs = np.unique(
+            np.column_stack(
+                [
+                    np.concatenate([np.zeros(0, dtype=np.int64)] + rows),
+                    np.concatenate([np.zeros(0, dtype=np.int64)] + indices),
+                ]
+            ),
+            axis=0,
+        )
+        merged[column] = StructureAssociation.from_pairs(
+            len(merged["df_osm_built"]), pairs[:, 0], pairs[:, 1]
+        )
+
+    for key in keys:
+        state[key] = merged[key].reset_index(drop=True)
+        if gdf_names[key] is not None:
+            state[key].gdf_name = gdf_names[key]
+    for key, column in [
+        ("df_osm_building_parts", "containing_parts"),
+        ("df_osm_pois", "containing_poi"),
+    ]:
+        set_structure_association(
+            state["df_osm_built"], column, merged[column], state[key]
+        )
+    if "df_osm_lu" in state:
+        del state["df_osm_lu"]
+
+    log(
+        "Done: Tiled processing. Elapsed time (H:M:S): "
+        + time.strftime("%H:%M:%S", time.gmtime(time.time() - start_time))
+    )
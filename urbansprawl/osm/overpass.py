@@ -13,6 +13,65 @@ from osmnx import log
 import logging as lg
 import osmnx as ox
 
+from .utils import latlong_crs, project_coordinates
+
+#######################################################################
+# Geometries assembly
+#######################################################################
+
+
+def get_vertices_coordinates(responses, to_crs=None):
+    """
+        Get the coordinates of the nodes contained in input Overpass responses
+        Coordinates are projected in a single vectorized call
+
+        Parameters
+        ----------
+        responses : list
+                Overpass API responses
+        to_crs : dict, string or pyproj.CRS
+                projection of the coordinates (lat-long if None)
+
+        Returns
+        ----------
+        dict
+                node id -> (x, y) coordinates
+        """
+    ids, lons, lats = [], [], []
+    for response in responses:
+        for result in response["elements"]:
+            if "type" in result and result["type"] == "node":
+                ids.append(result["id"])
+                lons.append(result["lon"])
+                lats.append(result["lat"])
+
+    if (to_crs is not None) and ids:
+        lons, lats = project_coordinates(lons, lats, latlong_crs, to_crs)
+    return dict(zip(ids, zip(lons, lats)))
+
+
+def project_point(point, to_crs=None):
+    """
+        Project input lat-long point
+
+        Parameters
+        ----------
+        point : shapely.Point
+                lat-long point
+        to_crs : dict, string or pyproj.CRS
+                projection (lat-long if None)
+
+        Returns
+        ----------
+        shapely.Point
+                projected point
+        """
+    if to_crs is None:
+        return point
+    x, y = project_coordinates([point.x], [point.y], latlong_crs, to_crs)
+    return Point(x[0], y[0])
+
+
 #######################################################################
 # Buildings
 #######################################################################
@@ -296,6 +355,7 @@ def create_buildings_gdf(
     east=None,
     west=None,
     retain_invalid=False,
+    to_crs=None,
 ):
     """
         Get building footprint data from OSM then assemble it into a GeoDataFrame.
@@ -315,6 +375,9 @@ def create_buildings_gdf(
                 western longitude of bounding box
         retain_invalid : bool
                 if False discard any building footprints with an invalid geometry
+        to_crs : dict, string or pyproj.CRS
+                projection of the assembled geometries (lat-long if None):
+        raw coordinates are projected before building the geometries
         Returns
         -------
         GeoDataFrame
@@ -322,14 +385,7 @@ def create_buildings_gdf(
 
     responses = osm_bldg_download(date, polygon, north, south, east, west)
 
-    vertices = {}
-    for response in responses:
-        for result in response["elements"]:
-            if "type" in result and result["type"] == "node":
-                vertices[result["id"]] = {
-                    "lat": result["lat"],
-                    "lon": result["lon"],
-                }
+    vertices = get_vertices_coordinates(responses, to_crs)
 
     buildings = {}
     for response in responses:
@@ -337,12 +393,7 @@ def create_buildings_gdf(
             if "type" in result and result["type"] == "way":
                 nodes = result["nodes"]
                 try:
-                    polygon = Polygon(
-                        [
-                            (vertices[node]["lon"], vertices[node]["lat"])
-                            for node in nodes
-                        ]
-                    )
+                    polygon = Polygon([vertices[node] for node in nodes])
                 except Exception:
                     log("Polygon has invalid geometry: {}".format(nodes))
                 building = {"nodes": nodes, "geometry": polygon}
@@ -354,7 +405,7 @@ def create_buildings_gdf(
                 buildings[result["id"]] = building
 
     gdf = gpd.GeoDataFrame(buildings).T
-    gdf.crs = {"init": "epsg:4326"}
+    gdf.crs = latlong_crs if to_crs is None else to_crs
 
     if not retain_invalid:
         # drop all invalid geometries
@@ -1246,6 +1297,7 @@ def create_landuse_gdf(
     east=None,
     west=None,
     retain_invalid=False,
+    to_crs=None,
 ):
     """
         Get landuse footprint data from OSM then assemble it into a GeoDataFrame.
@@ -1265,6 +1317,9 @@ def create_landuse_gdf(
                 western longitude of bounding box
         retain_invalid : bool
                 if False discard any landuse footprints with an invalid geometry
+        to_crs : dict, string or pyproj.CRS
+                projection of the assembled geometries (lat-long if None):
+        raw coordinates are projected before building the geometries
         Returns
         -------
         GeoDataFrame
@@ -1272,14 +1327,7 @@ def create_landuse_gdf(
 
     responses = osm_landuse_download(date, polygon, north, south, east, west)
 
-    vertices = {}
-    for response in responses:
-        for result in response["elements"]:
-            if "type" in result and result["type"] == "node":
-                vertices[result["id"]] = {
-                    "lat": result["lat"],
-                    "lon": result["lon"],
-                }
+    vertices = get_vertices_coordinates(responses, to_crs)
 
     landuses = {}
     for response in responses:
@@ -1287,12 +1335,7 @@ def create_landuse_gdf(
             if "type" in result and result["type"] == "way":
                 nodes = result["nodes"]
                 try:
-                    polygon = Polygon(
-                        [
-                            (vertices[node]["lon"], vertices[node]["lat"])
-                            for node in nodes
-                        ]
-                    )
+                    polygon = Polygon([vertices[node] for node in nodes])
                 except Exception:
                     log("Polygon has invalid geometry: {}".format(nodes))
                 landuse = {"nodes": nodes, "geometry": polygon}
@@ -1304,7 +1347,7 @@ def create_landuse_gdf(
                 landuses[result["id"]] = landuse
 
     gdf = gpd.GeoDataFrame(landuses).T
-    gdf.crs = {"init": "epsg:4326"}
+    gdf.crs = latlong_crs if to_crs is None else to_crs
 
     if not retain_invalid:
         # drop all invalid geometries
@@ -1499,6 +1542,7 @@ def create_pois_gdf(
     east=None,
     west=None,
     retain_invalid=False,
+    to_crs=None,
 ):
     """
         Get POIs footprint data from OSM then assemble it into a GeoDataFrame.
@@ -1518,6 +1562,9 @@ def create_pois_gdf(
                 western longitude of bounding box
         retain_invalid : bool
                 if False discard any POIs footprints with an invalid geometry
+        to_crs : dict, string or pyproj.CRS
+                projection of the assembled geometries (lat-long if None):
+        raw coordinates are projected before building the geometries
         Returns
         -------
         GeoDataFrame
@@ -1525,12 +1572,14 @@ def create_pois_gdf(
 
     responses = osm_pois_download(date, polygon, north, south, east, west)
 
+    coordinates = get_vertices_coordinates(responses, to_crs)
+
     vertices = {}
     for response in responses:
         for result in response["elements"]:
             if "type" in result and result["type"] == "node":
 
-                point = Point(result["lon"], result["lat"])
+                point = Point(coordinates[result["id"]])
 
                 POI = {"geometry": point}
 
@@ -1541,7 +1590,7 @@ def create_pois_gdf(
                 vertices[result["id"]] = POI
 
     gdf = gpd.GeoDataFrame(vertices).T
-    gdf.crs = {"init": "epsg:4326"}
+    gdf.crs = latlong_crs if to_crs is None else to_crs
 
     if not retain_invalid:
         try:
@@ -1553,8 +1602,10 @@ def create_pois_gdf(
                 point = polygon.centroid
             else:  # Bounding box
                 point = Point((east + west) / 2.0, (north + south) / 2.0)
-            data = {"geometry": [point], "osm_id": [0]}
-            gdf = gpd.GeoDataFrame(data, crs={"init": "epsg:4326"})
+            data = {"geometry": [project_point(point, to_crs)], "osm_id": [0]}
+            gdf = gpd.GeoDataFrame(
+                data, crs=latlong_crs if to_crs is None else to_crs
+            )
 
     return gdf
 
@@ -1737,6 +1788,7 @@ def create_building_parts_gdf(
     east=None,
     west=None,
     retain_invalid=False,
+    to_crs=None,
 ):
     """
         Get building footprint data from OSM then assemble it into a
@@ -1762,6 +1814,9 @@ def create_building_parts_gdf(
         retain_invalid : bool
                 if False discard any building footprints with an invalid
         geometry
+        to_crs : dict, string or pyproj.CRS
+                projection of the assembled geometries (lat-long if None):
+        raw coordinates are projected before building the geometries
         Returns
         -------
         GeoDataFrame
@@ -1769,14 +1824,7 @@ def create_building_parts_gdf(
 
     responses = osm_bldg_part_download(date, polygon, north, south, east, west)
 
-    vertices = {}
-    for response in responses:
-        for result in response["elements"]:
-            if "type" in result and result["type"] == "node":
-                vertices[result["id"]] = {
-                    "lat": result["lat"],
-                    "lon": result["lon"],
-                }
+    vertices = get_vertices_coordinates(responses, to_crs)
 
     buildings = {}
     for response in responses:
@@ -1784,12 +1832,7 @@ def create_building_parts_gdf(
             if "type" in result and result["type"] == "way":
                 nodes = result["nodes"]
                 try:
-                    polygon = Polygon(
-                        [
-                            (vertices[node]["lon"], vertices[node]["lat"])
-                            for node in nodes
-                        ]
-                    )
+                    polygon = Polygon([vertices[node] for node in nodes])
                 except Exception:
                     log("Polygon has invalid geometry: {}".format(nodes))
                 building = {"nodes": nodes, "geometry": polygon}
@@ -1801,7 +1844,7 @@ def create_building_parts_gdf(
                 buildings[result["id"]] = building
 
     gdf = gpd.GeoDataFrame(buildings).T
-    gdf.crs = {"init": "epsg:4326"}
+    gdf.crs = latlong_crs if to_crs is None else to_crs
 
     if not retain_invalid:
         try:
@@ -1816,11 +1859,13 @@ def create_building_parts_gdf(
                 point = Point((east + west) / 2.0, (north + south) / 2.0)
                 # Data as records
             data = {
-                "geometry": [point],
+                "geometry": [project_point(point, to_crs)],
                 "osm_id": [0],
                 "building:part": ["yes"],
                 "height": [""],
             }
-            gdf = gpd.GeoDataFrame(data, crs={"init": "epsg:4326"})
+            gdf = gpd.GeoDataFrame(
+                data, crs=latlong_crs if to_crs is None else to_crs
+            )
 
     return gdf
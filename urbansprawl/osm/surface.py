@@ -9,6 +9,38 @@ from shapely.geometry import Polygon
 
 from .tags import height_tags, activity_classification
 from .classification import aggregate_classification
+from .utils import get_structure_association
+
+# Land uses with an associated surface (one column per land use)
+landuses_m2_keys = ["activity", "residential"] + list(
+    activity_classification.keys()
+)
+# Height tags denoting that a structure starts from a specific level
+min_level_tags = [
+    "building:min_level",
+    "min_level",
+    "building:min_height",
+    "min_height",
+]
+
+
+def landuse_m2_column(landuse):
+    """
+        Column containing the surface (squared meters) associated to input land
+    use
+
+        Parameters
+        ----------
+        landuse : string
+                land use (`residential`, `activity`) or activity category
+
+        Returns
+        ----------
+        string
+                column name
+        """
+    return "m2_" + landuse
+
 
 ############################################
 # Land uses surface association
@@ -107,7 +139,7 @@ def sum_landuses(
     if not x.get("geometry"):
         return
     # Mixed building assumption: First level for activity uses, the rest residential use
-    if x["classification"] is "activity":  # Sum activity use
+    if x["classification"] == "activity":  # Sum activity use
         landuses_m2["activity"] += x["geometry"].area * x["building_levels"]
         # Sum activity category m2
         area_per_activity_category = (
@@ -117,7 +149,7 @@ def sum_landuses(
         )
         for activity_type in x["activity_category"]:
             landuses_m2[activity_type] += area_per_activity_category
-    elif x["classification"] is "mixed":  # Sum activity and residential use
+    elif x["classification"] == "mixed":  # Sum activity and residential use
 
         if (x["building_levels"] > 1) and (
             mixed_building_first_floor_activity
@@ -162,7 +194,12 @@ def sum_landuses(
         )
 
 
-def calculate_landuse_m2(building, mixed_building_first_floor_activity=True):
+def calculate_landuse_m2(
+    building,
+    building_parts,
+    building_pois,
+    mixed_building_first_floor_activity=True,
+):
     """
         Calculate the total squared meters associated to residential and activity uses for input building
         In addition, surface usage for each activity types is performed
@@ -171,6 +208,10 @@ def calculate_landuse_m2(building, mixed_building_first_floor_activity=True):
         ----------
         building : geopandas.GeoSeries
                 input building
+        building_parts : geopandas.GeoDataFrame
+                building parts contained in the building
+        building_pois : geopandas.GeoDataFrame
+                Points of Interest contained in the building
         mixed_building_first_floor_activity : Boolean
                 if True: Associates building's first floor to activity uses and the rest to residential uses
                 if False: Associates half of the building's area to each land use (Activity and Residential)
@@ -179,17 +220,14 @@ def calculate_landuse_m2(building, mixed_building_first_floor_activity=True):
         ----------
         dict
                 contains the total associated surface to each land use key
+        (see `landuses_m2_keys`)
         """
     # Initialize
-    landuse_m2 = {}
-    landuse_m2["activity"] = 0
-    landuse_m2["residential"] = 0
-    for activity_type in list(activity_classification.keys()):
-        landuse_m2[activity_type] = 0
+    landuse_m2 = {landuse: 0 for landuse in landuses_m2_keys}
 
         # Get the composed classification from input building + containing POIs
     building_composed_classification = get_composed_classification(
-        building, building.pois_full_parts
+        building, building_pois
     )
 
     def no_min_level_geometry(building_parts):
@@ -197,21 +235,8 @@ def calculate_landuse_m2(building, mixed_building_first_floor_activity=True):
                 Returns building parts with no min. level associated
                 """
 
-        def no_min_level_tag(x):  # Buildings starts from a specific num level?
-            if (
-                x.get("building:min_level")
-                or x.get("min_level")
-                or x.get("building:min_height")
-                or x.get("min_height")
-            ):
-                return True
-            else:
-                return False
-                # Get the geometries of the contained buildings with no height/level tags available
-
-        geometries = building_parts.loc[
-            building_parts.height_tags.apply(lambda x: no_min_level_tag(x))
-        ].geometry
+        # Buildings starts from a specific num level?
+        geometries = building_parts.loc[building_parts.min_level_tagged].geometry
 
         # Create the union of those geometries
         no_min_level_geom = Polygon()
@@ -226,7 +251,7 @@ def calculate_landuse_m2(building, mixed_building_first_floor_activity=True):
         # level/height: Avoid duplicating first level surface
 
     building_composed_classification.geometry = building_composed_classification.geometry.difference(
-        no_min_level_geometry(building.full_parts)
+        no_min_level_geometry(building_parts)
     )
 
     # Sum land uses for main building
@@ -238,7 +263,7 @@ def calculate_landuse_m2(building, mixed_building_first_floor_activity=True):
 
     # Sum land uses for building parts.
     # If no classification given, use the building's land use
-    building.full_parts.apply(
+    building_parts.apply(
         lambda x: sum_landuses(
             x,
             landuse_m2,
@@ -253,11 +278,37 @@ def calculate_landuse_m2(building, mixed_building_first_floor_activity=True):
     return landuse_m2
 
 
+def get_height_tags_values(df_osm):
+    """
+        Get the height tags of input data frame as numeric columns
+
+        Parameters
+        ----------
+        df_osm : geopandas.GeoDataFrame
+                input data frame
+
+        Returns
+        ----------
+        pandas.DataFrame
+                one column per height tag (NaN under missing tag data)
+        """
+    return pd.DataFrame(
+        {
+            tag: pd.to_numeric(df_osm[tag], errors="coerce")
+            if tag in df_osm.columns
+            else np.nan
+            for tag in height_tags
+        },
+        index=df_osm.index,
+    )
+
+
 def associate_levels(df_osm, default_height, meters_per_level):
     """
         Calculate the effective number of levels for each input building
         Under missing tag data, default values are used
         A column ['building_levels'] is added to the data frame
+        Returns the absolute value in order to consider the cases of underground levels
 
         Parameters
         ----------
@@ -273,79 +324,59 @@ def associate_levels(df_osm, default_height, meters_per_level):
 
         """
 
-    def levels_from_height(height, meters_per_level):
+    def levels_from_height(height):
         """
                 Returns estimated number of levels given input height (meters)
+                By default: 1 level
                 """
-        levels = abs(round(height / meters_per_level))
-        if levels >= 1:
-            return levels
-        else:  # By default: 1 level
-            assert height > 0
-            return 1
-
-    def associate_level(x):
-        """
-                Associates the number of levels to input building given its height tags information
-                Returns the absolute value in order to consider the cases of underground levels
-                """
+        levels = np.abs(np.round(height / meters_per_level))
+        return np.where(levels >= 1, levels, 1)
 
-        # No height tags available
-        if not (type(x) == dict):
-            # Default values
-            number_levels = levels_from_height(
-                default_height, meters_per_level
-            )
-            return number_levels
-
-            # Buildings starts from a specific num level?
-        if x.get("building:min_level"):  # building:min_level
-            min_level = x["building:min_level"]
-        elif x.get("min_level"):  # min_level
-            min_level = x["min_level"]
-            # Height based
-        elif x.get("building:min_height"):  # min_level
-            min_level = levels_from_height(
-                x["building:min_height"], meters_per_level
-            )
-        elif x.get("min_height"):  # min_level
-            min_level = levels_from_height(x["min_height"], meters_per_level)
-        else:
-            min_level = 0
-
-            # Levels based
-        if x.get("building:levels"):  # Number of building:levels given
-            number_levels = abs(x["building:levels"] - min_level)
-        elif x.get("levels"):  # Number of levels given
-            number_levels = abs(x["levels"] - min_level)
-            # Height based
-        elif x.get("building:height"):  # building:height given
-            number_levels = abs(
-                levels_from_height(x["building:height"], meters_per_level)
-                - min_level
-            )
-        elif x.get("height"):  # height given
-            number_levels = abs(
-                levels_from_height(x["height"], meters_per_level) - min_level
-            )
-        else:  # No information given
-            number_levels = levels_from_height(
-                default_height, meters_per_level
-            )
+    tags = get_height_tags_values(df_osm)
+    # Tag information available (non-null, non-zero value)
+    given = tags.notnull() & (tags != 0)
 
-        assert number_levels >= 0
-        if number_levels == 0:  # By default at least 1 level
-            number_levels = 1
-        return number_levels
+    # Buildings starts from a specific num level?
+    min_level = np.select(
+        [
+            given["building:min_level"],
+            given["min_level"],
+            given["building:min_height"],
+            given["min_height"],
+        ],
+        [
+            tags["building:min_level"],
+            tags["min_level"],
+            levels_from_height(tags["building:min_height"]),
+            levels_from_height(tags["min_height"]),
+        ],
+        default=0,
+    )
 
-    if "height_tags" not in df_osm.columns:
-        df_osm["height_tags"] = df_osm.apply(lambda x: {}, axis=1)
-    df_osm["building_levels"] = df_osm.height_tags.apply(
-        lambda x: associate_level(x)
+    # Levels based, then height based. Otherwise, default values
+    number_levels = np.select(
+        [
+            given["building:levels"],
+            given["levels"],
+            given["building:height"],
+            given["height"],
+        ],
+        [
+            np.abs(tags["building:levels"] - min_level),
+            np.abs(tags["levels"] - min_level),
+            np.abs(levels_from_height(tags["building:height"]) - min_level),
+            np.abs(levels_from_height(tags["height"]) - min_level),
+        ],
+        default=levels_from_height(default_height),
     )
 
+    assert (number_levels >= 0).all()
+    # By default at least 1 level
+    number_levels[number_levels == 0] = 1
+    df_osm["building_levels"] = number_levels
 
-def classification_sanity_check(building):
+
+def classification_sanity_check(df_osm_built):
     """
         Performs a sanity check in order to achieve coherence between the
     building's classification and the amount of M^2 associated to each land use
@@ -359,21 +390,21 @@ def classification_sanity_check(building):
 
         Parameters
         ----------
-        building : geopandas.GeoSeries
-                one row denoting the building's information
+        df_osm_built : geopandas.GeoDataFrame
+                buildings with their surface associated to each land use
 
         Returns
         ----------
-        string
-                returns the coherent classification
+        numpy.array
+                returns the coherent classification of each building
         """
-    if building.landuses_m2["residential"] > 0:
-        if building.landuses_m2["activity"] > 0:  # Mixed use
-            return "mixed"
-        else:  # Residential use
-            return "residential"
-    else:  # Activity use
-        return "activity"
+    residential = df_osm_built["m2_residential"].values > 0
+    activity = df_osm_built["m2_activity"].values > 0
+    return np.select(
+        [residential & activity, residential],  # Mixed use, residential use
+        ["mixed", "residential"],
+        default="activity",  # Activity use
+    )
 
 
 def compute_landuses_m2(
@@ -427,49 +458,47 @@ def compute_landuses_m2(
     # (area calculated given UTM coordinates projection assumption)
     ##################
 
-    # Associate the complete data frame of containing building parts
-    col_interest = [
-        "geometry",
-        "activity_category",
-        "classification",
-        "key_value",
-        "height_tags",
-        "building_levels",
-    ]
-    df_osm_built["full_parts"] = df_osm_built.containing_parts.apply(
-        lambda x: df_osm_building_parts.loc[x, col_interest]
-        if isinstance(x, list)
-        else df_osm_building_parts.loc[[], col_interest]
+    # Containing building parts and POIs (positional indices)
+    parts_association = get_structure_association(
+        df_osm_built, "containing_parts", df_osm_building_parts
+    )
+    pois_association = get_structure_association(
+        df_osm_built, "containing_poi", df_osm_pois
     )
 
-    # Associate the complete POIs contained in buildings
-    col_interest = [
-        "geometry",
-        "activity_category",
-        "classification",
-        "key_value",
-    ]
-    df_osm_built["pois_full_parts"] = df_osm_built.containing_poi.apply(
-        lambda x: df_osm_pois.loc[x, col_interest]
-        if isinstance(x, list)
-        else df_osm_pois.loc[[], col_interest]
+    # Columns of interest of building parts and POIs
+    df_parts_interest = df_osm_building_parts[
+        ["geometry", "activity_category", "classification", "building_levels"]
+    ].assign(
+        min_level_tagged=get_height_tags_values(df_osm_building_parts)[
+            min_level_tags
+        ]
+        .fillna(0)
+        .ne(0)
+        .any(axis=1)
     )
+    df_pois_interest = df_osm_pois[
+        ["geometry", "activity_category", "classification"]
+    ]
 
     # Calculate m2's for each land use, plus for each activity category
-    df_osm_built["landuses_m2"] = df_osm_built.apply(
-        lambda x: calculate_landuse_m2(
-            x,
-            mixed_building_first_floor_activity=mixed_building_first_floor_activity,
-        ),
-        axis=1,
+    df_landuses_m2 = pd.DataFrame(
+        [
+            calculate_landuse_m2(
+                building,
+                df_parts_interest.iloc[parts_association[i]],
+                df_pois_interest.iloc[pois_association[i]],
+                mixed_building_first_floor_activity=mixed_building_first_floor_activity,
+            )
+            for i, (_, building) in enumerate(df_osm_built.iterrows())
+        ],
+        columns=landuses_m2_keys,
+        index=df_osm_built.index,
+        dtype=float,
     )
-
-    # Drop added full parts
-    df_osm_built.drop(["full_parts"], axis=1, inplace=True)
-    df_osm_built.drop(["pois_full_parts"], axis=1, inplace=True)
+    for landuse in landuses_m2_keys:
+        df_osm_built[landuse_m2_column(landuse)] = df_landuses_m2[landuse]
 
     # Sanity check: For each building land use classification,
     # its M^2 associated to these land uses must be greater than 1
-    df_osm_built["classification"] = df_osm_built.apply(
-        lambda x: classification_sanity_check(x), axis=1
-    )
+    df_osm_built["classification"] = classification_sanity_check(df_osm_built)
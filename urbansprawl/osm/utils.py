@@ -3,25 +3,45 @@
 # MIT License
 ###############
 
-import osmnx as ox
 import pandas as pd
 import geopandas as gpd
 import numpy as np
+import shapely
+import json
+import os
+import math
+from functools import lru_cache
 
 from .tags import height_tags
 
 from ..settings import storage_folder
 
-# Format for load/save the geo-data ['geojson','shp']
-geo_format = "geojson"  # 'shp'
+# Format for load/save the geo-data ['geojson','shp','parquet','feather']
+geo_format = "geojson"  # 'shp', 'parquet', 'feather'
 geo_driver = "GeoJSON"  # 'ESRI Shapefile'
+# Columnar formats: Preserve projection, data types and list columns
+# (GeoParquet, or Feather with WKB geometries). Require pyarrow
+columnar_geo_formats = ["parquet", "feather"]
+# Number of rows per GeoParquet row group (granularity of partial reads)
+columnar_row_group_size = 10000
+# Processing arguments not affecting the stored data (see get_processing_key)
+processing_key_ignored_args = ["retrieve_graph", "tile_size", "n_jobs"]
+# Manifest of the stored processed data (within the storage folder)
+manifest_file = "manifest.json"
+# Checkpoints of the processing stages (within the storage folder)
+checkpoint_folder = "checkpoints"
+# Distance of each building to its nearest building (see
+# compute_closest_building_distance)
+closest_distance_column = "closest_d"
+# Latitude-longitude coordinates reference system
+latlong_crs = {"init": "epsg:4326"}
 
 ###################################################
 # I/O utils
 ###################################################
 
 
-def get_dataframes_filenames(city_ref_file):
+def get_dataframes_filenames(city_ref_file, processing_key=None):
     """
         Get data frame file names for input city
 
@@ -29,6 +49,8 @@ def get_dataframes_filenames(city_ref_file):
         ----------
         city_ref_file : string
                 name of input city
+        processing_key : string
+                key of the processing variant (see get_processing_key)
 
         Returns
         ----------
@@ -40,6 +62,8 @@ def get_dataframes_filenames(city_ref_file):
 
     if not (os.path.isdir(storage_folder)):
         os.makedirs(storage_folder)
+    if processing_key:
+        city_ref_file = city_ref_file + "_" + processing_key
     geo_poly_file = (
         storage_folder + "/" + city_ref_file + "_buildings." + geo_format
     )
@@ -52,97 +76,1586 @@ def get_dataframes_filenames(city_ref_file):
     return geo_poly_file, geo_poly_parts_file, geo_point_file
 
 
-def load_geodataframe(geo_filename):
+def get_processing_key(region_args, kwargs):
+    """
+        Get the key identifying the processed data for input region and
+    processing arguments
+        Arguments set to None, and those in processing_key_ignored_args, are
+        not taken into account
+
+        Parameters
+        ----------
+        region_args : dict
+                region of interest arguments (see get_processed_osm_data)
+        kwargs : dict
+                processing arguments (see get_processed_osm_data)
+
+        Returns
+        ----------
+        string
+                hexadecimal key
+        """
+    import hashlib
+
+    description = json.dumps(
+        get_processing_description(region_args, kwargs),
+        sort_keys=True,
+    )
+    return hashlib.sha1(description.encode("utf-8")).hexdigest()[:12]
+
+
+def get_processing_description(region_args, kwargs):
+    """
+        Get a JSON serializable description of input region and processing
+    arguments
+
+        Parameters
+        ----------
+        region_args : dict
+                region of interest arguments (see get_processed_osm_data)
+        kwargs : dict
+                processing arguments (see get_processed_osm_data)
+
+        Returns
+        ----------
+        dict
+                description of the processing variant
+        """
+
+    def serializable(value):
+        if hasattr(value, "wkt"):  # Shapely geometry
+            return value.wkt
+        if hasattr(value, "isoformat"):  # Date
+            return value.isoformat()
+        if isinstance(value, (tuple, list)):
+            return [serializable(v) for v in value]
+        if isinstance(value, dict):
+            return {str(k): serializable(v) for k, v in value.items()}
+        if isinstance(value, np.generic):
+            return value.item()
+        return value
+
+    return {
+        "region_args": {
+            k: serializable(v)
+            for k, v in (region_args or {}).items()
+            if v is not None
+        },
+        "kwargs": {
+            k: serializable(v)
+            for k, v in (kwargs or {}).items()
+            if (v is not None) and (k not in processing_key_ignored_args)
+        },
+    }
+
+
+def load_manifest():
+    """
+        Load the manifest of the stored processed data
+
+        Returns
+        ----------
+        dict
+                city reference -> processing key -> description of the stored
+        variant
+        """
+    filename = storage_folder + "/" + manifest_file
+    if not os.path.isfile(filename):
+        return {}
+    with open(filename) as f:
+        return json.load(f)
+
+
+def update_manifest(city_ref_file, processing_key, region_args, kwargs):
+    """
+        Register a stored processing variant in the manifest
+
+        Parameters
+        ----------
+        city_ref_file : string
+                name of input city
+        processing_key : string
+                key of the processing variant
+        region_args : dict
+                region of interest arguments (see get_processed_osm_data)
+        kwargs : dict
+                processing arguments (see get_processed_osm_data)
+
+        Returns
+        ----------
+
+        """
+    import time
+
+    manifest = load_manifest()
+    record = get_processing_description(region_args, kwargs)
+    record["files"] = list(
+        get_dataframes_filenames(city_ref_file, processing_key)
+    )
+    record["created"] = time.strftime("%Y-%m-%dT%H:%M:%S")
+    manifest.setdefault(city_ref_file, {})[processing_key] = record
+
+    # Write and rename: A concurrent reader never sees a partial manifest
+    filename = storage_folder + "/" + manifest_file
+    with open(filename + ".tmp", "w") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(filename + ".tmp", filename)
+
+
+def get_checkpoint_filename(city_ref_file, processing_key, stage):
+    """
+        Get the checkpoint filename of a processing stage
+
+        Parameters
+        ----------
+        city_ref_file : string
+                name of input city
+        processing_key : string
+                key of the processing variant (see get_processing_key)
+        stage : string
+                name of the processing stage
+
+        Returns
+        ----------
+        string
+                checkpoint filename
+        """
+    folder = (
+        storage_folder
+        + "/"
+        + checkpoint_folder
+        + "/"
+        + city_ref_file
+        + "_"
+        + processing_key
+    )
+    if not (os.path.isdir(folder)):
+        os.makedirs(folder)
+    return folder + "/" + stage + ".pkl"
+
+
+def get_frame_attributes(df):
+    """
+        Get the attributes set on input data frame (name), which are not
+    preserved by pickling or copies
+
+        Parameters
+        ----------
+        df : pandas.DataFrame
+                input data frame
+
+        Returns
+        ----------
+        dict
+                attribute name -> value
+        """
+    return {
+        name: value
+        for name, value in vars(df).items()
+        if not name.startswith("_")
+    }
+
+
+def set_frame_attributes(df, attributes):
+    """
+        Set attributes on input data frame (see get_frame_attributes)
+
+        Parameters
+        ----------
+        df : pandas.DataFrame
+                input data frame
+        attributes : dict
+                attribute name -> value
+
+        Returns
+        ----------
+
+        """
+    for name, value in attributes.items():
+        setattr(df, name, value)
+
+
+def store_checkpoint(state, checkpoint_filename):
+    """
+        Store a processing state
+        Data frame attributes (name, structure associations) are preserved
+
+        Parameters
+        ----------
+        state : dict
+                processing state
+        checkpoint_filename : string
+                output filename
+
+        Returns
+        ----------
+
+        """
+    import pickle
+
+    attributes = {
+        key: get_frame_attributes(df)
+        for key, df in state.items()
+        if isinstance(df, pd.DataFrame)
+    }
+    # Write and rename: An interrupted write never leaves a partial checkpoint
+    with open(checkpoint_filename + ".tmp", "wb") as f:
+        pickle.dump(
+            {"state": state, "attributes": attributes},
+            f,
+            protocol=pickle.HIGHEST_PROTOCOL,
+        )
+    os.replace(checkpoint_filename + ".tmp", checkpoint_filename)
+
+
+def load_checkpoint(checkpoint_filename):
+    """
+        Load a processing state
+
+        Parameters
+        ----------
+        checkpoint_filename : string
+                input filename
+
+        Returns
+        ----------
+        dict
+                processing state
+        """
+    import pickle
+
+    with open(checkpoint_filename, "rb") as f:
+        checkpoint = pickle.load(f)
+    state = checkpoint["state"]
+    for key, attributes in checkpoint["attributes"].items():
+        set_frame_attributes(state[key], attributes)
+    return state
+
+
+def remove_checkpoints(city_ref_file, processing_key):
+    """
+        Remove the checkpoints of a processing variant
+
+        Parameters
+        ----------
+        city_ref_file : string
+                name of input city
+        processing_key : string
+                key of the processing variant (see get_processing_key)
+
+        Returns
+        ----------
+
+        """
+    import shutil
+
+    shutil.rmtree(
+        os.path.dirname(
+            get_checkpoint_filename(city_ref_file, processing_key, "")
+        ),
+        ignore_errors=True,
+    )
+
+
+def get_associations_filename(geo_filename):
+    """
+        Get the filename storing the structure associations of input
+    GeoDataFrame file
+
+        Parameters
+        ----------
+        geo_filename : string
+                GeoDataFrame filename
+
+        Returns
+        ----------
+        string
+                filename for the structure associations
+        """
+    return os.path.splitext(geo_filename)[0] + "_associations.npz"
+
+
+def is_columnar_geo_file(geo_filename):
+    """
+        Determines whether input filename corresponds to a columnar format
+
+        Parameters
+        ----------
+        geo_filename : string
+                GeoDataFrame filename
+
+        Returns
+        ----------
+        bool
+                True for GeoParquet and Feather files
+        """
+    return os.path.splitext(geo_filename)[1][1:] in columnar_geo_formats
+
+
+def load_geodataframe(geo_filename, bbox=None, polygon=None, crs=None):
     """
         Load input GeoDataFrame
+        Structure associations stored along the GeoDataFrame are attached to
+        the loaded data
+
+        If a bounding box or polygon is given, only the geometries
+        intersecting it are loaded. Structure associations are then not
+        attached: use load_osm_data to load coherent buildings, building parts
+        and Points of Interest
+
+        Parameters
+        ----------
+        geo_filename : string
+                input GeoDataFrame filename
+        bbox : tuple
+                (west, south, east, north) lat-long bounding box to load
+        polygon : shapely Polygon or MultiPolygon
+                lat-long shape to load
+        crs : dict, string or pyproj.CRS
+                projection of the loaded data (by default, the stored
+        projection, or the UTM zone of lat-long stored data)
+
+        Returns
+        ----------
+        geopandas.GeoDataFrame
+                loaded data
+
+        """
+    if (bbox is not None) or (polygon is not None):
+        df_osm_data, _, _ = read_geodataframe_selection(
+            geo_filename, get_region_of_interest(bbox, polygon), crs=crs
+        )
+        for column in structure_association_columns:
+            remove_structure_association(df_osm_data, column)
+        return df_osm_data
+
+    if is_columnar_geo_file(geo_filename):
+        df_osm_data = load_columnar_geodataframe(geo_filename)
+        if crs is None:
+            return df_osm_data
+        return project_geodataframe(df_osm_data, to_crs=crs)
+
+    # Load using geopandas
+    df_osm_data = gpd.read_file(geo_filename)
+    # Set None as NaN
+    df_osm_data.fillna(value=np.nan, inplace=True)
+    # Replace empty string (Json NULL sometimes read as '') for NaN
+    df_osm_data.replace("", np.nan, inplace=True)
+
+    def list_str_from_string(
+        x
+    ):  # List of strings given input in string format
+        return x.split(",")
+
+        # Recover list
+
+    if "activity_category" in df_osm_data.columns:
+        df_osm_data["activity_category"] = df_osm_data.activity_category.apply(
+            lambda x: list_str_from_string(x) if pd.notnull(x) else np.nan
+        )
+
+    # Structure associations
+    associations = {}
+    associations_file = get_associations_filename(geo_filename)
+    if os.path.isfile(associations_file):
+        with np.load(associations_file) as data:
+            for column in structure_association_columns:
+                if column + "_offsets" in data:
+                    associations[column] = StructureAssociation(
+                        data[column + "_offsets"],
+                        data[column + "_indices"],
+                        structure_ids=data[column + "_structure_ids"]
+                        if column + "_structure_ids" in data
+                        else None,
+                    )
+    for column in structure_association_columns:
+        if column in df_osm_data.columns:
+            # Files stored with comma separated indices
+            if column not in associations:
+                associations[column] = StructureAssociation.from_lists(
+                    df_osm_data[column].values
+                )
+            df_osm_data.drop(column, axis=1, inplace=True)
+
+        # To UTM coordinates
+    df_osm_data = project_geodataframe(df_osm_data, to_crs=crs)
+    for column, association in associations.items():
+        set_structure_association(df_osm_data, column, association)
+    return df_osm_data
+
+
+def store_geodataframe(df_osm_data, geo_filename):
+    """
+        Store input GeoDataFrame
+        Attached structure associations are stored in a separate file
+
+        Parameters
+        ----------
+        df_osm_data : geopandas.GeoDataFrame
+                input OSM data frame
+        geo_filename : string
+                filename for GeoDataFrame storage
+
+        Returns
+        ----------
+
+        """
+    if is_columnar_geo_file(geo_filename):
+        store_columnar_geodataframe(df_osm_data, geo_filename)
+        return
+
+    # Structure associations: Stored as index arrays
+    associations = {}
+    for column in structure_association_columns:
+        if column + "_csr" in df_osm_data.attrs:
+            association = get_structure_association(df_osm_data, column)
+            associations[column + "_offsets"] = association.offsets
+            associations[column + "_indices"] = association.indices
+            if association.structure_ids is not None:
+                associations[
+                    column + "_structure_ids"
+                ] = association.structure_ids
+    if associations:
+        np.savez(get_associations_filename(geo_filename), **associations)
+
+    # To EPSG 4326 (GeoJSON does not store projection information)
+    df_osm_data = project_geodataframe(df_osm_data, to_latlong=True)
+
+    # Lists to string (needed to save GeoJSON files)
+    if "activity_category" in df_osm_data.columns:
+        df_osm_data.activity_category = df_osm_data.activity_category.apply(
+            lambda x: ",".join(str(e) for e in x)
+            if isinstance(x, list)
+            else np.nan
+        )
+
+        # Save to file
+    df_osm_data.to_file(geo_filename, driver=geo_driver)
+
+
+def load_columnar_geodataframe(geo_filename):
+    """
+        Load input GeoDataFrame stored in a columnar format (GeoParquet or
+    Feather with WKB geometries)
+
+        Projection, data types and list columns are preserved: no
+        re-projection is performed. Structure associations are attached to
+        the loaded data
+
+        Parameters
+        ----------
+        geo_filename : string
+                input GeoDataFrame filename
+
+        Returns
+        ----------
+        geopandas.GeoDataFrame
+                loaded data
+
+        """
+    table = read_columnar_table(geo_filename)
+    return columnar_table_to_geodataframe(table)
+
+
+def read_columnar_table(geo_filename, **kwargs):
+    """
+        Read input GeoParquet or Feather file as an arrow table
+
+        Parameters
+        ----------
+        geo_filename : string
+                input GeoDataFrame filename
+        kwargs : dict
+                additional arguments for the reader
+
+        Returns
+        ----------
+        pyarrow.Table
+                stored data
+
+        """
+    if geo_filename.endswith(".feather"):
+        import pyarrow.feather as feather
+
+        return feather.read_table(geo_filename, **kwargs)
+    else:
+        import pyarrow.parquet as pq
+
+        return pq.read_table(geo_filename, **kwargs)
+
+
+def columnar_table_to_geodataframe(table):
+    """
+        Convert an arrow table with WKB geometries and GeoParquet metadata to
+    a GeoDataFrame
+
+        Parameters
+        ----------
+        table : pyarrow.Table
+                stored data
+
+        Returns
+        ----------
+        geopandas.GeoDataFrame
+                data with attached structure associations
+
+        """
+    from pyproj import CRS
+
+    geo_metadata = json.loads(table.schema.metadata[b"geo"])
+    geometry_column = geo_metadata["primary_column"]
+    crs = geo_metadata["columns"][geometry_column].get("crs")
+    if "bbox" in table.column_names:
+        table = table.drop(["bbox"])
+
+    # Structure associations: List arrays share the CSR layout
+    associations = {}
+    for column in structure_association_columns:
+        if column in table.column_names:
+            array = table.column(column).combine_chunks()
+            offsets = array.offsets.to_numpy()
+            indices = array.values.to_numpy()[offsets[0] : offsets[-1]]
+            associations[column] = StructureAssociation(
+                offsets - offsets[0], indices
+            )
+            table = table.drop([column])
+
+    df_osm_data = table.to_pandas()
+    geometry = gpd.GeoSeries.from_wkb(
+        df_osm_data.pop(geometry_column).values,
+        index=df_osm_data.index,
+        crs=None if crs is None else CRS.from_json_dict(crs),
+    )
+    df_osm_data = gpd.GeoDataFrame(
+        df_osm_data, geometry=geometry, crs=geometry.crs
+    )
+
+    # List columns are read as arrays
+    if "activity_category" in df_osm_data.columns:
+        df_osm_data["activity_category"] = [
+            list(x) if isinstance(x, np.ndarray) else np.nan
+            for x in df_osm_data.activity_category.values
+        ]
+
+    for column, association in associations.items():
+        set_structure_association(df_osm_data, column, association)
+    return df_osm_data
+
+
+def store_columnar_geodataframe(df_osm_data, geo_filename):
+    """
+        Store input GeoDataFrame in a columnar format: GeoParquet (.parquet)
+    or Feather with WKB geometries (.feather)
+
+        The projection, data types and list columns are preserved. Structure
+        associations are stored as list columns
+        The bounding box of each geometry is stored (GeoParquet covering
+        column), so that row groups statistics allow partial reads
+
+        Parameters
+        ----------
+        df_osm_data : geopandas.GeoDataFrame
+                input OSM data frame
+        geo_filename : string
+                filename for GeoDataFrame storage
+
+        Returns
+        ----------
+
+        """
+    table = geodataframe_to_columnar_table(df_osm_data)
+    if geo_filename.endswith(".feather"):
+        import pyarrow.feather as feather
+
+        feather.write_feather(table, geo_filename)
+    else:
+        import pyarrow.parquet as pq
+
+        # Row groups statistics allow partial reads (see read_geodataframe_selection)
+        pq.write_table(
+            table, geo_filename, row_group_size=columnar_row_group_size
+        )
+
+
+def geodataframe_to_columnar_table(df_osm_data):
+    """
+        Convert input GeoDataFrame to an arrow table with WKB geometries and
+    GeoParquet metadata
+
+        Parameters
+        ----------
+        df_osm_data : geopandas.GeoDataFrame
+                input OSM data frame
+
+        Returns
+        ----------
+        pyarrow.Table
+                data to store
+
+        """
+    import pyarrow as pa
+    from pyproj import CRS
+
+    geometry_column = df_osm_data.geometry.name
+    df_data = pd.DataFrame(df_osm_data.drop(geometry_column, axis=1))
+    df_data[geometry_column] = df_osm_data.geometry.to_wkb().values
+    table = pa.Table.from_pandas(df_data, preserve_index=False)
+
+    # Structure associations as list columns
+    for column in structure_association_columns:
+        if column + "_csr" in df_osm_data.attrs:
+            association = get_structure_association(df_osm_data, column)
+            table = table.append_column(
+                column,
+                pa.LargeListArray.from_arrays(
+                    pa.array(association.offsets, type=pa.int64()),
+                    pa.array(association.indices, type=pa.int64()),
+                ),
+            )
+
+    # Bounding box of each geometry
+    bounds = df_osm_data.geometry.bounds
+    table = table.append_column(
+        "bbox",
+        pa.StructArray.from_arrays(
+            [
+                pa.array(bounds[col].values, type=pa.float64())
+                for col in ["minx", "miny", "maxx", "maxy"]
+            ],
+            names=["xmin", "ymin", "xmax", "ymax"],
+        ),
+    )
+
+    # GeoParquet metadata
+    geo_metadata = {
+        "version": "1.0.0",
+        "primary_column": geometry_column,
+        "columns": {
+            geometry_column: {
+                "encoding": "WKB",
+                "geometry_types": sorted(
+                    df_osm_data.geometry.geom_type.dropna().unique().tolist()
+                ),
+                "crs": None
+                if df_osm_data.crs is None
+                else CRS.from_user_input(df_osm_data.crs).to_json_dict(),
+                "covering": {
+                    "bbox": {
+                        key: ["bbox", key]
+                        for key in ["xmin", "ymin", "xmax", "ymax"]
+                    }
+                },
+            }
+        },
+    }
+    metadata = dict(table.schema.metadata or {})
+    metadata[b"geo"] = json.dumps(geo_metadata).encode("utf-8")
+    return table.replace_schema_metadata(metadata)
+
+
+###################################################
+# Projection utils
+###################################################
+
+
+def get_utm_crs(geometries):
+    """
+        Get the UTM projection of the zone containing the centroid of the
+    union of input lat-long geometries (zone as determined by
+    osmnx.project_gdf)
+
+        Parameters
+        ----------
+        geometries : array-like
+                lat-long shapely geometries
+
+        Returns
+        ----------
+        string
+                UTM projection
+        """
+    longitude = shapely.union_all(np.asarray(geometries)).centroid.x
+    utm_zone = int(math.floor((longitude + 180) / 6.0) + 1)
+    return "+proj=utm +zone={} +ellps=WGS84 +datum=WGS84 +units=m +no_defs".format(
+        utm_zone
+    )
+
+
+def get_crs_key(crs):
+    """
+        Get a hashable and unique description of input coordinates reference
+    system
+
+        Parameters
+        ----------
+        crs : dict, string or pyproj.CRS
+                coordinates reference system
+
+        Returns
+        ----------
+        string
+                WKT description
+        """
+    from pyproj import CRS
+
+    return CRS.from_user_input(crs).to_wkt()
+
+
+@lru_cache(maxsize=32)
+def get_coordinates_transformer(from_crs_key, to_crs_key):
+    """
+        Get a (cached) coordinates transformer
+
+        Parameters
+        ----------
+        from_crs_key : string
+                source coordinates reference system (see get_crs_key)
+        to_crs_key : string
+                target coordinates reference system (see get_crs_key)
+
+        Returns
+        ----------
+        pyproj.Transformer
+                transformer taking and returning (x, y) coordinates
+        """
+    from pyproj import Transformer
+
+    return Transformer.from_crs(from_crs_key, to_crs_key, always_xy=True)
+
+
+def project_coordinates(x, y, from_crs, to_crs):
+    """
+        Project input coordinate arrays
+
+        Parameters
+        ----------
+        x : numpy.array
+                x (longitude) coordinates
+        y : numpy.array
+                y (latitude) coordinates
+        from_crs : dict, string or pyproj.CRS
+                source coordinates reference system
+        to_crs : dict, string or pyproj.CRS
+                target coordinates reference system
+
+        Returns
+        ----------
+        [ numpy.array, numpy.array ]
+                projected x and y coordinates
+        """
+    transformer = get_coordinates_transformer(
+        get_crs_key(from_crs), get_crs_key(to_crs)
+    )
+    return transformer.transform(
+        np.asarray(x, dtype=float), np.asarray(y, dtype=float)
+    )
+
+
+def project_geodataframe(gdf, to_crs=None, to_latlong=False):
+    """
+        Project input GeoDataFrame with a cached coordinates transformer
+        All geometries coordinates are projected in a single vectorized call
+        Equivalent to osmnx.project_gdf: By default, projects to the UTM zone
+        of the data
+
+        Parameters
+        ----------
+        gdf : geopandas.GeoDataFrame
+                input data frame
+        to_crs : dict, string or pyproj.CRS
+                target coordinates reference system
+        to_latlong : bool
+                project to lat-long coordinates
+
+        Returns
+        ----------
+        geopandas.GeoDataFrame
+                projected data frame
+        """
+    if to_latlong:
+        to_crs = latlong_crs
+    elif to_crs is None:
+        if len(gdf) == 0:
+            return gdf
+        if get_crs_key(gdf.crs) != get_crs_key(latlong_crs):
+            gdf = project_geodataframe(gdf, to_latlong=True)
+        to_crs = get_utm_crs(gdf.geometry.values)
+
+    if get_crs_key(gdf.crs) == get_crs_key(to_crs):  # Already projected
+        return gdf
+
+    transformer = get_coordinates_transformer(
+        get_crs_key(gdf.crs), get_crs_key(to_crs)
+    )
+    geometries = shapely.transform(
+        np.asarray(gdf.geometry.values),
+        lambda coords: np.column_stack(
+            transformer.transform(coords[:, 0], coords[:, 1])
+        ),
+    )
+
+    projected_gdf = gdf.copy()
+    projected_gdf[gdf.geometry.name] = gpd.GeoSeries(
+        geometries, index=gdf.index, crs=to_crs
+    )
+    set_frame_attributes(projected_gdf, get_frame_attributes(gdf))
+    return projected_gdf
+
+
+###################################################
+# Simplification utils
+###################################################
+
+
+def count_vertices(geometries):
+    """
+        Count the vertices of each input geometry
+
+        Parameters
+        ----------
+        geometries : array-like
+                shapely geometries
+
+        Returns
+        ----------
+        numpy.array
+                number of vertices of each geometry
+        """
+    return shapely.get_num_coordinates(np.asarray(geometries))
+
+
+def simplify_geodataframe(gdf, tolerance):
+    """
+        Simplify the geometries of input GeoDataFrame, preserving their
+    topology (valid geometries, no collapsed polygons)
+
+        Parameters
+        ----------
+        gdf : geopandas.GeoDataFrame
+                input data frame (projected)
+        tolerance : float
+                maximum distance between original and simplified geometries
+        (units of the projection, i.e. meters)
+
+        Returns
+        ----------
+        [ geopandas.GeoDataFrame, dict ]
+                simplified data frame, and report: number of vertices before
+        and after simplification, and maximum relative area error
+        """
+    simplified = gdf.geometry.simplify(tolerance, preserve_topology=True)
+    area = gdf.geometry.area.values
+    with np.errstate(divide="ignore", invalid="ignore"):
+        area_error = np.abs(simplified.area.values - area) / area
+    report = {
+        "vertices": int(count_vertices(gdf.geometry.values).sum()),
+        "simplified_vertices": int(count_vertices(simplified.values).sum()),
+        "max_area_error": float(np.nanmax(area_error, initial=0.0)),
+    }
+
+    simplified_gdf = gdf.copy()
+    simplified_gdf[gdf.geometry.name] = simplified
+    set_frame_attributes(simplified_gdf, get_frame_attributes(gdf))
+    return simplified_gdf, report
+
+
+###################################################
+# Spatial selection utils
+###################################################
+
+
+def spatial_sort_key(x, y, bits=16):
+    """
+        Z-order (Morton) curve key of input coordinates
+        Close keys denote close locations
+
+        Parameters
+        ----------
+        x : numpy.array
+                x coordinates
+        y : numpy.array
+                y coordinates
+        bits : int
+                resolution of the curve (bits per dimension)
+
+        Returns
+        ----------
+        numpy.array
+                curve key of each coordinate
+        """
+
+    def discretize(values):
+        values = np.asarray(values, dtype=float)
+        extent = values.max() - values.min() if len(values) else 0
+        if extent == 0:
+            return np.zeros(len(values), dtype=np.uint64)
+        scaled = (values - values.min()) / extent * (2 ** bits - 1)
+        return scaled.astype(np.uint64)
+
+    def spread_bits(values):
+        # Insert a zero bit between each bit of input values
+        values = values & np.uint64(0xFFFFFFFF)
+        for shift, mask in [
+            (16, 0x0000FFFF0000FFFF),
+            (8, 0x00FF00FF00FF00FF),
+            (4, 0x0F0F0F0F0F0F0F0F),
+            (2, 0x3333333333333333),
+            (1, 0x5555555555555555),
+        ]:
+            values = (values | (values << np.uint64(shift))) & np.uint64(mask)
+        return values
+
+    return spread_bits(discretize(x)) | (
+        spread_bits(discretize(y)) << np.uint64(1)
+    )
+
+
+def sort_geodataframe_spatially(df_osm):
+    """
+        Sort input data frame rows along a space-filling curve of their
+    centroids, and reset its indices
+
+        Stored rows are then spatially grouped, allowing partial reads of
+        stored files
+
+        Parameters
+        ----------
+        df_osm : geopandas.GeoDataFrame
+                input data frame
+
+        Returns
+        ----------
+        geopandas.GeoDataFrame
+                sorted data frame
+        """
+    centroids = df_osm.geometry.centroid
+    order = np.argsort(
+        spatial_sort_key(centroids.x.values, centroids.y.values),
+        kind="mergesort",
+    )
+    df_sorted = df_osm.iloc[order].reset_index(drop=True)
+    if hasattr(df_osm, "gdf_name"):
+        df_sorted.gdf_name = df_osm.gdf_name
+    return df_sorted
+
+
+def get_region_of_interest(bbox=None, polygon=None):
+    """
+        Get the lat-long shape of input bounding box or polygon
+
+        Parameters
+        ----------
+        bbox : tuple
+                (west, south, east, north) lat-long bounding box
+        polygon : shapely Polygon or MultiPolygon
+                lat-long shape
+
+        Returns
+        ----------
+        geopandas.GeoSeries
+                region of interest
+        """
+    from shapely.geometry import box
+
+    if polygon is None:
+        polygon = box(*bbox)
+    return gpd.GeoSeries([polygon], crs=latlong_crs)
+
+
+def get_selection_rows(df_osm, region, required_rows=None):
+    """
+        Get the rows of input data frame intersecting the region of interest
+
+        Parameters
+        ----------
+        df_osm : geopandas.GeoDataFrame
+                input data frame
+        region : geopandas.GeoSeries
+                region of interest
+        required_rows : numpy.array
+                rows to select regardless of their location
+
+        Returns
+        ----------
+        numpy.array
+                sorted positional indices of the selected rows
+        """
+    region = region.to_crs(df_osm.crs).iloc[0]
+    rows = df_osm.sindex.query(region, predicate="intersects")
+    if required_rows is not None:
+        rows = np.concatenate([rows, required_rows])
+    return np.unique(rows).astype(np.int64)
+
+
+def subset_geodataframe(df_osm, rows):
+    """
+        Select input rows and reset indices
+        Attached structure associations are restricted to the selected rows
+
+        Parameters
+        ----------
+        df_osm : geopandas.GeoDataFrame
+                input data frame
+        rows : numpy.array
+                positional indices of the rows to select
+
+        Returns
+        ----------
+        geopandas.GeoDataFrame
+                selected data
+        """
+    df_subset = df_osm.iloc[rows].reset_index(drop=True)
+    for column in structure_association_columns:
+        if column + "_csr" in df_osm.attrs:
+            set_structure_association(
+                df_subset,
+                column,
+                get_structure_association(df_osm, column).take(rows),
+            )
+    return df_subset
+
+
+def read_geodataframe_selection(
+    geo_filename, region, required_rows=None, crs=None
+):
+    """
+        Load the geometries of input GeoDataFrame file intersecting the
+    region of interest
+
+        For GeoParquet files, only the row groups whose bounding box
+        statistics intersect the region (or containing required rows) are read
 
         Parameters
         ----------
         geo_filename : string
                 input GeoDataFrame filename
+        region : geopandas.GeoSeries
+                region of interest
+        required_rows : numpy.array
+                stored rows to load regardless of their location
+        crs : dict, string or pyproj.CRS
+                projection of the loaded data (see load_geodataframe)
 
         Returns
         ----------
-        geopandas.GeoDataFrame
-                loaded data
-
+        [ geopandas.GeoDataFrame, numpy.array, int ]
+                selected data, their rows in the stored file, and the number
+        of stored rows
         """
-    # Load using geopandas
-    df_osm_data = gpd.read_file(geo_filename)
-    # Set None as NaN
-    df_osm_data.fillna(value=np.nan, inplace=True)
-    # Replace empty string (Json NULL sometimes read as '') for NaN
-    df_osm_data.replace("", np.nan, inplace=True)
+    if not geo_filename.endswith(".parquet"):
+        df_osm_data = load_geodataframe(geo_filename, crs=crs)
+        rows = get_selection_rows(df_osm_data, region, required_rows)
+        return subset_geodataframe(df_osm_data, rows), rows, len(df_osm_data)
 
-    def list_int_from_string(
-        x
-    ):  # List of integers given input in string format
-        return [int(id_) for id_ in x.split(",")]
+    import pyarrow.parquet as pq
+    from pyproj import CRS
 
-    def list_str_from_string(
-        x
-    ):  # List of strings given input in string format
-        return x.split(",")
+    parquet_file = pq.ParquetFile(geo_filename)
+    metadata = parquet_file.metadata
+    geo_metadata = json.loads(parquet_file.schema_arrow.metadata[b"geo"])
+    crs = geo_metadata["columns"][geo_metadata["primary_column"]].get("crs")
+    west, south, east, north = region.to_crs(
+        None if crs is None else CRS.from_json_dict(crs)
+    ).total_bounds
 
-        # Recover list
+    # First stored row of each row group
+    row_group_starts = np.zeros(metadata.num_row_groups + 1, dtype=np.int64)
+    np.cumsum(
+        [
+            metadata.row_group(i).num_rows
+            for i in range(metadata.num_row_groups)
+        ],
+        out=row_group_starts[1:],
+    )
 
-    if "activity_category" in df_osm_data.columns:
-        df_osm_data["activity_category"] = df_osm_data.activity_category.apply(
-            lambda x: list_str_from_string(x) if pd.notnull(x) else np.nan
+    def row_group_bounds(row_group):
+        stats = {}
+        for j in range(row_group.num_columns):
+            column = row_group.column(j)
+            if column.path_in_schema.startswith("bbox.") and (
+                column.statistics is not None
+            ):
+                stats[column.path_in_schema[5:]] = column.statistics
+        if len(stats) < 4:  # No statistics: Row group can not be discarded
+            return -np.inf, -np.inf, np.inf, np.inf
+        return (
+            stats["xmin"].min,
+            stats["ymin"].min,
+            stats["xmax"].max,
+            stats["ymax"].max,
         )
-    if "containing_parts" in df_osm_data.columns:
-        df_osm_data["containing_parts"] = df_osm_data.containing_parts.apply(
-            lambda x: list_int_from_string(x) if pd.notnull(x) else np.nan
+
+    # Row groups intersecting the region, or containing required rows
+    selected = []
+    for i in range(metadata.num_row_groups):
+        xmin, ymin, xmax, ymax = row_group_bounds(metadata.row_group(i))
+        intersects = (
+            (xmax >= west)
+            and (xmin <= east)
+            and (ymax >= south)
+            and (ymin <= north)
         )
-    if "containing_poi" in df_osm_data.columns:
-        df_osm_data["containing_poi"] = df_osm_data.containing_poi.apply(
-            lambda x: list_int_from_string(x) if pd.notnull(x) else np.nan
+        required = (required_rows is not None) and np.any(
+            (required_rows >= row_group_starts[i])
+            & (required_rows < row_group_starts[i + 1])
         )
+        if intersects or required:
+            selected.append(i)
 
-        # To UTM coordinates
-    return ox.project_gdf(df_osm_data)
+    df_osm_data = columnar_table_to_geodataframe(
+        parquet_file.read_row_groups(selected)
+    )
+    if crs is not None:
+        df_osm_data = project_geodataframe(df_osm_data, to_crs=crs)
+    # Stored row of each read row
+    read_rows = np.concatenate(
+        [np.zeros(0, dtype=np.int64)]
+        + [
+            np.arange(row_group_starts[i], row_group_starts[i + 1])
+            for i in selected
+        ]
+    )
+    if required_rows is not None:
+        required_rows = np.flatnonzero(np.isin(read_rows, required_rows))
+    rows = get_selection_rows(df_osm_data, region, required_rows)
+    return (
+        subset_geodataframe(df_osm_data, rows),
+        read_rows[rows],
+        metadata.num_rows,
+    )
 
 
-def store_geodataframe(df_osm_data, geo_filename):
+def select_structure_associations(
+    df_osm_built, column, rows, num_rows, df_osm_structures
+):
     """
-        Store input GeoDataFrame
+        Update the structure association of input buildings after a selection
+    of the structures data frame
 
         Parameters
         ----------
-        df_osm_data : geopandas.GeoDataFrame
-                input OSM data frame
-        geo_filename : string
-                filename for GeoDataFrame storage
+        df_osm_built : geopandas.GeoDataFrame
+                buildings with attached structure association
+        column : string
+                name of the association
+        rows : numpy.array
+                selected structure rows
+        num_rows : int
+                number of structure rows before the selection
+        df_osm_structures : geopandas.GeoDataFrame
+                selected structures
 
         Returns
         ----------
 
         """
-    # To EPSG 4326 (GeoJSON does not store projection information)
-    df_osm_data = ox.project_gdf(df_osm_data, to_latlong=True)
+    mapping = np.full(num_rows, -1, dtype=np.int64)
+    mapping[rows] = np.arange(len(rows))
+    set_structure_association(
+        df_osm_built,
+        column,
+        get_structure_association(df_osm_built, column).remap(mapping),
+        df_osm_structures,
+    )
 
-    # Lists to string (needed to save GeoJSON files)
-    if "activity_category" in df_osm_data.columns:
-        df_osm_data.activity_category = df_osm_data.activity_category.apply(
-            lambda x: ",".join(str(e) for e in x)
-            if isinstance(x, list)
-            else np.nan
+
+def load_osm_data(
+    geo_poly_file, geo_poly_parts_file, geo_point_file, bbox=None, polygon=None
+):
+    """
+        Load buildings, building parts and Points of Interest
+
+        If a bounding box or polygon is given, only the buildings intersecting
+        it are loaded, together with the building parts and Points of Interest
+        intersecting it or associated to a loaded building. Structure
+        associations are updated accordingly
+
+        Parameters
+        ----------
+        geo_poly_file : string
+                buildings filename
+        geo_poly_parts_file : string
+                building parts filename
+        geo_point_file : string
+                Points of Interest filename
+        bbox : tuple
+                (west, south, east, north) lat-long bounding box to load
+        polygon : shapely Polygon or MultiPolygon
+                lat-long shape to load
+
+        Returns
+        ----------
+        [ gpd.GeoDataFrame, gpd.GeoDataFrame, gpd.GeoDataFrame ]
+                buildings, building parts and Points of Interest
+        """
+    # Single projection for all data frames
+    if (bbox is None) and (polygon is None):
+        df_osm_built = load_geodataframe(geo_poly_file)
+        return (
+            df_osm_built,
+            load_geodataframe(geo_poly_parts_file, crs=df_osm_built.crs),
+            load_geodataframe(geo_point_file, crs=df_osm_built.crs),
         )
-    if "containing_parts" in df_osm_data.columns:
-        df_osm_data.containing_parts = df_osm_data.containing_parts.apply(
-            lambda x: ",".join(str(e) for e in x)
-            if isinstance(x, list)
-            else np.nan
+    region = get_region_of_interest(bbox, polygon)
+
+    df_osm_built, _, _ = read_geodataframe_selection(geo_poly_file, region)
+    structures = []
+    for geo_filename, column in [
+        (geo_poly_parts_file, "containing_parts"),
+        (geo_point_file, "containing_poi"),
+    ]:
+        df_osm_structures, rows, num_rows = read_geodataframe_selection(
+            geo_filename,
+            region,
+            np.unique(get_structure_association(df_osm_built, column).indices),
+            crs=df_osm_built.crs,
         )
-    if "containing_poi" in df_osm_data.columns:
-        df_osm_data.containing_poi = df_osm_data.containing_poi.apply(
-            lambda x: ",".join(str(e) for e in x)
-            if isinstance(x, list)
+        select_structure_associations(
+            df_osm_built, column, rows, num_rows, df_osm_structures
+        )
+        structures.append(df_osm_structures)
+    return df_osm_built, structures[0], structures[1]
+
+
+def select_osm_data(
+    df_osm_built, df_osm_building_parts, df_osm_pois, bbox=None, polygon=None
+):
+    """
+        Select buildings, building parts and Points of Interest within input
+    bounding box or polygon (see load_osm_data)
+
+        Parameters
+        ----------
+        df_osm_built : geopandas.GeoDataFrame
+                buildings
+        df_osm_building_parts : geopandas.GeoDataFrame
+                building parts
+        df_osm_pois : geopandas.GeoDataFrame
+                Points of Interest
+        bbox : tuple
+                (west, south, east, north) lat-long bounding box
+        polygon : shapely Polygon or MultiPolygon
+                lat-long shape
+
+        Returns
+        ----------
+        [ gpd.GeoDataFrame, gpd.GeoDataFrame, gpd.GeoDataFrame ]
+                selected buildings, building parts and Points of Interest
+        """
+    if (bbox is None) and (polygon is None):
+        return df_osm_built, df_osm_building_parts, df_osm_pois
+    region = get_region_of_interest(bbox, polygon)
+
+    df_osm_built = subset_geodataframe(
+        df_osm_built, get_selection_rows(df_osm_built, region)
+    )
+    structures = []
+    for df_osm_structures, column in [
+        (df_osm_building_parts, "containing_parts"),
+        (df_osm_pois, "containing_poi"),
+    ]:
+        association = get_structure_association(
+            df_osm_built, column, df_osm_structures
+        )
+        set_structure_association(
+            df_osm_built, column, association, df_osm_structures
+        )
+        rows = get_selection_rows(
+            df_osm_structures, region, np.unique(association.indices)
+        )
+        df_osm_selected = subset_geodataframe(df_osm_structures, rows)
+        select_structure_associations(
+            df_osm_built, column, rows, len(df_osm_structures), df_osm_selected
+        )
+        structures.append(df_osm_selected)
+    return df_osm_built, structures[0], structures[1]
+
+
+###################################################
+# Structure associations
+###################################################
+
+# Columns relating buildings to their containing structures
+structure_association_columns = ["containing_parts", "containing_poi"]
+
+
+class StructureAssociation(object):
+    """
+        Associations between the rows of an encompassing data frame and the
+    (positional) indices of their containing structures
+
+        Associations are encoded in compressed sparse row (CSR) format: the
+        structures of row i are indices[offsets[i]:offsets[i+1]]
+
+        The OSM ids of the encompassing rows and of the structures rows are
+        recorded (if known): the association is realigned when any of both
+        data frames is filtered or reordered (see get_structure_association)
+        """
+
+    def __init__(self, offsets, indices, row_ids=None, structure_ids=None):
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+        self.indices = np.asarray(indices, dtype=np.int64)
+        self.row_ids = None if row_ids is None else np.asarray(row_ids)
+        self.structure_ids = (
+            None if structure_ids is None else np.asarray(structure_ids)
+        )
+
+    def __deepcopy__(self, memo):
+        # Never modified in place: Data frame copies share the association
+        return self
+
+    @classmethod
+    def empty(cls, num_rows):
+        """
+                Association where no row contains any structure
+                """
+        return cls(np.zeros(num_rows + 1), np.array([]))
+
+    @classmethod
+    def from_pairs(cls, num_rows, rows, indices):
+        """
+                Build the association given pairs (row, structure index)
+                """
+        rows = np.asarray(rows, dtype=np.int64)
+        indices = np.asarray(indices, dtype=np.int64)
+        order = np.lexsort((indices, rows))
+        offsets = np.zeros(num_rows + 1, dtype=np.int64)
+        np.cumsum(np.bincount(rows, minlength=num_rows), out=offsets[1:])
+        return cls(offsets, indices[order])
+
+    @classmethod
+    def from_lists(cls, values):
+        """
+                Build the association given one list of indices per row
+                Lists given as comma separated strings are parsed; null values
+                stand for empty lists
+                """
+
+        def as_list(x):
+            if isinstance(x, str):
+                return [int(id_) for id_ in x.split(",")]
+            if isinstance(x, (list, tuple, np.ndarray)):
+                return x
+            if isinstance(x, (int, np.integer)):
+                return [x]
+            return []
+
+        lists = [as_list(x) for x in values]
+        rows = np.repeat(np.arange(len(lists)), [len(x) for x in lists])
+        indices = [id_ for x in lists for id_ in x]
+        return cls.from_pairs(len(lists), rows, indices)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, row):
+        """
+                Indices of the structures associated to input row (array view)
+                """
+        return self.indices[self.offsets[row] : self.offsets[row + 1]]
+
+    def counts(self):
+        """
+                Number of structures associated to each row
+                """
+        return np.diff(self.offsets)
+
+    def rows(self):
+        """
+                Row associated to each entry of the indices array
+                """
+        return np.repeat(np.arange(len(self)), self.counts())
+
+    def take(self, rows):
+        """
+                Association restricted to input rows (positional indices)
+                """
+        rows = np.asarray(rows, dtype=np.int64)
+        counts = self.counts()[rows]
+        offsets = np.zeros(len(rows) + 1, dtype=np.int64)
+        np.cumsum(counts, out=offsets[1:])
+        # Position of each selected entry in the indices array
+        entries = np.repeat(self.offsets[rows] - offsets[:-1], counts)
+        entries += np.arange(offsets[-1])
+        return StructureAssociation(
+            offsets,
+            self.indices[entries],
+            None if self.row_ids is None else self.row_ids[rows],
+            self.structure_ids,
+        )
+
+    def remap(self, mapping, structure_ids=None):
+        """
+                Association with structure indices replaced by mapping[index]
+                Entries mapped to a negative value are removed. The OSM ids of
+                the new structures rows can be given
+                """
+        mapping = np.asarray(mapping, dtype=np.int64)
+        indices = mapping[self.indices]
+        kept = indices >= 0
+        association = StructureAssociation.from_pairs(
+            len(self), self.rows()[kept], indices[kept]
+        )
+        association.row_ids = self.row_ids
+        association.structure_ids = structure_ids
+        return association
+
+    def to_lists(self):
+        """
+                List view of the association: one list of indices per row, or
+                NaN if the row does not contain any structure
+                """
+        return [
+            self[i].tolist() if self.offsets[i + 1] > self.offsets[i]
             else np.nan
+            for i in range(len(self))
+        ]
+
+
+def get_osm_ids(df_osm):
+    """
+        OSM ids of input data frame rows (None if unknown)
+        """
+    if "osm_id" not in df_osm.columns:
+        return None
+    return np.asarray(df_osm["osm_id"].values)
+
+
+def get_osm_id_positions(osm_ids, selected_osm_ids):
+    """
+        Positions in osm_ids of the selected OSM ids (-1 if missing)
+        """
+    osm_ids = pd.Index(osm_ids)
+    if not osm_ids.is_unique:
+        raise ValueError(
+            "Duplicated OSM ids: structure association can not be realigned"
         )
+    return osm_ids.get_indexer(selected_osm_ids)
 
-        # Save to file
-    df_osm_data.to_file(geo_filename, driver=geo_driver)
+
+def set_structure_association(
+    df_osm, column, association, df_osm_structures=None
+):
+    """
+        Attach a structure association to input data frame
+        It is stored in the data frame attributes (df_osm.attrs), preserved
+        by copies, selections and projections, together with the OSM ids of
+        the rows
+
+        Parameters
+        ----------
+        df_osm : geopandas.GeoDataFrame
+                encompassing data frame
+        column : string
+                name of the association
+        association : StructureAssociation
+                association to attach (one entry per row of df_osm)
+        df_osm_structures : geopandas.GeoDataFrame
+                structures data frame the association indices refer to (if
+        given, its OSM ids are recorded)
+
+        Returns
+        ----------
+
+        """
+    assert len(association) == len(df_osm)
+    association = StructureAssociation(
+        association.offsets,
+        association.indices,
+        get_osm_ids(df_osm),
+        association.structure_ids
+        if df_osm_structures is None
+        else get_osm_ids(df_osm_structures),
+    )
+    df_osm.attrs[column + "_csr"] = association
+
+
+def remove_structure_association(df_osm, column):
+    """
+        Remove the structure association attached to input data frame (if any)
+
+        Parameters
+        ----------
+        df_osm : geopandas.GeoDataFrame
+                encompassing data frame
+        column : string
+                name of the association
+
+        Returns
+        ----------
+
+        """
+    df_osm.attrs.pop(column + "_csr", None)
+
+
+def get_structure_association(df_osm, column, df_osm_structures=None):
+    """
+        Get the structure association attached to input data frame
+
+        The association is realigned to the current rows of the data frame
+        (and of the structures data frame, if given) using their OSM ids. If
+        no association is attached, it is built from the list column with the
+        same name (if any)
+
+        Parameters
+        ----------
+        df_osm : geopandas.GeoDataFrame
+                encompassing data frame
+        column : string
+                name of the association
+        df_osm_structures : geopandas.GeoDataFrame
+                structures data frame the returned indices must refer to
+
+        Returns
+        ----------
+        StructureAssociation
+                association of each row to its structures
+        """
+    association = df_osm.attrs.get(column + "_csr")
+    if not isinstance(association, StructureAssociation):
+        if column in df_osm.columns:
+            return StructureAssociation.from_lists(df_osm[column].values)
+        raise ValueError(
+            "No structure association " + column + " attached to the data "
+            "frame: structures must be associated first"
+        )
+
+    # Encompassing rows
+    row_ids = get_osm_ids(df_osm)
+    if (association.row_ids is not None) and (row_ids is not None):
+        if not np.array_equal(association.row_ids, row_ids):
+            rows = get_osm_id_positions(association.row_ids, row_ids)
+            if (rows < 0).any():
+                raise ValueError(
+                    "Structure association " + column + " does not contain "
+                    "every row of the data frame"
+                )
+            association = association.take(rows)
+    elif len(association) != len(df_osm):
+        raise ValueError(
+            "Structure association " + column + " does not match the "
+            "number of rows of the data frame"
+        )
+
+    # Structures rows
+    if df_osm_structures is not None:
+        structure_ids = get_osm_ids(df_osm_structures)
+        if (association.structure_ids is not None) and (
+            structure_ids is not None
+        ):
+            if not np.array_equal(association.structure_ids, structure_ids):
+                association = association.remap(
+                    get_osm_id_positions(
+                        structure_ids, association.structure_ids
+                    ),
+                    structure_ids,
+                )
+        elif (association.indices >= len(df_osm_structures)).any():
+            raise ValueError(
+                "Structure association " + column + " does not match the "
+                "structures data frame"
+            )
+    return association
 
 
 ###################################################
@@ -188,7 +1701,7 @@ def sanity_check_height_tags(df_osm):
                     try:  # Feet and inch values? e.g.: 4'7''
                         split_value = value.split("'")
                         feet, inches = split_value[0], split_value[1]
-                        if inches is "":  # Non existent inches
+                        if inches == "":  # Non existent inches
                             inches = "0"
                         tot_inches = float(feet) * 12 + float(inches)
                         # Return meters equivalent
@@ -202,9 +1715,136 @@ def sanity_check_height_tags(df_osm):
     available_height_tags = [
         col for col in height_tags if col in df_osm.columns
     ]
-    # Apply-map sanity check
-    df_osm[available_height_tags] = df_osm[available_height_tags].applymap(
-        sanity_check
+    # Sanity check. Numeric columns: Non-valid values set as NaN
+    for tag in available_height_tags:
+        df_osm[tag] = pd.to_numeric(
+            df_osm[tag].map(sanity_check), errors="coerce"
+        )
+
+
+def explode_dict_column(df_osm, column, prefix, dtype=None):
+    """
+        Replace a column of dictionaries by one column per dictionary key
+        Columns are named after the key, preceded by input prefix. Missing keys
+        are set as NaN
+
+        Parameters
+        ----------
+        df_osm : geopandas.GeoDataFrame
+                input data frame
+        column : string
+                column containing dictionaries
+        prefix : string
+                prefix of the created columns
+        dtype : string
+                data type of the created columns (e.g. 'category')
+
+        Returns
+        ----------
+
+        """
+    df_keys = pd.DataFrame(
+        [x if isinstance(x, dict) else {} for x in df_osm[column].values],
+        index=df_osm.index,
+    )
+    for key in df_keys.columns:
+        df_osm[prefix + key] = (
+            df_keys[key] if dtype is None else df_keys[key].astype(dtype)
+        )
+    df_osm.drop(column, axis=1, inplace=True)
+
+
+def implode_columns(df_osm, columns, prefix=""):
+    """
+        Gather input columns into one dictionary per row
+        Null values are not included in the dictionaries
+
+        Parameters
+        ----------
+        df_osm : geopandas.GeoDataFrame
+                input data frame
+        columns : list
+                columns to gather
+        prefix : string
+                prefix to remove from the column names to obtain the keys
+
+        Returns
+        ----------
+        pandas.Series
+                one dictionary per row
+        """
+    columns = [col for col in columns if col in df_osm.columns]
+    keys = [col[len(prefix) :] for col in columns]
+    return pd.Series(
+        [
+            {k: v for k, v in zip(keys, values) if pd.notnull(v)}
+            for values in df_osm[columns].values
+        ],
+        index=df_osm.index,
+    )
+
+
+def get_height_tags(df_osm):
+    """
+        Dictionary of available height tags for each row (compatibility with
+    the former `height_tags` column)
+
+        Parameters
+        ----------
+        df_osm : geopandas.GeoDataFrame
+                input data frame
+
+        Returns
+        ----------
+        pandas.Series
+                height tags of each row
+        """
+    return implode_columns(df_osm, height_tags)
+
+
+def get_key_value(df_osm):
+    """
+        Dictionary of key:value tags defining the classification of each row
+    (compatibility with the former `key_value` column)
+
+        Parameters
+        ----------
+        df_osm : geopandas.GeoDataFrame
+                input data frame
+
+        Returns
+        ----------
+        pandas.Series
+                key:value tags of each row
+        """
+    if "key_value" in df_osm.columns:
+        return df_osm["key_value"]
+    return implode_columns(
+        df_osm,
+        [col for col in df_osm.columns if col.startswith("key_value_")],
+        prefix="key_value_",
+    )
+
+
+def get_landuses_m2(df_osm_built):
+    """
+        Dictionary of surface associated to each land use for each building
+    (compatibility with the former `landuses_m2` column)
+
+        Parameters
+        ----------
+        df_osm_built : geopandas.GeoDataFrame
+                input buildings
+
+        Returns
+        ----------
+        pandas.Series
+                land uses surface of each building
+        """
+    return implode_columns(
+        df_osm_built,
+        [col for col in df_osm_built.columns if col.startswith("m2_")],
+        prefix="m2_",
     )
 
 
@@ -217,7 +1857,7 @@ def associate_structures(
     """
         Associate input structure geometries to its encompassing structures
         Structures are associated using the operation 'contains' or 'intersects'
-        A new column in the encompassing data frame is added, incorporating the indices of the containing structures
+        A StructureAssociation is attached to the encompassing data frame, incorporating the positional indices of the containing structures
 
         Parameters
         ----------
@@ -228,27 +1868,77 @@ def associate_structures(
         operation : string
                 spatial join operation to associate structures
         column : string
-                name of the column to add in encompassing data frame
+                name of the association to attach to the encompassing data frame
 
         Returns
         ----------
 
         """
-    # Find, for each geometry, all containing structures
+    # Find, for each geometry, all containing structures. Joined on
+    # positional indices: Named indices would rename the joined index column
     sjoin = gpd.sjoin(
-        df_osm_encompassing_structures[["geometry"]],
-        df_osm_structures[["geometry"]],
-        op=operation,
+        df_osm_encompassing_structures[["geometry"]].reset_index(drop=True),
+        df_osm_structures[["geometry"]].reset_index(drop=True),
+        predicate=operation,
         rsuffix="cont",
     )
-    # Group by: polygon_index -> list of containing points indices
-    group_indices = sjoin.groupby(sjoin.index, as_index=True)[
-        "index_cont"
-    ].apply(list)
-    # Create new column
-    df_osm_encompassing_structures.loc[
-        group_indices.index, column
-    ] = group_indices.values
+    # Pairs (encompassing row, structure row) in positional indices
+    rows = sjoin.index.values
+    indices = sjoin["index_cont"].values
+    # Attach the association
+    set_structure_association(
+        df_osm_encompassing_structures,
+        column,
+        StructureAssociation.from_pairs(
+            len(df_osm_encompassing_structures), rows, indices
+        ),
+        df_osm_structures,
+    )
     # Reset indices
     df_osm_encompassing_structures.index.rename("", inplace=True)
     df_osm_structures.index.rename("", inplace=True)
+
+
+def compute_closest_building_distance(df_osm_built):
+    """
+        Computes for each building, the distance to the nearest neighboring
+    building
+
+        Exact nearest geometries are queried in bulk with a STRtree of the
+        polygons, excluding each polygon itself (but not its duplicates,
+        at null distance). Buildings without any other building get a NaN
+        distance
+
+        A column `closest_d` is added in the data frame: Computed once with
+        the processed data, and reused by the dispersion indices
+
+        Parameters
+        ----------
+        df_osm_built: geopandas.GeoDataFrame
+                data frame containing the building's geometries
+
+        Returns
+        ----------
+
+        """
+    geometries = df_osm_built.geometry.values
+    tree = shapely.STRtree(geometries)
+    closest_d = np.full(len(geometries), np.nan)
+    # Polygons at null distance (the polygon itself, duplicates, touching
+    # polygons): (input, tree) indices
+    input_indices, tree_indices = tree.query_nearest(
+        geometries, exclusive=False, all_matches=True
+    )
+    touching = input_indices[input_indices != tree_indices]
+    closest_d[touching] = 0.0
+    # Other polygons: Nearest polygon, excluding the polygon itself (its
+    # only equal geometry)
+    others = np.flatnonzero(np.isnan(closest_d))
+    (input_indices, _), distances = tree.query_nearest(
+        geometries[others],
+        return_distance=True,
+        exclusive=True,
+        all_matches=False,
+    )
+    closest_d[others[input_indices]] = distances
+    df_osm_built[closest_distance_column] = closest_d
@@ -43,7 +43,7 @@ def get_df_extract(df_data, poly_gdf, operation="within"):
     # Project to same system coordinates
     poly_gdf = ox.project_gdf(poly_gdf, to_crs=df_data.crs)
     # Spatial join
-    df_extract = gpd.sjoin(df_data, poly_gdf, op=operation)
+    df_extract = gpd.sjoin(df_data, poly_gdf, predicate=operation)
     # Keep original columns
     df_extract = df_extract[df_data.columns]
     return df_extract
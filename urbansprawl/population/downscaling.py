@@ -6,10 +6,6 @@
 import geopandas as gpd
 import osmnx as ox
 
-from keras import callbacks, optimizers
-from keras.models import Sequential
-from keras.layers import Activation, Flatten, Conv1D
-
 
 def proportional_population_downscaling(df_osm_built, df_insee):
     """
@@ -35,20 +31,16 @@ def proportional_population_downscaling(df_osm_built, df_insee):
         assert df_insee.crs == df_osm_built.crs
 
     df_osm_built["geom"] = df_osm_built.geometry
-    df_osm_built_residential = df_osm_built[
-        df_osm_built.apply(lambda x: x.landuses_m2["residential"] > 0, axis=1)
-    ]
+    df_osm_built_residential = df_osm_built[df_osm_built.m2_residential > 0]
 
     # Loading/saving using geopandas loses the 'ellps' key
     df_insee.crs = df_osm_built_residential.crs
 
     # Intersecting gridded population - buildings
-    sjoin = gpd.sjoin(df_insee, df_osm_built_residential, op="intersects")
+    sjoin = gpd.sjoin(df_insee, df_osm_built_residential, predicate="intersects")
     # Calculate area within square (percentage of building with the square)
-    sjoin["residential_m2_within"] = sjoin.apply(
-        lambda x: x.landuses_m2["residential"]
-        * (x.geom.intersection(x.geometry).area / x.geom.area),
-        axis=1,
+    sjoin["residential_m2_within"] = sjoin.m2_residential * sjoin.apply(
+        lambda x: x.geom.intersection(x.geometry).area / x.geom.area, axis=1
     )
     # Initialize
     df_insee["residential_m2_within"] = 0
@@ -88,6 +80,10 @@ def proportional_population_downscaling(df_osm_built, df_insee):
 def build_downscaling_cnn(input_shape):
     """
         """
+    # Optional dependency: pip install urbansprawl[population]
+    from keras.models import Sequential
+    from keras.layers import Activation, Flatten, Conv1D
+
     _, input_shape_pixels, input_shape_features = input_shape
     model = Sequential()
     model.add(
@@ -132,6 +128,8 @@ def train_population_downscaling_model(
         keras.models.Sequential
 
         """
+    from keras import callbacks, optimizers
+
     model = build_downscaling_cnn(X_train.shape)
     opt = optimizers.SGD(lr=0.01, decay=1e-6, momentum=0.9, nesterov=True)
     model.compile(loss="mean_absolute_error", optimizer=opt, metrics=["mae"])
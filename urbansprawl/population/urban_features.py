@@ -46,7 +46,6 @@ def compute_full_urban_features(
     dispersion_args={
         "radius_search": 750,
         "use_median": True,
-        "K_nearest": 50,
     },
     kwargs={"max_dispersion": 15},
 ):
@@ -122,7 +121,7 @@ def compute_full_urban_features(
 
     # Spatial join: grid-cell i - building j for all intersections
     pop_features = gpd.sjoin(
-        pop_features, df_osm_built, op="intersects", how="left"
+        pop_features, df_osm_built, predicate="intersects", how="left"
     )
 
     # When a grid-cell i does not intersect any building: NaN values
@@ -142,9 +141,8 @@ def compute_full_urban_features(
     ] = pop_features.loc[null_idx, "geom_building"].apply(
         lambda x: min_polygon
     )
-    pop_features.loc[null_idx, "landuses_m2"] = len(null_idx) * [
-        {"residential": 0, "activity": 0}
-    ]
+    pop_features.loc[null_idx, "m2_residential"] = 0
+    pop_features.loc[null_idx, "m2_activity"] = 0
     pop_features.loc[null_idx, "building_levels"] = len(
         null_idx
     ) * [0]
@@ -159,15 +157,11 @@ def compute_full_urban_features(
         axis=1,
     )
 
-    pop_features[
-        "m2_total_residential"
-    ] = pop_features.apply(
-        lambda x: x.building_ratio * x.landuses_m2["residential"], axis=1
+    pop_features["m2_total_residential"] = (
+        pop_features.building_ratio * pop_features.m2_residential
     )
-    pop_features[
-        "m2_total_activity"
-    ] = pop_features.apply(
-        lambda x: x.building_ratio * x.landuses_m2["activity"], axis=1
+    pop_features["m2_total_activity"] = (
+        pop_features.building_ratio * pop_features.m2_activity
     )
 
     pop_features["m2_footprint_residential"] = 0
@@ -280,7 +274,7 @@ def compute_full_urban_features(
     gpd_intersection_pois = gpd.sjoin(
         pop_features,
         df_osm_pois_selection,
-        op="intersects",
+        predicate="intersects",
         how="left",
     )
     # Number of activity/mixed POIs
@@ -286,13 +286,11 @@ def population_downscaling_validation(df_osm_built, df_insee):
 
         """
     df_osm_built["geom"] = df_osm_built.geometry
-    df_osm_built_residential = df_osm_built[
-        df_osm_built.apply(lambda x: x.landuses_m2["residential"] > 0, axis=1)
-    ]
+    df_osm_built_residential = df_osm_built[df_osm_built.m2_residential > 0]
     df_insee.crs = df_osm_built_residential.crs
 
     # Intersecting gridded population - buildings
-    sjoin = gpd.sjoin(df_insee, df_osm_built_residential, op="intersects")
+    sjoin = gpd.sjoin(df_insee, df_osm_built_residential, predicate="intersects")
     # Calculate area within square (percentage of building with the square)
     sjoin["pop_estimation"] = sjoin.apply(
         lambda x: x.population
@@ -5,17 +5,25 @@
 
 from scipy import spatial
 import numpy as np
-import pandas as pd
-import networkx as nx
+import math
 import time
-import os
-import subprocess
-import shutil
 
-from multiprocessing import cpu_count
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import cpu_count, get_context
 
 from osmnx import log
-from .utils import divide_long_edges_graph
+from .utils import divide_long_edges_graph, get_kde_chunk_megabytes
+from .accessibility_parallel import (
+    share_graph_arrays,
+    release_graph_arrays,
+    attach_graph_arrays,
+    set_graph_arrays,
+    clear_graph_arrays,
+    compute_accessibility_chunk,
+)
+
+# Number of tasks per process: Dynamic distribution of the points
+accessibility_tasks_per_process = 8
 
 ##############################################################
 # Compute accessibility grid
@@ -78,6 +86,8 @@ def compute_grid_accessibility(
         fixed_activities_max_travel_distance : int
                 (fixed activities) maximum distance tolerated (cut&branch) when
         searching for the activities
+        n_jobs : int
+                number of processes (None: all the cores)
 
         Returns
         ----------
@@ -91,99 +101,77 @@ def compute_grid_accessibility(
     # Assert that only one option is set
     assert kw_args["fixed_distance"] ^ kw_args["fixed_activities"]
 
-    # Arguments to pandas.Series
-    kw_arguments = pd.Series(kw_args)
-
     ##############
-    # Prepare input data for indices calculation in parallel call
+    # Prepare input data: Graph as shared CSR arrays
     ##############
-    # Temporary folder to pickle data
-    if not os.path.exists("temp"):
-        os.makedirs("temp")
-    # Number of CPU cores on your system
-    num_cores = cpu_count()
-    # Prepare input data: As many chunks of data as cores
-    prepare_data(
-        G, df_osm_built, df_osm_pois, df_indices, num_cores, kw_arguments
-    )
-
-    # This command could have multiple commands separated by a new line \n
-    parallel_code = os.path.realpath(__file__).replace(".py", "_parallel.py")
-    command_call = (
-        "python "
-        + parallel_code
-        + " temp/graph.gpickle temp/points_NUM_CHUNK.pkl temp/arguments.pkl"
+    graph_arrays = get_graph_arrays(G, df_osm_built, df_osm_pois, kw_args)
+
+    # Find closest node to each point: Distance to closest node too high?
+    # Points sharing their closest node share its indices
+    nodes, valid = get_nearest_nodes(
+        graph_arrays["coordinates"],
+        np.column_stack(
+            [df_indices.geometry.x.values, df_indices.geometry.y.values]
+        ),
+        kw_args["max_node_distance"],
     )
+    sources, sources_inverse = np.unique(nodes[valid], return_inverse=True)
 
-    ##############
-    # Verify amount of memory used per subprocess
-    ##############
-    p = subprocess.Popen(
-        command_call.replace("NUM_CHUNK", str(0)) + " memory_test",
-        stdout=subprocess.PIPE,
-        shell=True,
+    n_jobs = kw_args.get("n_jobs") or cpu_count()
+    chunks = get_accessibility_chunks(
+        len(sources), len(graph_arrays["num_activities"]), n_jobs
     )
-    output, err = p.communicate()
-    p.wait()
-
-    # Max number of subprocess allocations given its memory consumption
-    numbers = [
-        numb
-        for numb in str(output)
-        if numb in ["0", "1", "2", "3", "4", "5", "6", "7", "8", "9"]
-    ]
-    max_processes = int("".join(numbers))
     log(
-        "Maximum number of processes to allocate (considering memory availability): "
-        + str(max_processes)
+        "Computing accessibility of "
+        + str(len(sources))
+        + " source nodes in "
+        + str(len(chunks))
+        + " chunks using "
+        + str(min(n_jobs, len(chunks)))
+        + " processes"
     )
-    log("Number of available cores: " + str(num_cores))
 
     ##############
-    # Set chunks to run in parallel: If more core than allowed processes, divide chunks to run at most X processes
+    # Parallel implementation: Chunks are distributed as processes get free
     ##############
-    if (
-        num_cores > max_processes
-    ):  # Run parallel-chunks at a splitted pace, to avoid memory swap
-        chunks_run = np.array_split(list(range(num_cores)), max_processes)
-    else:  # Run all chunks in parallel
-        chunks_run = [list(range(num_cores))]
-
-        # Parallel implementation
-    for chunk in chunks_run:  # Run full chunk
-        Ps_i = []
-        for i in chunk:  # Run each index
-            p = subprocess.Popen(
-                command_call.replace("NUM_CHUNK", str(i)),
-                stdout=subprocess.PIPE,
-                shell=True,
-            )
-            Ps_i.append(p)
-
-            # Get the output
-        Output_errs = [p.communicate() for p in Ps_i]
-
-        # This makes the wait possible
-        Ps_status = [p.wait() for p in Ps_i]
-
-        # Output for chunk
-        for output, err in Output_errs:
-            log(str(output))
-
-            # Associate data by getting the chunk results concatenated
+    if (n_jobs == 1) or (len(chunks) <= 1):
+        # Graph arrays of the current process: Released once computed
+        set_graph_arrays(graph_arrays)
+        try:
+            sources_indices = [
+                compute_accessibility_chunk(sources[chunk], kw_args)
+                for chunk in chunks
+            ]
+        finally:
+            clear_graph_arrays()
+    else:
+        blocks, descriptions = share_graph_arrays(graph_arrays)
+        try:
+            # Spawned workers: Forking a process whose compiled kernels
+            # (Numba) already started threads may deadlock
+            with ProcessPoolExecutor(
+                min(n_jobs, len(chunks)),
+                mp_context=get_context("spawn"),
+                initializer=attach_graph_arrays,
+                initargs=(descriptions,),
+            ) as executor:
+                sources_indices = list(
+                    executor.map(
+                        compute_accessibility_chunk,
+                        [sources[chunk] for chunk in chunks],
+                        [kw_args] * len(chunks),
+                    )
+                )
+        finally:
+            release_graph_arrays(blocks)
+
+    # If no graph node exists nearby input point, NaN is set
     index_column = "accessibility"
-    df_indices[index_column] = pd.concat(
-        [
-            pd.read_pickle(
-                "temp/indices_NUM_CHUNK.pkl".replace("NUM_CHUNK", str(i))
-            )
-            for i in range(num_cores)
-        ],
-        ignore_index=True,
-    ).accessibility
-
-    # Delete temporary folder
-    shutil.rmtree("temp")
+    indices = np.full(len(df_indices), np.nan)
+    indices[valid] = np.concatenate(sources_indices or [np.empty(0)])[
+        sources_inverse
+    ]
+    df_indices[index_column] = indices
 
     log(
         "Done: Accessibility indices. Elapsed time (H:M:S): "
@@ -196,12 +184,72 @@ def compute_grid_accessibility(
 ###############
 
 
-def prepare_data(
-    G, df_osm_built, df_osm_pois, df_indices, num_processes, kw_arguments
-):
+def get_nearest_nodes(coordinates, points, max_node_distance):
+    """
+        Return the nearest graph node to each point (UTM coordinates), in a
+        single KDTree query
+
+        Parameters
+        ----------
+        coordinates : np.array
+                (x, y) coordinates of the graph nodes
+        points : np.array
+                (x, y) coordinates of the points
+        max_node_distance : float
+                maximum distance tolerated from a point to its nearest node
+
+        Returns
+        ----------
+        [ np.array, np.array ]
+                position of the nearest node of each point, and whether it
+        lies within the maximum distance
+        """
+    if len(coordinates) == 0:
+        return (
+            np.zeros(len(points), dtype=np.int64),
+            np.zeros(len(points), dtype=bool),
+        )
+    distances, nodes = spatial.cKDTree(coordinates).query(points, workers=-1)
+    return nodes, distances <= max_node_distance
+
+
+def get_accessibility_chunks(num_points, num_nodes, n_jobs):
+    """
+        Split the source nodes in chunks: Several chunks per process (dynamic
+        distribution), within the memory budget of the shortest path lengths
+        of each chunk (sources, nodes)
+
+        Parameters
+        ----------
+        num_points : int
+                number of source nodes
+        num_nodes : int
+                number of graph nodes
+        n_jobs : int
+                number of processes
+
+        Returns
+        ----------
+        list
+                slices of the points of each chunk
+        """
+    max_points = max(
+        1, int(get_kde_chunk_megabytes(None, n_jobs) / (num_nodes * 8e-6))
+    )
+    num_chunks = max(
+        n_jobs * accessibility_tasks_per_process,
+        int(math.ceil(num_points / max_points)),
+    )
+    num_chunks = max(1, min(num_chunks, num_points))
+    bounds = np.linspace(0, num_points, num_chunks + 1).astype(int)
+    return [slice(start, end) for start, end in zip(bounds[:-1], bounds[1:])]
+
+
+def get_graph_arrays(G, df_osm_built, df_osm_pois, kw_args):
     """
-        Pickles data to a temporary folder in order to achieve parallel accessibility calculation
-        A new subprocess will be created in order to minimize memory requirements
+        Get the arrays representing the graph for the accessibility
+    calculation: Nodes coordinates, number of activities associated to each
+    node, and edges lengths in CSR layout (parallel edges: shortest length)
 
         Parameters
         ----------
@@ -211,21 +259,42 @@ def prepare_data(
                 buildings data
         df_osm_pois : geopandas.GeoDataFrame
                 buildings data
-        df_indices : geopandas.GeoDataFrame
-                data frame where indices will be calculated
-        num_processes : int
-                number of data chunks to create
-        kw_arguments : pandas.Series
+        kw_args : dict
                 additional keyword arguments
 
         Returns
         ----------
-
+        dict
+                array name -> np.array
         """
     # Divide long edges
-    divide_long_edges_graph(G, kw_arguments.max_edge_length)
+    divide_long_edges_graph(G, kw_args["max_edge_length"])
     log("Graph long edges shortened")
 
+    # Nodes positions
+    nodes = list(G.nodes)
+    positions = {node: i for i, node in enumerate(nodes)}
+    coordinates = np.array(
+        [[data["x"], data["y"]] for _, data in G.nodes(data=True)],
+        dtype=np.float64,
+    ).reshape(-1, 2)
+
+    # Edges: Shortest of parallel edges, sorted by source node
+    u, v, lengths = [], [], []
+    for u_, v_, length in G.edges.data("length"):
+        u.append(positions[u_])
+        v.append(positions[v_])
+        lengths.append(length)
+    u, v = np.array(u, dtype=np.int64), np.array(v, dtype=np.int64)
+    lengths = np.array(lengths, dtype=np.float64)
+    order = np.lexsort((lengths, v, u))
+    u, v, lengths = u[order], v[order], lengths[order]
+    first = np.ones(len(u), dtype=bool)
+    first[1:] = (u[1:] != u[:-1]) | (v[1:] != v[:-1])
+    u, v, lengths = u[first], v[first], lengths[first]
+    indptr = np.zeros(len(nodes) + 1, dtype=np.int64)
+    indptr[1:] = np.cumsum(np.bincount(u, minlength=len(nodes)))
+
     # Get activities
     df_built_activ = df_osm_built[
         df_osm_built.classification.isin(["activity", "mixed"])
@@ -235,46 +304,30 @@ def prepare_data(
     ]
 
     # Associate them to its closest node in the graph
-    associate_activities_closest_node(G, df_built_activ, df_pois_activ)
+    num_activities = associate_activities_closest_node(
+        coordinates, df_built_activ, df_pois_activ
+    )
     log("Activities associated to graph nodes")
 
-    # Nodes dict
-    for n, data in G.nodes.data(data=True):
-        # Remove useless keys
-        keys_ = list(data.keys())
-        [data.pop(k) for k in keys_ if k not in ["x", "y", "num_activities"]]
-
-        # Edges dict
-    for u, v, data in G.edges.data(data=True, keys=False):
-        # Remove useless keys
-        keys_ = list(data.keys())
-        [data.pop(k) for k in keys_ if k not in ["length", "key"]]
-
-    try:
-        G.graph.pop("streets_per_node")
-    except Exception:
-        pass
-        # Pickle graph
-    nx.write_gpickle(G, "temp/graph.gpickle")
-
-    # Prepare input indices points
-    data_split = np.array_split(df_indices, num_processes)
-    for i in range(num_processes):
-        data_split[i].to_pickle("temp/points_" + str(i) + ".pkl")
-        # Pickle arguments
-    kw_arguments.to_pickle("temp/arguments.pkl")
+    return {
+        "coordinates": coordinates,
+        "num_activities": num_activities,
+        "indptr": indptr,
+        "indices": v,
+        "lengths": lengths,
+    }
 
 
 def associate_activities_closest_node(
-    G, df_activities_built, df_activities_pois
+    coordinates, df_activities_built, df_activities_pois
 ):
     """
         Associates the number of existing activities to their closest nodes in the graph
 
         Parameters
         ----------
-        G : networkx multidigraph
-                input graph to calculate accessibility
+        coordinates : np.array
+                (x, y) coordinates of the graph nodes
         df_activities_built : pandas.DataFrame
                 data selection of buildings with activity uses
         df_activities_pois : pandas.DataFrame
@@ -282,31 +335,20 @@ def associate_activities_closest_node(
 
         Returns
         ----------
-
+        np.array
+                number of activities associated to each node
         """
-    # Initialize number of activity references
-    for u, data in G.nodes(data=True):
-        data["num_activities"] = 0
-
-        # Initialize KDTree of graph nodes
-    coords = np.array(
-        [[node, data["x"], data["y"]] for node, data in G.nodes(data=True)]
-    )
-    df_nodes = pd.DataFrame(coords, columns=["node", "x", "y"])
-    # zip coordinates
-    data = list(zip(df_nodes["x"].ravel(), df_nodes["y"].ravel()))
-    # Create input tree
-    tree = spatial.KDTree(data)
-
-    def associate_to_node(tree, point, G):
-        distance, idx_node = tree.query((point.x, point.y))
-        G.node[df_nodes.loc[idx_node, "node"]]["num_activities"] += 1
-
-        # Associate each activity to its closest node
-
-    df_activities_built.apply(
-        lambda x: associate_to_node(tree, x.geometry.centroid, G), axis=1
-    )
-    df_activities_pois.apply(
-        lambda x: associate_to_node(tree, x.geometry.centroid, G), axis=1
-    )
+    # Initialize KDTree of graph nodes
+    tree = spatial.cKDTree(coordinates)
+
+    # Associate each activity to its closest node
+    num_activities = np.zeros(len(coordinates), dtype=np.int64)
+    for df_activities in [df_activities_built, df_activities_pois]:
+        if len(df_activities) == 0:
+            continue
+        centroids = df_activities.geometry.centroid
+        _, idx_nodes = tree.query(
+            np.column_stack([centroids.x.values, centroids.y.values])
+        )
+        num_activities += np.bincount(idx_nodes, minlength=len(coordinates))
+    return num_activities
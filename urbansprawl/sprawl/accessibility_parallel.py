@@ -3,268 +3,237 @@
 # MIT License
 ###############
 
-import sys
 import numpy as np
-import pandas as pd
-import networkx as nx
-from bisect import bisect
-import time
+from multiprocessing import shared_memory
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import dijkstra
 
+# Graph arrays of the current process (see attach_graph_arrays)
+graph_arrays = {}
+# Shared memory blocks attached by the current process
+attached_blocks = []
 
-def get_nearest_node_utm(G, point, return_dist=False):
+##############################################
+# Shared graph arrays
+##############################################
+
+
+def share_graph_arrays(arrays):
     """
-        Return the nearest graph node to some specified point in UTM coordinates
+        Copy input graph arrays to shared memory blocks
+        Blocks are created with unique names: Concurrent runs do not interfere
 
         Parameters
         ----------
-        G : networkx multidigraph
-                input graph
-        point : tuple
-                the (x, y) point for which we will find the nearest node in the graph
-        return_dist : bool
-                optionally also return the distance between the point and the nearest node
+        arrays : dict
+                array name -> np.array
 
         Returns
-        -------
-        int or tuple
-                corresponding node or tuple (int node, float distance)
+        ----------
+        [ list, dict ]
+                shared memory blocks (to be released by the caller), and
+        array name -> (block name, shape, dtype) descriptions
         """
-    # dump graph node coordinates into a pandas dataframe indexed by node id with x and y columns
-    coords = np.array(
-        [[node, data["x"], data["y"]] for node, data in G.nodes(data=True)]
-    )
-    df = pd.DataFrame(coords, columns=["node", "x", "y"]).set_index("node")
-    # Point coordinates
-    p_x, p_y = point
-    # print(df.loc[124550])
-    distances = df.apply(
-        lambda x: np.sqrt((x.x - p_x) ** 2 + (x.y - p_y) ** 2), axis=1
-    )
-
-    # nearest node's ID is the index label of the minimum distance
-    nearest_node = distances.idxmin()
+    blocks, descriptions = [], {}
+    for name, array in arrays.items():
+        array = np.ascontiguousarray(array)
+        block = shared_memory.SharedMemory(
+            create=True, size=max(1, array.nbytes)
+        )
+        np.ndarray(array.shape, array.dtype, buffer=block.buf)[...] = array
+        blocks.append(block)
+        descriptions[name] = (block.name, array.shape, array.dtype.str)
+    return blocks, descriptions
+
+
+def release_graph_arrays(blocks):
+    """
+        Release the shared memory blocks created by share_graph_arrays
 
-    # if caller requested return_dist, return distance between the point and the nearest node as well
-    if return_dist:
-        return int(nearest_node), distances.loc[nearest_node]
-    else:
-        return int(nearest_node)
+        Parameters
+        ----------
+        blocks : list
+                shared memory blocks
 
+        Returns
+        ----------
 
-##############################################
-# Accessibility indices calculation
-##############################################
+        """
+    for block in blocks:
+        block.close()
+        block.unlink()
 
 
-def get_count_activities_fixed_distance(G, point_ref, arguments):
+def attach_graph_arrays(descriptions):
     """
-        Calculate accessibility value at point_ref according to chosen metric
-        If no graph node exists nearby input point reference, NaN is set
-        Based on counting the number of (activity) opportunities given a fixed maximum distance to travel
+        Attach the shared graph arrays to the current (worker) process
+        Arrays are not copied
 
         Parameters
         ----------
-        G : networkx multidigraph
-                input graph to calculate accessibility
-        point_ref: shapely.Point
-                reference point to calculate accesisibility
+        descriptions : dict
+                array name -> (block name, shape, dtype) descriptions
 
         Returns
         ----------
-        int
-                returns the number of reached activities
+
         """
-    # Find closest node to point_ref
-    N0, distance = get_nearest_node_utm(
-        G, point_ref.coords[0], return_dist=True
-    )
-    # Distance to closest node too high?
-    if distance > arguments.max_node_distance:
-        return np.nan
-
-    # Initialize data structures
-    visited_nodes = set()
-    neighboring_nodes_id = []
-    neighboring_nodes_cost = []
-    num_activities_travelled = 0
-    N_visit = N0
-
-    # Pre-compute the shortest path length from source node N0 to other nodes; using lengths of roads as weight
-    shortest_path_length_N0_ = nx.single_source_dijkstra_path_length(
-        G,
-        source=N0,
-        cutoff=arguments.fixed_distance_max_travel_distance,
-        weight="length",
-    )
+    for name, (block_name, shape, dtype) in descriptions.items():
+        block = shared_memory.SharedMemory(name=block_name)
+        attached_blocks.append(block)
+        graph_arrays[name] = np.ndarray(shape, dtype, buffer=block.buf)
+    set_graph_arrays(graph_arrays)
+
 
-    while True:
-        # Store visited node
-        visited_nodes.add(N_visit)
-
-        # Update traveled activities
-        num_activities_travelled += G.node[N_visit]["num_activities"]
-
-        # Reached sufficient number of activities
-        if (
-            num_activities_travelled
-            >= arguments.fixed_distance_max_num_activities
-        ):
-            return arguments.fixed_distance_max_num_activities
-
-        # Add to neighboring_nodes the neighbors of visited node
-        for N_i in G.neighbors(N_visit):
-            if (N_i not in neighboring_nodes_id) and (
-                N_i not in visited_nodes
-            ):  # Not stored/visited already
-                # Store neighboring nodes, ordered by their distance cost
-                cost = shortest_path_length_N0_.get(N_i)
-
-                if (
-                    cost
-                ):  # If path within MAX_DISTANCE_TO_TRAVEL exists, add neighboring node
-                    idx_to_insert = bisect(neighboring_nodes_cost, cost)
-                    # Insert in ordered list
-                    neighboring_nodes_id.insert(idx_to_insert, N_i)
-                    neighboring_nodes_cost.insert(idx_to_insert, cost)
-
-        if (
-            neighboring_nodes_id
-        ):  # If neighborings nodes exist: Continue iteration
-            # Update next node to visit
-            N_visit = neighboring_nodes_id.pop(0)
-            # Pop cost associated to N_visit
-            neighboring_nodes_cost.pop(0)
-        else:  # If no neighboring nodes: Reached maximum distance tolerated, cut the iteration
-            return num_activities_travelled
-
-    return np.nan
-
-
-def get_minimum_cost_activities_travel(G, point_ref, arguments):
+def clear_graph_arrays():
     """
-        Calculate accessibility value at point_ref according to chosen metric
-        If no graph node exists nearby input point reference, NaN is set
-        Based on the minimum radius travel cost to accomplish a certain quantity of activities
+        Clear the graph arrays of the current process
+
+        Returns
+        ----------
+
+        """
+    graph_arrays.clear()
+
+
+def set_graph_arrays(arrays):
+    """
+        Set the graph arrays of the current process, and its sparse adjacency
+    matrix
 
         Parameters
         ----------
-        G : networkx multidigraph
-                input graph to calculate accessibility
-        point_ref: shapely.Point
-                reference point to calculate accessibility
+        arrays : dict
+                graph arrays (see accessibility.get_graph_arrays)
 
         Returns
         ----------
-        float
-                returns the computed radius cost length
+
         """
-    # Find closest node to point_ref
-    N0, distance = get_nearest_node_utm(
-        G, point_ref.coords[0], return_dist=True
+    graph_arrays.update(arrays)
+    num_nodes = len(graph_arrays["num_activities"])
+    graph_arrays["adjacency"] = csr_matrix(
+        (
+            graph_arrays["lengths"],
+            graph_arrays["indices"],
+            graph_arrays["indptr"],
+        ),
+        shape=(num_nodes, num_nodes),
     )
-    # Distance to closest node too high?
-    if distance > arguments.max_node_distance:
-        return np.nan
-
-    # Initialize data structures
-    visited_nodes = []
-    neighboring_nodes_id = []
-    neighboring_nodes_cost = []
-    activities_travelled = 0
-
-    N_visit = N0
-
-    while not activities_travelled >= arguments.fixed_activities_min_number:
-        # Store visited node
-        visited_nodes.append(N_visit)
-
-        # Update traveled activities
-        activities_travelled += G.node[N_visit]["num_activities"]
-
-        # Add to neighboring_nodes the neighbors of visited node
-        for N_i in G.neighbors(N_visit):
-            if (N_i not in neighboring_nodes_id) and (
-                N_i not in visited_nodes
-            ):  # Not stored/visited already
-                # Store neighboring nodes, ordered by their distance cost
-                cost = nx.shortest_path_length(G, N0, N_i, weight="length")
-                idx_to_insert = bisect(neighboring_nodes_cost, cost)
-                # Insert in ordered list
-                neighboring_nodes_id.insert(idx_to_insert, N_i)
-                neighboring_nodes_cost.insert(idx_to_insert, cost)
-
-        if neighboring_nodes_id:  # If not empty
-            # Update next node to visit
-            N_visit = neighboring_nodes_id.pop(0)
-            cost_travel = neighboring_nodes_cost.pop(0)
-
-            # Reached maximum distance tolerated. Cut iteration
-            if cost_travel > arguments.fixed_activities_max_travel_distance:
-                return arguments.fixed_activities_max_travel_distance
-        else:  # Empty neighbors
-            return np.nan
-
-            # Accomplished. End node: visited_nodes[-1]
-    return nx.shortest_path_length(G, N0, visited_nodes[-1], weight="length")
-
-
-def main(argv):
+
+
+##############################################
+# Accessibility indices calculation
+##############################################
+
+
+def get_count_activities_fixed_distance(distances, arguments):
     """
-        Main program to drive the accessibility indices calculation
+        Calculate accessibility values according to chosen metric
+        Based on counting the number of (activity) opportunities given a fixed
+    maximum distance to travel
 
         Parameters
         ----------
-        argv : array
-                arguments to drive the calculation
+        distances : np.array
+                shortest path length from each source node to every node
+        (inf: beyond the maximum travel distance)
+        arguments : dict
+                accessibility arguments
 
         Returns
         ----------
-
+        np.array
+                returns the number of reached activities
         """
-    start = time.time()
+    reached_activities = np.where(
+        np.isfinite(distances), graph_arrays["num_activities"], 0
+    ).sum(axis=1)
+    return np.minimum(
+        reached_activities, arguments["fixed_distance_max_num_activities"]
+    ).astype(float)
 
-    # Load graph
-    G = nx.read_gpickle(argv[1])
 
-    # Load indices points
-    indices = pd.read_pickle(argv[2])
+def get_minimum_cost_activities_travel(distances, arguments):
+    """
+        Calculate accessibility values according to chosen metric
+        Based on the minimum radius travel cost to accomplish a certain
+    quantity of activities
+        Nodes are visited by increasing shortest path length: The cost is the
+    length to the node where the activities are accomplished. As in the
+    former traversal, the next node is popped before the activities are
+    verified: If it lies beyond the maximum travel distance, the latter is
+    returned instead, and if no more nodes can be reached, NaN is set
+    (including a source node without any reachable neighbour)
 
-    # Load indices calculation arguments
-    arguments = pd.read_pickle(argv[3])
+        Parameters
+        ----------
+        distances : np.array
+                shortest path length from each source node to every node
+        (inf: beyond the maximum travel distance)
+        arguments : dict
+                accessibility arguments
 
-    if (len(argv) > 4) and (
-        argv[4] == "memory_test"
-    ):  # Test memory used for current subprocess
-        import os
-        import psutil
+        Returns
+        ----------
+        np.array
+                returns the computed radius cost length
+        """
+    adjacency = graph_arrays["adjacency"]
+    num_activities = graph_arrays["num_activities"]
+    max_travel_distance = arguments["fixed_activities_max_travel_distance"]
+
+    costs = np.full(len(distances), np.nan)
+    for i, row in enumerate(distances):
+        reached = np.flatnonzero(np.isfinite(row))
+        # Visiting order
+        reached = reached[np.argsort(row[reached], kind="stable")]
+        activities_travelled = np.cumsum(num_activities[reached])
+        accomplished = np.searchsorted(
+            activities_travelled, arguments["fixed_activities_min_number"]
+        )
+        # Accomplished before the last reached node: The traversal verifies
+        # it once the next node is popped, which must lie within the maximum
+        # distance (this applies to the source node as well)
+        if accomplished < len(reached) - 1:
+            costs[i] = row[reached[accomplished]]
+        elif not np.isfinite(row[adjacency[reached].indices]).all():
+            # Further nodes exist: Reached maximum distance tolerated
+            costs[i] = max_travel_distance
+    return costs
+
+
+def compute_accessibility_chunk(nodes, arguments):
+    """
+        Calculate the accessibility indices from a chunk of source nodes,
+    given the graph arrays of the current process
 
-        process = psutil.Process(os.getpid())
-        Allocated_process_MB = process.memory_info().rss / 1000 / 1000
-        Free_system_MB = psutil.virtual_memory().available / 1000 / 1000
-        # print( MB_total )
-        # print( Free_system_MB )
-        max_processes = int(Free_system_MB / Allocated_process_MB)
-        print(max_processes)
-        return
+        Parameters
+        ----------
+        nodes : np.array
+                positions of the source nodes (nearest node of each point)
+        arguments : dict
+                accessibility arguments
 
-    if arguments.fixed_activities:
+        Returns
+        ----------
+        np.array
+                accessibility indices
+        """
+    if arguments["fixed_activities"]:
         _calculate_accessibility = get_minimum_cost_activities_travel
-    elif arguments.fixed_distance:
+        max_travel_distance = arguments["fixed_activities_max_travel_distance"]
+    elif arguments["fixed_distance"]:
         _calculate_accessibility = get_count_activities_fixed_distance
+        max_travel_distance = arguments["fixed_distance_max_travel_distance"]
     else:
         assert False
 
-        # Calculate accessibility
-    indices["accessibility"] = indices.geometry.apply(
-        lambda x: _calculate_accessibility(G, x, arguments)
+    # Shortest path length from each source node, using lengths of roads
+    distances = dijkstra(
+        graph_arrays["adjacency"],
+        directed=True,
+        indices=nodes,
+        limit=max_travel_distance,
     )
-
-    # Store results
-    indices.to_pickle(argv[2].replace("points", "indices"))
-
-    end = time.time()
-    print("Time:", str(end - start))
-
-
-if __name__ == "__main__":
-    main(sys.argv)
+    return _calculate_accessibility(distances, arguments)
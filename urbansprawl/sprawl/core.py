@@ -6,17 +6,28 @@
 import pandas as pd
 import geopandas as gpd
 import numpy as np
+import shapely
 from osmnx import log
-from shapely.geometry import Point
 
 from ..osm.core import get_route_graph, get_processed_osm_data
+from ..osm.utils import (
+    get_region_of_interest,
+    closest_distance_column,
+    compute_closest_building_distance,
+)
+from ..geometries import expand_grid_cells
 from .landusemix import compute_grid_landusemix
 from .accessibility import compute_grid_accessibility
 from .dispersion import compute_grid_dispersion
 
 
 def get_indices_grid(
-    df_osm_built, df_osm_building_parts, df_osm_pois, step=100
+    df_osm_built,
+    df_osm_building_parts,
+    df_osm_pois,
+    step=100,
+    polygon=None,
+    built_up_distance=None,
 ):
     """
         Creates an input geodataframe with points sampled in a regular grid
@@ -31,6 +42,12 @@ def get_indices_grid(
                 OSM processed points of interest
         step : int
                 step to sample the regular grid in meters
+        polygon : shapely Polygon or MultiPolygon
+                if given, only the cells within this shape (same projection as
+        the buildings) are kept
+        built_up_distance : float
+                if given, only the cells within this distance of any building
+        are kept (built-up mask)
 
         Returns
         ----------
@@ -42,15 +59,27 @@ def get_indices_grid(
         [df_osm_built, df_osm_building_parts, df_osm_pois], sort=False
     ).total_bounds
     return get_indices_grid_from_bbox(
-        [west, south, east, north], step, df_osm_built.crs
+        [west, south, east, north],
+        step,
+        df_osm_built.crs,
+        polygon=polygon,
+        built_up=None if built_up_distance is None else df_osm_built.geometry,
+        built_up_distance=built_up_distance,
     )
 
 
 def get_indices_grid_from_bbox(
-    bounding_box, step=100, crs={"init": "epsg:4326"}
+    bounding_box,
+    step=100,
+    crs={"init": "epsg:4326"},
+    polygon=None,
+    built_up=None,
+    built_up_distance=0,
 ):
     """
         Creates an input geodataframe with points sampled in a regular grid
+        The integer `row` and `col` of each cell within the full grid are
+        stored along with its geometry
 
         Parameters
         ----------
@@ -58,6 +87,15 @@ def get_indices_grid_from_bbox(
             Geographical coordinates in which one has to build the grid
         step : int
             Step to sample the regular grid in meters
+        crs : dict or string
+            projection of the bounding box
+        polygon : shapely Polygon or MultiPolygon
+            if given, only the cells within this shape are kept
+        built_up : geopandas.GeoSeries
+            if given, only the cells within built_up_distance of any of these
+        geometries are kept (built-up mask)
+        built_up_distance : float
+            built-up mask distance
 
         Returns
         ----------
@@ -66,20 +104,316 @@ def get_indices_grid_from_bbox(
         """
     # Get bounding box
     west, south, east, north = bounding_box
-    # Create indices
+    # Create indices: Cells ordered by column, then row
+    x_grid, y_grid = np.arange(west, east, step), np.arange(south, north, step)
+    cols, rows = np.meshgrid(
+        np.arange(len(x_grid)), np.arange(len(y_grid)), indexing="ij"
+    )
+    cols, rows = cols.ravel(), rows.ravel()
+    x, y = x_grid[cols], y_grid[rows]
+
+    # Clip to the region of interest
+    within = np.ones(len(x), dtype=bool)
+    if polygon is not None:
+        shapely.prepare(polygon)
+        within &= shapely.intersects_xy(polygon, x, y)
+    # Clip to the built-up mask
+    if built_up is not None:
+        candidates = np.flatnonzero(within)
+        near = shapely.STRtree(np.asarray(built_up)).query(
+            shapely.points(x[candidates], y[candidates]),
+            predicate="dwithin",
+            distance=built_up_distance or 0,
+        )[0]
+        within[:] = False
+        within[candidates[near]] = True
     df_indices = gpd.GeoDataFrame(
-        [
-            Point(i, j)
-            for i in np.arange(west, east, step)
-            for j in np.arange(south, north, step)
-        ],
-        columns=["geometry"],
+        {"row": rows[within], "col": cols[within]},
+        geometry=gpd.points_from_xy(x[within], y[within]),
     )
     # Set projection
     df_indices.crs = crs
     return df_indices
 
 
+def compute_grid_indices(
+    df_indices,
+    G,
+    df_osm_built,
+    df_osm_pois,
+    indices_computation,
+    accessibility_args,
+    landusemix_args,
+    dispersion_args,
+):
+    """
+        Compute the indicated sprawling indices on input grid
+
+        Parameters
+        ----------
+        df_indices : geopandas.GeoDataFrame
+                grid points where indices are computed
+        G : networkx multidigraph
+                input graph
+        df_osm_built : geopandas.GeoDataFrame
+                OSM processed buildings
+        df_osm_pois : geopandas.GeoDataFrame
+                OSM processed points of interest
+        indices_computation : dict
+                determines what sprawling indices should be computed
+        accessibility_args : dict
+                arguments to drive the accessibility indices calculation
+        landusemix_args : dict
+                arguments to drive the land use mix indices calculation
+        dispersion_args : dict
+                arguments to drive the dispersion indices calculation
+
+        Returns
+        ----------
+
+        """
+    if indices_computation.get("accessibility"):
+        compute_grid_accessibility(
+            df_indices, G, df_osm_built, df_osm_pois, accessibility_args
+        )
+    if indices_computation.get("landusemix"):
+        compute_grid_landusemix(
+            df_indices, df_osm_built, df_osm_pois, landusemix_args
+        )
+    if indices_computation.get("dispersion"):
+        compute_grid_dispersion(df_indices, df_osm_built, dispersion_args)
+
+
+##############################################################
+# Adaptive grid
+##############################################################
+
+
+def get_cells_to_refine(
+    df_cells,
+    step,
+    origin,
+    building_coords,
+    value_ranges,
+    gradient_threshold,
+    density_threshold,
+):
+    """
+        Determine the cells of a grid level to refine: Cells where the
+        (normalized) difference of an index value with a neighboring cell of
+        the same level, or the buildings density, exceed a threshold
+
+        Parameters
+        ----------
+        df_cells : geopandas.GeoDataFrame
+                cells of the level, with `row` and `col` columns
+        step : float
+                cells width and height
+        origin : np.array
+                location of the grid point at row and column 0
+        building_coords : np.array
+                buildings centroid coordinates
+        value_ranges : dict
+                range of values of each index column used for the gradient
+        gradient_threshold : float
+                maximum normalized difference with a neighboring cell
+        density_threshold : float
+                maximum number of buildings per hectare
+
+        Returns
+        ----------
+        np.array
+                boolean mask of the cells to refine
+        """
+    keys = pd.Index(
+        df_cells["col"].values * (2 ** 32) + df_cells["row"].values
+    )
+    refine = np.zeros(len(df_cells), dtype=bool)
+
+    # Buildings density: Each building lies in the cell of its nearest grid
+    # point
+    if density_threshold is not None and len(building_coords):
+        building_cells = np.round((building_coords - origin) / step).astype(
+            np.int64
+        )
+        building_keys = building_cells[:, 0] * (2 ** 32) + building_cells[:, 1]
+        cells, counts = np.unique(building_keys, return_counts=True)
+        position = keys.get_indexer(cells)
+        density = np.zeros(len(df_cells))
+        density[position[position >= 0]] = counts[position >= 0]
+        refine |= density / (step ** 2 / 1e4) > density_threshold
+
+    # Index values gradient
+    if gradient_threshold is not None:
+        for column, value_range in value_ranges.items():
+            if not value_range:
+                continue
+            values = df_cells[column].values / value_range
+            for d_col, d_row in [(1, 0), (-1, 0), (0, 1), (0, -1)]:
+                position = keys.get_indexer(keys + d_col * (2 ** 32) + d_row)
+                has_neighbor = position >= 0
+                difference = np.zeros(len(df_cells))
+                difference[has_neighbor] = np.abs(
+                    values[has_neighbor] - values[position[has_neighbor]]
+                )
+                refine |= np.nan_to_num(difference) > gradient_threshold
+    return refine
+
+
+def compute_adaptive_grid_indices(
+    df_indices,
+    G,
+    df_osm_built,
+    df_osm_pois,
+    grid_step,
+    adaptive_grid_args,
+    indices_computation,
+    accessibility_args,
+    landusemix_args,
+    dispersion_args,
+):
+    """
+        Compute sprawling indices on an adaptive (quadtree) grid
+        Indices are computed on the coarse input grid. Then, cells where the
+        values gradient or the buildings density exceed a threshold are
+        recursively divided in 4 cells, down to a minimum step
+        Each grid point stands for the square of the locations nearest to it
+        Land use mix indices (normalized over the evaluated points) are
+        finally computed on all the resulting cells together
+
+        Parameters
+        ----------
+        df_indices : geopandas.GeoDataFrame
+                coarse grid (see get_indices_grid)
+        G : networkx multidigraph
+                input graph
+        df_osm_built : geopandas.GeoDataFrame
+                OSM processed buildings
+        df_osm_pois : geopandas.GeoDataFrame
+                OSM processed points of interest
+        grid_step : float
+                step of the coarse grid
+        adaptive_grid_args : dict
+                arguments to drive the grid refinement
+                        min_step : float
+                                minimum step of the refined cells
+                        gradient_threshold : float
+                                maximum difference of index values between
+        neighboring cells, relative to the index values range
+                        density_threshold : float
+                                maximum number of buildings per hectare
+                        gradient_columns : list
+                                index columns considered for the gradient
+        (None: all computed indices)
+        indices_computation : dict
+                determines what sprawling indices should be computed
+        accessibility_args : dict
+                arguments to drive the accessibility indices calculation
+        landusemix_args : dict
+                arguments to drive the land use mix indices calculation
+        dispersion_args : dict
+                arguments to drive the dispersion indices calculation
+
+        Returns
+        ----------
+        gpd.GeoDataFrame
+                multi-resolution grid: Grid points, `level`, `step`, `row`
+        and `col` within its level grid, and sprawling indices
+        """
+    min_step = adaptive_grid_args.get("min_step", grid_step)
+    gradient_columns = adaptive_grid_args.get("gradient_columns") or [
+        index for index, computed in indices_computation.items() if computed
+    ]
+    centroids = df_osm_built.geometry.centroid
+    building_coords = np.column_stack([centroids.x.values, centroids.y.values])
+    # Location of the coarse grid point at row and column 0
+    coords = np.column_stack(
+        [df_indices.geometry.x.values, df_indices.geometry.y.values]
+    )
+    indices = np.column_stack(
+        [df_indices["col"].values, df_indices["row"].values]
+    )
+    origin = np.mean(coords - grid_step * indices, axis=0)
+
+    level, step = 0, grid_step
+    df_cells = df_indices
+    compute_grid_indices(
+        df_cells,
+        G,
+        df_osm_built,
+        df_osm_pois,
+        indices_computation,
+        accessibility_args,
+        landusemix_args,
+        dispersion_args,
+    )
+    # Gradients are relative to the coarse grid values range
+    value_ranges = {
+        column: df_cells[column].max() - df_cells[column].min()
+        for column in gradient_columns
+        if column in df_cells.columns
+    }
+
+    leaves = []
+    while step / 2.0 >= min_step and len(df_cells):
+        df_cells["level"], df_cells["step"] = level, step
+        refine = get_cells_to_refine(
+            df_cells,
+            step,
+            origin,
+            building_coords,
+            value_ranges,
+            adaptive_grid_args.get("gradient_threshold"),
+            adaptive_grid_args.get("density_threshold"),
+        )
+        leaves.append(df_cells[~refine])
+        if not refine.any():
+            df_cells = df_cells.iloc[:0]
+            break
+        # Divide the cells to refine
+        df_cells = expand_grid_cells(df_cells[refine], step).drop(
+            columns="parent"
+        )
+        level, step = level + 1, step / 2.0
+        # Sub-cells are offset by half their step (see expand_grid_cells)
+        origin = origin - step / 2.0
+        log(
+            "Adaptive grid: "
+            + str(len(df_cells))
+            + " cells at level "
+            + str(level)
+        )
+        compute_grid_indices(
+            df_cells,
+            G,
+            df_osm_built,
+            df_osm_pois,
+            indices_computation,
+            accessibility_args,
+            landusemix_args,
+            dispersion_args,
+        )
+    df_cells["level"], df_cells["step"] = level, step
+    leaves.append(df_cells)
+
+    df_grid = gpd.GeoDataFrame(
+        pd.concat(leaves, ignore_index=True, sort=False),
+        crs=df_indices.crs,
+    )
+    # Land use mix: Densities normalized over all the cells
+    # Cells of different levels do not lie on a common regular grid: The
+    # densities are estimated at arbitrary points (tree engine, exact if
+    # the kernel tolerance is 0)
+    if indices_computation.get("landusemix") and level > 0:
+        compute_grid_landusemix(
+            df_grid,
+            df_osm_built,
+            df_osm_pois,
+            dict(landusemix_args, kde_engine="tree"),
+        )
+    return df_grid
+
+
 def process_spatial_indices(
     city_ref=None,
     region_args={
@@ -95,6 +429,7 @@ def process_spatial_indices(
         "west": None,
     },
     grid_step=100,
+    grid_args={"clip_to_region": False, "built_up_distance": None},
     process_osm_args={
         "retrieve_graph": True,
         "default_height": 3,
@@ -106,7 +441,6 @@ def process_spatial_indices(
     dispersion_args={
         "radius_search": 750,
         "use_median": False,
-        "K_nearest": 50,
     },
     landusemix_args={
         "walkable_distance": 600,
@@ -114,6 +448,10 @@ def process_spatial_indices(
         "weighted_kde": True,
         "pois_weight": 9,
         "log_weighted": True,
+        "kde_engine": "exact",
+        "kde_tolerance": 1e-8,
+        "kde_n_jobs": None,
+        "kde_float32": False,
     },
     accessibility_args={
         "fixed_distance": True,
@@ -129,6 +467,7 @@ def process_spatial_indices(
         "landusemix": True,
         "accessibility": True,
     },
+    adaptive_grid_args=None,
 ):
     """
         Process sprawling indices for an input region of interest
@@ -144,6 +483,14 @@ def process_spatial_indices(
                 Name of input city / region
         grid_step : int
                 step to sample the regular grid in meters
+        grid_args : dict
+                arguments to restrict the grid cells where indices are computed
+                        clip_to_region : bool
+                                keep only the cells within the polygon or
+        bounding box of region_args (if given)
+                        built_up_distance : float
+                                keep only the cells within this distance of any
+        building (built-up mask)
         region_args : dict
                 contains the information to retrieve the region of interest as
         the following:
@@ -198,9 +545,9 @@ def process_spatial_indices(
                         use_median : bool
                                 denotes whether the median or mean should be
         used to calculate the indices
-                        K_nearest : int
-                                number of neighboring buildings to consider in
-        evaluation
+                        n_jobs : int
+                                number of workers querying the buildings tree
+        (optional, None: all the cores)
         landusemix_args : dict
                 arguments to drive the land use mix indices calculation
                         walkable_distance : int
@@ -218,6 +565,18 @@ def process_spatial_indices(
                         log_weighted : bool
                                 apply natural logarithmic function to surface
         weights
+                        kde_engine : string
+                                Kernel Density Estimation engine: 'exact',
+        'tree' (truncated neighbourhoods), or 'fft' (binned FFT convolution,
+        for regular grids)
+                        kde_tolerance : float
+                                neglected kernel values (relative to its
+        maximum) of the 'tree' and 'fft' engines
+                        kde_n_jobs : int
+                                number of threads evaluating the kernel
+        (None: all the cores)
+                        kde_float32 : bool
+                                compute the kernel values in single precision
         accessibility_args : dict
                 arguments to drive the accessibility indices calculation
                         fixed_distance : bool
@@ -241,13 +600,29 @@ def process_spatial_indices(
                         fixed_activities_min_number: int
                                 (fixed activities) minimum number of activities
         required
+                        n_jobs : int
+                                number of processes (optional, None: all the
+        cores)
         indices_computation : dict
                 determines what sprawling indices should be computed
+        adaptive_grid_args : dict
+                if given, the grid is adaptively refined from grid_step (see
+        compute_adaptive_grid_indices)
+                        min_step : float
+                                minimum step of the refined cells
+                        gradient_threshold : float
+                                maximum difference of index values between
+        neighboring cells, relative to the index values range
+                        density_threshold : float
+                                maximum number of buildings per hectare
+                        gradient_columns : list
+                                index columns considered for the gradient
 
         Returns
         ----------
         gpd.GeoDataFrame
-                returns the regular grid with the indicated sprawling indices
+                returns the regular (or multi-resolution) grid with the
+        indicated sprawling indices
         """
     try:
         # Process OSM data
@@ -265,22 +640,61 @@ def process_spatial_indices(
             log("Not computing any spatial indices")
             return None
 
+        # Buildings closest distance (missing in data stored by former
+        # versions): Computed once, shared by every dispersion computation
+        if indices_computation.get("dispersion") and (
+            closest_distance_column not in df_osm_built.columns
+        ):
+            compute_closest_building_distance(df_osm_built)
+
             # Get indices grid
+        polygon = None
+        if grid_args.get("clip_to_region") and (
+            (region_args.get("polygon") is not None)
+            or (region_args.get("north") is not None)
+        ):
+            bbox = [
+                region_args.get(key)
+                for key in ["west", "south", "east", "north"]
+            ]
+            polygon = (
+                get_region_of_interest(bbox, region_args.get("polygon"))
+                .to_crs(df_osm_built.crs)
+                .iloc[0]
+            )
         df_indices = get_indices_grid(
-            df_osm_built, df_osm_building_parts, df_osm_pois, grid_step
+            df_osm_built,
+            df_osm_building_parts,
+            df_osm_pois,
+            grid_step,
+            polygon=polygon,
+            built_up_distance=grid_args.get("built_up_distance"),
         )
 
         # Compute sprawling indices
-        if indices_computation.get("accessibility"):
-            compute_grid_accessibility(
-                df_indices, G, df_osm_built, df_osm_pois, accessibility_args
+        if adaptive_grid_args:
+            return compute_adaptive_grid_indices(
+                df_indices,
+                G,
+                df_osm_built,
+                df_osm_pois,
+                grid_step,
+                adaptive_grid_args,
+                indices_computation,
+                accessibility_args,
+                landusemix_args,
+                dispersion_args,
             )
-        if indices_computation.get("landusemix"):
-            compute_grid_landusemix(
-                df_indices, df_osm_built, df_osm_pois, landusemix_args
-            )
-        if indices_computation.get("dispersion"):
-            compute_grid_dispersion(df_indices, df_osm_built, dispersion_args)
+        compute_grid_indices(
+            df_indices,
+            G,
+            df_osm_built,
+            df_osm_pois,
+            indices_computation,
+            accessibility_args,
+            landusemix_args,
+            dispersion_args,
+        )
 
         return df_indices
 
@@ -5,83 +5,153 @@
 
 from scipy import spatial
 import numpy as np
+import itertools
 import time
 
 from osmnx import log
 
+from ..osm.utils import (
+    closest_distance_column,
+    compute_closest_building_distance,
+)
+from .kernels import neighbourhood_statistic, neighbourhood_statistic_radii
+from .utils import (
+    get_kde_n_jobs,
+    get_kde_chunk_megabytes,
+    get_bandwidth_suffix,
+)
+
+# Bytes allocated per queried neighbour (indices, values, sorting)
+neighbour_bytes = 48
+# Additional bytes per neighbour for several radii (distances, masks)
+neighbour_distance_bytes = 40
+
 ##############################################################
 # Dispersion indices methods
 ##############################################################
 
 
-def closest_building_distance_median(
-    point_ref, tree, df_closest_d, radius_search
-):
+def get_neighbourhoods_batches(counts, max_mb_per_batch, item_bytes):
     """
-        Dispersion metric at point_ref
-
-    Computes the median of the closest distance to another building for
-    each building within a radius search
-
-        Uses the input KDTree to accelerate calculations
+        Split consecutive points in batches whose neighbourhoods fit in the
+        memory budget
 
         Parameters
         ----------
-        point_ref : shapely.Point
-                calculate index at input point
-        tree : scipy.spatial.KDTree
-                KDTree of buildings centroid
-        df : pandas.DataFrame
-                data frame of buildings with closest distance calculation
-        radius_search : float
-                circle radius to consider the dispersion calculation at a local
-        point
+        counts : np.array
+                number of neighbours of each point
+        max_mb_per_batch : float
+                megabytes per batch
+        item_bytes : int
+                bytes allocated per neighbour
 
         Returns
         ----------
-        float
-                value of dispersion at input point
+        list
+                slices of the points of each batch
         """
-    # Query buildings within radius search
-    indices = tree.query_ball_point(point_ref, radius_search)
-    # No dispersion value
-    if len(indices) == 0:
-        return np.NaN
-    # Calculate median of closest distance values. If no information is available, NaN is set
-    return df_closest_d.loc[indices].median()
-
-
-def closest_building_distance_average(
-    point_ref, tree, df_closest_d, radius_search
+    max_neighbours = max(1, int(max_mb_per_batch / (item_bytes * 1e-6)))
+    cumulative = np.cumsum(counts)
+    bounds, start = [0], 0
+    while start < len(counts):
+        offset = cumulative[start - 1] if start > 0 else 0
+        # At least one point per batch
+        end = max(
+            start + 1,
+            np.searchsorted(cumulative, offset + max_neighbours, "right"),
+        )
+        bounds.append(end)
+        start = end
+    return [slice(start, end) for start, end in zip(bounds[:-1], bounds[1:])]
+
+
+def get_neighbourhoods_statistic(
+    tree,
+    points,
+    values,
+    radius_search,
+    statistic="median",
+    n_jobs=None,
+    max_mb_per_batch=None,
+    backend=None,
 ):
     """
-        Dispersion metric at point_ref
-        Computes the mean of the closest distance to another building for each building within a radius search
-        Uses the input KDTree to accelerate calculations
+        Median or mean of the values of the neighbours within the radius
+        search of each point
+        Neighbourhoods are queried in batches (compiled tree, parallel
+        workers) and reduced over a flat array of neighbour indices
+        Given a list of radii, neighbourhoods are queried once for the largest
+        radius
 
         Parameters
         ----------
-        point_ref : shapely.Point
-                calculate index at input point
-        tree : scipy.spatial.KDTree
-                KDTree of buildings centroid
-        df : pandas.DataFrame
-                data frame of buildings with closest distance calculation
-        radius_search : int
-                circle radius to consider the dispersion calculation at a local point
+        tree : scipy.spatial.cKDTree
+                KDTree of input values locations
+        points : np.array
+                points where the statistic is computed
+        values : np.array
+                value of each tree location
+        radius_search : float or list
+                circle radius of the neighbourhoods
+        statistic : string
+                'median' or 'mean'
+        n_jobs : int
+                number of workers querying the tree (None: all the cores)
+        max_mb_per_batch : float
+                memory budget of each batch (None: share of the available
+        memory)
+        backend : string
+                kernels backend (see kernels.get_kernels_backend)
 
         Returns
         ----------
-        float
-                value of dispersion at input point
+        np.array or dict
+                statistic of each point (NaN: empty neighbourhood). Given a
+        list of radii: radius -> statistic of each point
         """
-    # Query buildings within radius search
-    indices = tree.query_ball_point(point_ref, radius_search)
-    # No dispersion value
-    if len(indices) == 0:
-        return np.NaN
-    # Calculate mean of closest distance values. If no information is available, NaN is set
-    return df_closest_d.loc[indices].mean()
+    radii = np.atleast_1d(radius_search)
+    max_radius = radii.max()
+    workers = get_kde_n_jobs(n_jobs)
+    # Neighbours count: Sizes the batches
+    counts = tree.query_ball_point(
+        points, max_radius, workers=workers, return_length=True
+    )
+    item_bytes = neighbour_bytes
+    if len(radii) > 1:
+        item_bytes += neighbour_distance_bytes
+    result = np.empty((len(radii), len(points)))
+    for batch in get_neighbourhoods_batches(
+        counts, get_kde_chunk_megabytes(max_mb_per_batch), item_bytes
+    ):
+        neighbours = tree.query_ball_point(
+            points[batch], max_radius, workers=workers, return_sorted=False
+        )
+        # Neighbourhoods in CSR layout
+        offsets = np.zeros(len(neighbours) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum(counts[batch])
+        indices = np.fromiter(
+            itertools.chain.from_iterable(neighbours),
+            dtype=np.int64,
+            count=offsets[-1],
+        )
+        if len(radii) == 1:
+            result[0, batch] = neighbourhood_statistic(
+                offsets, indices, values, statistic, backend
+            )
+        else:
+            result[:, batch] = neighbourhood_statistic_radii(
+                offsets,
+                indices,
+                values,
+                radii,
+                points[batch],
+                tree.data,
+                statistic,
+                backend,
+            )
+    if np.ndim(radius_search) == 0:
+        return result[0]
+    return dict(zip(radius_search, result))
 
 
 ##############################################################
@@ -92,10 +162,12 @@ def closest_building_distance_average(
 def compute_grid_dispersion(
     df_indices,
     df_osm_built,
-    kwargs={"radius_search": 750, "use_median": True, "K_nearest": 50},
+    kwargs={"radius_search": 750, "use_median": True},
 ):
     """
         Creates grid and calculates dispersion indices.
+        The buildings closest distance column (stored with the processed OSM
+        data, see compute_closest_building_distance) is reused if available
 
         Parameters
         ----------
@@ -105,12 +177,22 @@ def compute_grid_dispersion(
                 data frame containing the building's geometries
         kw_args: dict
                 additional keyword arguments for the indices calculation
-                        radius_search: int
+                        radius_search: int or list
                                 circle radius to consider the dispersion calculation at a local point
+                                given a list of radii, neighbourhoods are queried once for the
+                                largest radius, and one column is computed per radius
+                                (e.g. `dispersion_500`)
                         use_median : bool
                                 denotes whether the median or mean should be used to calculate the indices
-                        K_nearest : int
-                                number of neighboring buildings to consider in evaluation
+                        kernels_backend : string
+                                backend of the neighbourhoods median / mean
+                                ('auto', 'numba' or 'numpy', see kernels.get_kernels_backend)
+                        n_jobs : int
+                                number of workers querying the buildings tree
+                                (None: all the cores)
+                        max_mb_per_batch : float
+                                memory budget of each batch of neighbourhoods
+                                (None: share of the available memory)
 
         Returns
         ----------
@@ -125,93 +207,50 @@ def compute_grid_dispersion(
 
     # Assign dispersion calculation method
     if kwargs["use_median"]:
-        _calculate_dispersion = closest_building_distance_median
+        statistic = "median"
     else:
-        _calculate_dispersion = closest_building_distance_average
+        statistic = "mean"
 
-        # Calculate the closest distance for each building within K_nearest centroid buildings
-    _apply_polygon_closest_distance_neighbor(
-        df_osm_built, K_nearest=kwargs["K_nearest"]
-    )
+    # Closest distance for each building: Stored with the processed data
+    computed_closest_d = closest_distance_column not in df_osm_built.columns
+    if computed_closest_d:
+        compute_closest_building_distance(df_osm_built)
 
     # For dispersion calculation approximation, create KDTree with buildings centroid
-    coords_data = [
-        point.coords[0]
-        for point in df_osm_built.loc[
-            df_osm_built.closest_d.notnull()
-        ].geometry.apply(lambda x: x.centroid)
+    df_osm_built_valid = df_osm_built.loc[
+        df_osm_built[closest_distance_column].notnull()
     ]
+    centroids = df_osm_built_valid.geometry.centroid
+    coords_data = np.column_stack([centroids.x.values, centroids.y.values])
     # Create KDTree
-    tree = spatial.KDTree(coords_data)
+    tree = spatial.cKDTree(coords_data)
 
-    # Compute dispersion indices
+    # Compute dispersion indices: Batched ball queries over every point
     index_column = "dispersion"
-    df_indices[index_column] = df_indices.geometry.apply(
-        lambda x: _calculate_dispersion(
-            x, tree, df_osm_built.closest_d, radius_search
-        )
+    dispersion = get_neighbourhoods_statistic(
+        tree,
+        np.column_stack(
+            [df_indices.geometry.x.values, df_indices.geometry.y.values]
+        ),
+        df_osm_built_valid[closest_distance_column].values,
+        radius_search,
+        statistic,
+        n_jobs=kwargs.get("n_jobs"),
+        max_mb_per_batch=kwargs.get("max_mb_per_batch"),
+        backend=kwargs.get("kernels_backend"),
     )
+    if isinstance(dispersion, dict):  # One column per radius
+        for radius, values in dispersion.items():
+            df_indices[index_column + get_bandwidth_suffix(radius)] = values
+    else:
+        df_indices[index_column] = dispersion
 
     # Remove added column
-    df_osm_built.drop("closest_d", axis=1, inplace=True)
+    if computed_closest_d:
+        df_osm_built.drop(closest_distance_column, axis=1, inplace=True)
 
     log(
         "Done: Dispersion indices. Elapsed time (H:M:S): "
         + time.strftime("%H:%M:%S", time.gmtime(time.time() - start))
     )
 
-
-def _apply_polygon_closest_distance_neighbor(df_osm_built, K_nearest=50):
-    """
-        Computes for each polygon, the distance to the (approximated) nearest
-    neighboring polygon
-
-        Approximation is done using distance between centroids to K nearest
-        neighboring polygons, then evaluating the real polygon distance
-
-        A column `closest_d` is added in the data frame
-
-        Parameters
-        ----------
-        df_osm_built: geopandas.GeoDataFrame
-                data frame containing the building's geometries
-        K_nearest: int
-                number of neighboring polygons to evaluate
-
-        Returns
-        ----------
-
-        """
-
-    def get_closest_indices(tree, x, K_nearest):
-        # Query the closest buidings considering their centroid
-        return tree.query(x.centroid.coords[0], k=K_nearest + 1)[1][1:]
-
-    def compute_closest_distance(x, buildings):
-        # Minimum distance of all distances between reference building 'x'
-        # and the other buildings
-        return (buildings.apply(lambda b: x.distance(b))).min()
-
-        # Use all elements to get the exact closest neighbor?
-
-    if (K_nearest == -1) or (K_nearest >= len(df_osm_built)):
-        K_nearest = len(df_osm_built) - 1
-
-    # Get separate list for coordinates
-    coords_data = [geom.centroid.coords[0] for geom in df_osm_built.geometry]
-    # Create KD Tree using polygon's centroid
-    tree = spatial.KDTree(coords_data)
-
-    # Get the closest buildings indices
-    df_osm_built["closest_buildings"] = df_osm_built.geometry.apply(
-        lambda x: get_closest_indices(tree, x, K_nearest)
-    )
-    # Compute the minimum real distance for the closest buildings
-    df_osm_built["closest_d"] = df_osm_built.apply(
-        lambda x: compute_closest_distance(
-            x.geometry, df_osm_built.geometry.loc[x.closest_buildings]
-        ),
-        axis=1,
-    )
-    # Drop unnecessary column
-    df_osm_built.drop("closest_buildings", axis=1, inplace=True)
@@ -0,0 +1,372 @@
+###############
+# Repository: https://github.com/lgervasoni/urbansprawl
+# MIT License
+###############
+
+import math
+import numpy as np
+
+try:
+    import numba
+except ImportError:  # Optional: NumPy kernels are used instead
+    numba = None
+
+# Compiled kernels backend: 'auto' (Numba if installed), 'numba' or 'numpy'
+kernels_backend = "auto"
+
+##############################################################
+# Backend selection
+##############################################################
+
+
+def get_kernels_backend(backend=None):
+    """
+        Get the backend evaluating the kernels
+
+        Parameters
+        ----------
+        backend : string
+                requested backend: 'auto', 'numba' or 'numpy' (None: module
+        setting kernels_backend)
+
+        Returns
+        ----------
+        string
+                'numba' or 'numpy'
+        """
+    backend = backend or kernels_backend
+    if backend == "auto":
+        return "numpy" if numba is None else "numba"
+    if backend not in ["numba", "numpy"]:
+        raise ValueError("Unknown kernels backend: " + str(backend))
+    if (backend == "numba") and (numba is None):
+        raise ImportError("Numba is required by the 'numba' kernels backend")
+    return backend
+
+
+##############################################################
+# Compiled kernels
+##############################################################
+
+if numba is not None:
+
+    @numba.njit(parallel=True, cache=True)
+    def _numba_gaussian_density(Y, X, W, bandwidth, cutoff):
+        # Distance, kernel value and weighted accumulation are fused: No
+        # (Y, X) temporaries. Parallel over evaluation points
+        PDF = np.zeros((Y.shape[0], W.shape[1]))
+        factor = -0.5 / (bandwidth * bandwidth)
+        cutoff_2 = cutoff * cutoff
+        for i in numba.prange(Y.shape[0]):
+            for j in range(X.shape[0]):
+                dx = Y[i, 0] - X[j, 0]
+                dy = Y[i, 1] - X[j, 1]
+                distance_2 = dx * dx + dy * dy
+                if distance_2 <= cutoff_2:
+                    kernel = math.exp(factor * distance_2)
+                    for k in range(W.shape[1]):
+                        PDF[i, k] += kernel * W[j, k]
+        return PDF
+
+    @numba.njit(nogil=True, cache=True)
+    def _numba_pairs_gaussian_density(
+        num_points, rows, cols, distances, W, bandwidths, cutoffs
+    ):
+        # Kernel value and weighted accumulation are fused for each
+        # neighbouring pair: No sparse kernel matrices. The GIL is released,
+        # chunks of pairs are evaluated on concurrent threads
+        PDF = np.zeros((bandwidths.shape[0], num_points, W.shape[1]))
+        for b in range(bandwidths.shape[0]):
+            factor = -0.5 / (bandwidths[b] * bandwidths[b])
+            for p in range(distances.shape[0]):
+                if distances[p] <= cutoffs[b]:
+                    kernel = math.exp(factor * distances[p] * distances[p])
+                    i, j = rows[p], cols[p]
+                    for k in range(W.shape[1]):
+                        PDF[b, i, k] += kernel * W[j, k]
+        return PDF
+
+    @numba.njit(parallel=True, cache=True)
+    def _numba_neighbourhood_statistic(offsets, indices, values, median):
+        # One neighbourhood per evaluation point (CSR layout)
+        statistic = np.empty(len(offsets) - 1)
+        for i in numba.prange(len(offsets) - 1):
+            start, end = offsets[i], offsets[i + 1]
+            if end == start:
+                statistic[i] = np.nan
+            elif median:
+                statistic[i] = np.median(values[indices[start:end]])
+            else:
+                statistic[i] = np.mean(values[indices[start:end]])
+        return statistic
+
+    @numba.njit(parallel=True, cache=True)
+    def _numba_middle_values_levels(offsets, sorted_values, levels, counts):
+        # Medians of nested neighbourhoods: Single pass over the neighbours of
+        # each neighbourhood, sorted by value, tracking the middle positions
+        # of each radius (counts: cumulative, per neighbourhood and radius)
+        num_radii = counts.shape[1]
+        result = np.full((num_radii, len(offsets) - 1), np.nan)
+        for i in numba.prange(len(offsets) - 1):
+            seen = np.zeros(num_radii, dtype=np.int64)
+            lower = np.zeros(num_radii)
+            upper = np.zeros(num_radii)
+            for j in range(offsets[i], offsets[i + 1]):
+                for k in range(levels[j], num_radii):
+                    if seen[k] == (counts[i, k] - 1) // 2:
+                        lower[k] = sorted_values[j]
+                    if seen[k] == counts[i, k] // 2:
+                        upper[k] = sorted_values[j]
+                    seen[k] += 1
+            for k in range(num_radii):
+                if counts[i, k] > 0:
+                    result[k, i] = (lower[k] + upper[k]) / 2.0
+        return result
+
+
+def gaussian_density(Y, X, W, bandwidth, cutoff=np.inf):
+    """
+        Weighted sum of Gaussian kernel values at each evaluation point
+        (compiled kernel: Requires the 'numba' backend)
+
+        Parameters
+        ----------
+        Y : np.array
+                points where density estimations will be performed
+        X : np.array
+                input points
+        W : np.array
+                weights matrix of input points (one column per density)
+        bandwidth : float
+                kernel bandwidth
+        cutoff : float
+                distance beyond which kernel values are neglected
+
+        Returns
+        ----------
+        np.array
+                densities (Y, densities)
+        """
+    get_kernels_backend("numba")
+    return _numba_gaussian_density(
+        np.ascontiguousarray(Y, dtype=np.float64),
+        np.ascontiguousarray(X, dtype=np.float64),
+        np.ascontiguousarray(W, dtype=np.float64),
+        float(bandwidth),
+        float(cutoff),
+    )
+
+
+def pairs_gaussian_density(
+    num_points, rows, cols, distances, W, bandwidths, cutoffs
+):
+    """
+        Weighted sum of Gaussian kernel values at each evaluation point,
+        given the neighbouring pairs of evaluation and input points
+        (compiled kernel: Requires the 'numba' backend)
+
+        Parameters
+        ----------
+        num_points : int
+                number of evaluation points
+        rows : np.array
+                evaluation point of each pair
+        cols : np.array
+                input point of each pair
+        distances : np.array
+                distance of each pair
+        W : np.array
+                weights matrix of input points (one column per density)
+        bandwidths : np.array
+                kernel bandwidths
+        cutoffs : np.array
+                distance beyond which kernel values are neglected, for each
+        bandwidth
+
+        Returns
+        ----------
+        np.array
+                densities (bandwidths, evaluation points, densities)
+        """
+    get_kernels_backend("numba")
+    return _numba_pairs_gaussian_density(
+        int(num_points),
+        np.ascontiguousarray(rows, dtype=np.int64),
+        np.ascontiguousarray(cols, dtype=np.int64),
+        np.ascontiguousarray(distances, dtype=np.float64),
+        np.ascontiguousarray(W, dtype=np.float64),
+        np.ascontiguousarray(bandwidths, dtype=np.float64),
+        np.ascontiguousarray(cutoffs, dtype=np.float64),
+    )
+
+
+def neighbourhood_statistic(
+    offsets, indices, values, statistic="median", backend=None
+):
+    """
+        Median or mean of input values over each neighbourhood
+        Neighbourhoods are given in CSR layout: The neighbours of point i are
+        indices[offsets[i]:offsets[i+1]]. Empty neighbourhoods give NaN
+
+        Parameters
+        ----------
+        offsets : np.array
+                neighbourhoods offsets
+        indices : np.array
+                neighbours indices (positions in input values)
+        values : np.array
+                values of each neighbour
+        statistic : string
+                'median' or 'mean'
+        backend : string
+                kernels backend (see get_kernels_backend)
+
+        Returns
+        ----------
+        np.array
+                statistic of each neighbourhood
+        """
+    offsets = np.asarray(offsets, dtype=np.int64)
+    indices = np.asarray(indices, dtype=np.int64)
+    values = np.asarray(values, dtype=np.float64)
+
+    if get_kernels_backend(backend) == "numba":
+        return _numba_neighbourhood_statistic(
+            offsets, indices, values, statistic == "median"
+        )
+
+    counts = np.diff(offsets)
+    groups = np.repeat(np.arange(len(counts)), counts)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        if statistic == "mean":
+            sums = np.bincount(
+                groups, weights=values[indices], minlength=len(counts)
+            )
+            result = sums / counts
+        else:
+            # Sort values within each neighbourhood: Middle elements
+            _, sorted_indices = _sort_neighbourhoods(groups, indices, values)
+            result = _middle_values(values[sorted_indices], offsets)
+    result[counts == 0] = np.nan
+    return result
+
+
+def neighbourhood_statistic_radii(
+    offsets,
+    indices,
+    values,
+    radii,
+    points,
+    locations,
+    statistic="median",
+    backend=None,
+):
+    """
+        Median or mean of input values over the neighbourhoods of several
+        radii, given the neighbourhoods of the largest one
+        Neighbourhoods are nested: Each neighbour is assigned once to the
+        smallest radius containing it. Counts and sums of each radius are
+        cumulated over these rings, and medians are taken over neighbours
+        sorted once by value (no sorting per radius)
+
+        Parameters
+        ----------
+        offsets : np.array
+                neighbourhoods offsets (largest radius)
+        indices : np.array
+                neighbours indices (positions in input values)
+        values : np.array
+                values of each neighbour
+        radii : list
+                neighbourhoods radii
+        points : np.array
+                neighbourhoods centers
+        locations : np.array
+                location of each value
+        statistic : string
+                'median' or 'mean'
+        backend : string
+                kernels backend (see get_kernels_backend)
+
+        Returns
+        ----------
+        np.array
+                statistic of each neighbourhood (radii, neighbourhoods)
+        """
+    offsets = np.asarray(offsets, dtype=np.int64)
+    indices = np.asarray(indices, dtype=np.int64)
+    values = np.asarray(values, dtype=np.float64)
+
+    backend = get_kernels_backend(backend)
+
+    counts = np.diff(offsets)
+    groups = np.repeat(np.arange(len(counts)), counts)
+    if statistic == "median":
+        groups, indices = _sort_neighbourhoods(groups, indices, values)
+    # Ring of each neighbour: Smallest radius containing it. Neighbours were
+    # queried within the largest radius: All of them belong to it
+    radii_order = np.argsort(radii)
+    radii_2 = np.square(np.asarray(radii, dtype=np.float64)[radii_order])
+    distances_2 = np.square(locations[indices] - points[groups]).sum(axis=1)
+    levels = np.minimum(
+        np.searchsorted(radii_2, distances_2), len(radii) - 1
+    )
+    # Number of neighbours within each (neighbourhood, radius)
+    counts_radii = np.cumsum(
+        np.bincount(
+            groups * len(radii) + levels, minlength=len(counts) * len(radii)
+        ).reshape(len(counts), len(radii)),
+        axis=1,
+    )
+
+    if statistic == "mean":
+        sums_radii = np.cumsum(
+            np.bincount(
+                groups * len(radii) + levels,
+                weights=values[indices],
+                minlength=len(counts) * len(radii),
+            ).reshape(len(counts), len(radii)),
+            axis=1,
+        )
+        with np.errstate(divide="ignore", invalid="ignore"):
+            result = (sums_radii / counts_radii).T
+        result[(counts_radii == 0).T] = np.nan
+    elif backend == "numba":
+        result = _numba_middle_values_levels(
+            offsets, values[indices], levels, counts_radii
+        )
+    else:
+        result = np.empty((len(radii), len(counts)))
+        for k in range(len(radii)):
+            within = levels <= k
+            offsets_radius = np.zeros(len(counts) + 1, dtype=np.int64)
+            offsets_radius[1:] = np.cumsum(counts_radii[:, k])
+            result[k] = _middle_values(
+                values[indices[within]], offsets_radius
+            )
+    # Back to the order of input radii
+    result[radii_order] = result.copy()
+    return result
+
+
+def _sort_neighbourhoods(groups, indices, values):
+    # Sort the neighbours of each neighbourhood by value: Single integer sort
+    # of (neighbourhood, value rank) keys. Returns sorted (groups, indices)
+    order = np.argsort(values, kind="stable")
+    ranks = np.empty(len(values), dtype=np.int64)
+    ranks[order] = np.arange(len(values))
+    keys = np.sort(groups * len(values) + ranks[indices])
+    return keys // len(values), order[keys % len(values)]
+
+
+def _middle_values(sorted_values, offsets):
+    # Median of each neighbourhood, given its sorted values
+    counts = np.diff(offsets)
+    lower = offsets[:-1] + np.maximum(counts - 1, 0) // 2
+    upper = offsets[:-1] + counts // 2
+    within = counts > 0
+    result = np.full(len(counts), np.nan)
+    result[within] = (
+        sorted_values[lower[within]] + sorted_values[upper[within]]
+    ) / 2.0
+    return result
@@ -8,8 +8,14 @@ import numpy as np
 import pandas as pd
 import time
 
-from sklearn.neighbors.kde import KernelDensity
-from .utils import WeightedKernelDensityEstimation
+from .utils import (
+    kde_engines,
+    kde_tolerance,
+    get_grid_indices,
+    get_bandwidth_suffix,
+)
+from ..osm.utils import get_structure_association
+from ..osm.surface import landuse_m2_column
 
 from osmnx import log
 
@@ -23,32 +29,67 @@ def metric_phi_entropy(x, y):
         Shannon's entropy metric
         Based on article "Comparing measures of urban land use mix, 2013"
 
+        Element-wise for array inputs
+
         Parameters
         ----------
-        x : float
+        x : float or np.array
                 probability related to land use X
-        y : float
+        y : float or np.array
                 probability related to land use Y
 
         Returns
         ----------
-        float
+        float or np.array
                 entropy value
         """
-    # Undefined for negative values
-    if x < 0 or y < 0:
-        return np.nan
+    x, y = np.asarray(x, dtype=float), np.asarray(y, dtype=float)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        # Sum = 1
+        x_, y_ = x / (x + y), y / (x + y)
+        phi_value = -((x_ * np.log(x_)) + (y_ * np.log(y_))) / math.log(2)
     # Entropy Index not defined for any input value equal to zero (due to logarithm)
-    if x == 0 or y == 0:
-        return 0
-    # Sum = 1
-    x_, y_ = x / (x + y), y / (x + y)
-    phi_value = -((x_ * math.log(x_)) + (y_ * math.log(y_))) / math.log(2)
-    return phi_value
+    phi_value = np.where((x == 0) | (y == 0), 0.0, phi_value)
+    # Undefined for negative values
+    phi_value = np.where((x < 0) | (y < 0), np.nan, phi_value)
+    return phi_value[()]
+
+
+def metric_categories_entropy(P):
+    """
+        Shannon's entropy metric over k land use categories, normalized by
+        log(k) to lie between [0;1]
+        Categories with null probability do not contribute (0 log 0 = 0)
+
+        Parameters
+        ----------
+        P : np.array
+                probabilities related to each land use category (points,
+        categories)
+
+        Returns
+        ----------
+        np.array
+                entropy value of each point
+        """
+    P = np.asarray(P, dtype=float)
+    k = P.shape[1]
+    if k < 2:
+        return np.zeros(len(P))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        # Sum = 1
+        P_ = P / np.sum(P, axis=1, keepdims=True)
+        terms = np.where(P_ > 0, P_ * np.log(P_), 0.0)
+    entropy = -np.sum(terms, axis=1) / math.log(k)
+    # Null densities: No mix
+    entropy = np.where(np.sum(P, axis=1) == 0, 0.0, entropy)
+    # Undefined for negative values
+    return np.where(np.any(P < 0, axis=1), np.nan, entropy)
 
 
 # Assign land use mix method
 _land_use_mix = metric_phi_entropy
+_land_use_categories_mix = metric_categories_entropy
 
 ##############################################################
 # Land use mix indices calculation
@@ -64,11 +105,19 @@ def compute_grid_landusemix(
         "compute_activity_types_kde": True,
         "weighted_kde": True,
         "pois_weight": 9,
-        "log_weighted": True
+        "log_weighted": True,
+        "kde_engine": "exact",
+        "kde_tolerance": kde_tolerance,
+        "kde_n_jobs": None,
+        "kde_float32": False,
     },
 ):
     """
         Calculate land use mix indices on input grid
+        Adds the density columns (`<land use>_pdf`), the land use mix between
+        residential and activity uses (`landusemix`), its intensity
+        (`landuse_intensity`) and the mix among residential and each activity
+        category (`landusemix_categories`)
 
         Parameters
         ----------
@@ -80,8 +129,11 @@ def compute_grid_landusemix(
                 data frame containing the points' of interest geometries
         kw_args: dict
                 additional keyword arguments for the indices calculation
-                        walkable_distance : int
+                        walkable_distance : int or list
                                 the bandwidth assumption for Kernel Density Estimation calculations (meters)
+        Given a list of bandwidths, indices of every bandwidth are computed
+        in a single estimation, suffixed with the bandwidth (e.g.
+        `landusemix_600`, see compute_grid_landusemix_sweep)
                         compute_activity_types_kde : bool
                                 determines if the densities for each activity type should be computed
                         weighted_kde : bool
@@ -90,6 +142,19 @@ def compute_grid_landusemix(
                                 Points of interest weight equivalence with buildings (squared meter)
                         log_weighted : bool
                                 apply natural logarithmic function to surface weights
+                        kde_engine : string
+                                Kernel Density Estimation engine: 'exact'
+        (separable on regular grids, all pairwise distances otherwise),
+        'tree' (truncated neighbourhoods), or 'fft' (binned FFT convolution on
+        regular grids, see BinnedFFTKernelDensityEstimation)
+                        kde_tolerance : float
+                                neglected kernel values (relative to its
+        maximum) of the 'tree' and 'fft' engines
+                        kde_n_jobs : int
+                                number of threads evaluating the kernel
+        (None: all the cores)
+                        kde_float32 : bool
+                                compute the kernel values in single precision
 
         Returns
         ----------
@@ -103,143 +168,123 @@ def compute_grid_landusemix(
     bandwidth = kw_args["walkable_distance"]
     # Compute a weighted KDE?
     weighted_kde = kw_args["weighted_kde"]
-    X_weights = None
+    kde_engine = kw_args.get("kde_engine", "exact")
+    tolerance = kw_args.get("kde_tolerance", kde_tolerance)
+    n_jobs = kw_args.get("kde_n_jobs")
+    dtype = np.float32 if kw_args.get("kde_float32") else np.float64
 
-    # Get full list of contained POIs
-    contained_pois = list(
-        set(
-            [
-                element
-                for list_ in df_osm_built.containing_poi[
-                    df_osm_built.containing_poi.notnull()
-                ]
-                for element in list_
-            ]
-        )
-    )
     # Get the POIs not contained by any building
+    contained_pois = get_structure_association(
+        df_osm_built, "containing_poi", df_osm_pois
+    ).indices
     df_osm_pois_not_contained = df_osm_pois[
-        ~df_osm_pois.index.isin(contained_pois)
+        ~np.isin(np.arange(len(df_osm_pois)), contained_pois)
     ]
 
     ############
     # Calculate land use density estimations
     ############
+    # Every density is estimated in a single pass: Each one is given by a
+    # column of the sources weights matrix (zero for non-member sources)
 
     ####
-    # Residential
+    # Residential and activities
     ####
-    df_osm_built_indexed = df_osm_built[
-        df_osm_built.classification.isin(["residential", "mixed"])
-    ]
-    if weighted_kde:
-        X_weights = df_osm_built_indexed.landuses_m2.apply(
-            lambda x: x["residential"]
-        )
-
-    df_indices["residential_pdf"] = calculate_kde(
-        df_indices.geometry,
-        df_osm_built_indexed,
-        None,
-        bandwidth,
-        X_weights,
-        kw_args["pois_weight"],
-        kw_args["log_weighted"],
+    densities = ["residential", "activity"]
+    built_membership = np.column_stack(
+        [
+            df_osm_built.classification.isin(["residential", "mixed"]).values,
+            df_osm_built.classification.isin(["activity", "mixed"]).values,
+        ]
     )
-    log("Residential density estimation done")
-
-    ####
-    # Activities
-    ####
-    df_osm_built_indexed = df_osm_built[
-        df_osm_built.classification.isin(["activity", "mixed"])
-    ]
     df_osm_pois_not_cont_indexed = df_osm_pois_not_contained[
         df_osm_pois_not_contained.classification.isin(["activity", "mixed"])
     ]
-    if weighted_kde:
-        X_weights = df_osm_built_indexed.landuses_m2.apply(
-            lambda x: x["activity"]
-        )
-
-    df_indices["activity_pdf"] = calculate_kde(
-        df_indices.geometry,
-        df_osm_built_indexed,
-        df_osm_pois_not_cont_indexed,
-        bandwidth,
-        X_weights,
-        kw_args["pois_weight"],
-        kw_args["log_weighted"],
+    pois_membership = np.column_stack(
+        [
+            np.zeros(len(df_osm_pois_not_cont_indexed), dtype=bool),
+            np.ones(len(df_osm_pois_not_cont_indexed), dtype=bool),
+        ]
     )
-    log("Activity density estimation done")
 
     ####
-    # Compute activity types densities
+    # Activity types
     ####
     if kw_args["compute_activity_types_kde"]:
         assert "activity_category" in df_osm_built.columns
 
         # Get unique category values
-        unique_categories_built = [
-            list(x)
-            for x in set(
-                tuple(x)
-                for x in df_osm_built.activity_category.values
-                if isinstance(x, list)
-            )
-        ]
-        unique_categories_pois = [
-            list(x)
-            for x in set(
-                tuple(x)
-                for x in df_osm_pois_not_cont_indexed.activity_category.values
-                if isinstance(x, list)
-            )
-        ]
-        flat_list = [
-            item
-            for sublist in unique_categories_built + unique_categories_pois
-            for item in sublist
-        ]
-        categories = list(set(flat_list))
-
-        for cat in categories:  # Get data frame selection of input category
-            # Buildings and POIs within that category
-            df_built_category = df_osm_built_indexed[
-                df_osm_built_indexed.activity_category.apply(
-                    lambda x: (isinstance(x, list)) and (cat in x)
-                )
+        categories = sorted(
+            set(get_activity_categories(df_osm_built))
+            | set(get_activity_categories(df_osm_pois_not_cont_indexed))
+        )
+        densities += categories
+        # Activity buildings and POIs within each category
+        built_membership = np.column_stack(
+            [
+                built_membership,
+                get_activity_categories_membership(df_osm_built, categories)
+                & built_membership[:, [1]],
             ]
-            df_pois_category = df_osm_pois_not_cont_indexed[
-                df_osm_pois_not_cont_indexed.activity_category.apply(
-                    lambda x: (isinstance(x, list)) and (cat in x)
-                )
+        )
+        pois_membership = np.column_stack(
+            [
+                pois_membership,
+                get_activity_categories_membership(
+                    df_osm_pois_not_cont_indexed, categories
+                ),
             ]
-            if weighted_kde:
-                X_weights = df_built_category.landuses_m2.apply(
-                    lambda x: x[cat]
-                )
-
-            df_indices[cat + "_pdf"] = calculate_kde(
-                df_indices.geometry,
-                df_built_category,
-                df_pois_category,
-                bandwidth,
-                X_weights,
-                kw_args["pois_weight"],
-                kw_args["log_weighted"],
-            )
-
-        log("Activity grouped by types density estimation done")
+        )
 
-        # Compute land use mix indices
-    index_column = "landusemix"
-    df_indices[index_column] = df_indices.apply(
-        lambda x: _land_use_mix(x.activity_pdf, x.residential_pdf), axis=1
+    # Sources weights
+    if weighted_kde:
+        built_weights = df_osm_built[
+            [landuse_m2_column(density) for density in densities]
+        ].values.astype(float)
+        pois_weights = kw_args["pois_weight"]
+    else:
+        built_weights, pois_weights = 1.0, 1.0
+    X_W = np.concatenate(
+        [
+            np.where(built_membership, built_weights, 0.0),
+            np.where(pois_membership, pois_weights, 0.0),
+        ]
+    )
+    if weighted_kde and kw_args["log_weighted"]:  # Apply logarithm
+        membership = np.concatenate([built_membership, pois_membership])
+        X_W = np.log(np.where(membership, X_W, 1.0))
+    X = np.concatenate(
+        [
+            get_centroids_coordinates(df_osm_built),
+            get_centroids_coordinates(df_osm_pois_not_cont_indexed),
+        ]
     )
-    df_indices["landuse_intensity"] = df_indices.apply(
-        lambda x: (x.activity_pdf + x.residential_pdf) / 2.0, axis=1
+    # Drop sources not involved in any density
+    sources = np.concatenate([built_membership, pois_membership]).any(axis=1)
+
+    PDFs = calculate_multiple_kde(
+        df_indices.geometry,
+        X[sources],
+        pd.DataFrame(
+            X_W[sources], columns=[density + "_pdf" for density in densities]
+        ),
+        bandwidth,
+        kde_engine,
+        tolerance,
+        n_jobs,
+        dtype,
+        get_indices_grid_location(df_indices),
     )
+    log("Land use density estimations done")
+
+    # Compute land use mix indices
+    if np.ndim(bandwidth) == 0:
+        set_landusemix_indices(df_indices, PDFs, densities)
+    else:  # Bandwidths sweep
+        for bw, PDFs_bw in PDFs.items():
+            set_landusemix_indices(
+                df_indices, PDFs_bw, densities, get_bandwidth_suffix(bw)
+            )
 
     log(
         "Done: Land use mix indices. Elapsed time (H:M:S): "
@@ -247,6 +292,79 @@ def compute_grid_landusemix(
     )
 
 
+def compute_grid_landusemix_sweep(
+    df_indices, df_osm_built, df_osm_pois, bandwidths, kw_args
+):
+    """
+        Calculate land use mix indices on input grid for several bandwidths
+        (walkable distances) in a single estimation: The distances between
+        sources and grid points are shared by all the bandwidths
+        Columns are suffixed with the bandwidth (e.g. `landusemix_600`,
+        `residential_pdf_600`)
+
+        Parameters
+        ----------
+        df_indices : geopandas.GeoDataFrame
+                data frame containing the (x,y) reference points to calculate indices
+        df_osm_built : geopandas.GeoDataFrame
+                data frame containing the building's geometries
+        df_osm_pois : geopandas.GeoDataFrame
+                data frame containing the points' of interest geometries
+        bandwidths : list
+                bandwidths (meters)
+        kw_args: dict
+                additional keyword arguments for the indices calculation (see
+        compute_grid_landusemix). walkable_distance is ignored
+
+        Returns
+        ----------
+
+        """
+    kw_args = dict(kw_args, walkable_distance=list(bandwidths))
+    compute_grid_landusemix(df_indices, df_osm_built, df_osm_pois, kw_args)
+
+
+def set_landusemix_indices(df_indices, PDFs, densities, suffix=""):
+    """
+        Set the densities and land use mix indices columns
+
+        Parameters
+        ----------
+        df_indices : geopandas.GeoDataFrame
+                data frame containing the (x,y) reference points to calculate indices
+        PDFs : pandas.DataFrame
+                densities (`<density>_pdf` columns)
+        densities : list
+                land uses: residential, activity, then each activity category
+        suffix : string
+                suffix of the columns
+
+        Returns
+        ----------
+
+        """
+    for column in PDFs.columns:
+        df_indices[column + suffix] = PDFs[column].values
+
+    activity_pdf = PDFs["activity_pdf"].values
+    residential_pdf = PDFs["residential_pdf"].values
+    index_column = "landusemix"
+    df_indices[index_column + suffix] = _land_use_mix(
+        activity_pdf, residential_pdf
+    )
+    df_indices["landuse_intensity" + suffix] = (
+        activity_pdf + residential_pdf
+    ) / 2.0
+    # Mix among residential and each activity category (if computed)
+    categories_columns = [
+        density + "_pdf"
+        for density in ["residential"] + (densities[2:] or ["activity"])
+    ]
+    df_indices[
+        index_column + "_categories" + suffix
+    ] = _land_use_categories_mix(PDFs[categories_columns].values)
+
+
 ####
 
 
@@ -258,6 +376,8 @@ def calculate_kde(
     X_weights=None,
     pois_weight=9,
     log_weight=True,
+    kde_engine="exact",
+    tolerance=kde_tolerance,
 ):
     """
         Evaluate the probability density function using Kernel Density Estimation of input geo-localized data
@@ -280,6 +400,10 @@ def calculate_kde(
                 weight assigned to points of interest
         log_weight : bool
                 if indicated, applies a log transformation to input weight values
+        kde_engine : string
+                Kernel Density Estimation engine (see sprawl.utils.kde_engines)
+        tolerance : float
+                neglected kernel values (relative to its maximum)
 
         Returns
         ----------
@@ -287,19 +411,19 @@ def calculate_kde(
 
         """
     # X_b : Buildings array
-    X_b = [[p.x, p.y] for p in df_osm_built.geometry.centroid.values]
+    X_b = get_centroids_coordinates(df_osm_built)
 
     # X_p : Points array
     if df_osm_pois is None:
-        X_p = []
+        X_p = np.empty((0, 2))
     else:
-        X_p = [[p.x, p.y] for p in df_osm_pois.geometry.centroid.values]
+        X_p = get_centroids_coordinates(df_osm_pois)
 
     # X : Full array
-    X = np.array(X_b + X_p)
+    X = np.concatenate([X_b, X_p])
 
     # Points where the probability density function will be evaluated
-    Y = np.array([[p.x, p.y] for p in points.values])
+    Y = np.column_stack([points.x.values, points.y.values])
 
     if not (X_weights is None):  # Weighted Kernel Density Estimation
         # Building's weight + POIs weight
@@ -309,12 +433,169 @@ def calculate_kde(
 
         if log_weight:  # Apply logarithm
             X_W = np.log(X_W)
+    else:  # Kernel Density Estimation: Unit weights
+        X_W = np.ones(len(X))
+
+    PDF = kde_engines[kde_engine](X, X_W, bandwidth, Y, tolerance=tolerance)
+    return pd.Series(PDF / PDF.max())
+
+
+def calculate_multiple_kde(
+    points,
+    X,
+    X_weights,
+    bandwidth=400,
+    kde_engine="exact",
+    tolerance=kde_tolerance,
+    n_jobs=None,
+    dtype=np.float64,
+    grid=None,
+):
+    """
+        Evaluate several probability density functions in a single Kernel
+        Density Estimation pass: Kernel values between input sources and
+        reference points are shared by all the densities
+
+        Parameters
+        ----------
+        points : geopandas.GeoSeries
+                reference points to calculate indices
+        X : np.array
+                sources coordinates
+        X_weights : pandas.DataFrame
+                weight of each source, one column per density (zero for
+        sources not involved in a density)
+        bandwidth: int or list
+                bandwidth value to be employed on the Kernel Density Estimation
+        (or list of bandwidths, sharing the distances computation)
+        kde_engine : string
+                Kernel Density Estimation engine (see sprawl.utils.kde_engines)
+        tolerance : float
+                neglected kernel values (relative to its maximum)
+        n_jobs : int
+                number of threads evaluating the kernel (None: all the cores)
+        dtype : numpy.dtype
+                computation precision of the kernel values
+        grid : tuple
+                location of the reference points on a regular grid (see
+        sprawl.utils.get_grid_indices)
+
+        Returns
+        ----------
+        pandas.DataFrame or dict
+                densities rescaled between [0;1], with the columns of input
+        weights (for a list of bandwidths, a dict of the densities of each
+        bandwidth)
+        """
+    # Points where the probability density functions will be evaluated
+    Y = np.column_stack([points.x.values, points.y.values])
+
+    PDFs = kde_engines[kde_engine](
+        X,
+        X_weights,
+        bandwidth,
+        Y,
+        tolerance=tolerance,
+        n_jobs=n_jobs,
+        dtype=dtype,
+        grid=grid,
+    )
+    if isinstance(PDFs, dict):
+        return {bw: PDFs_bw / PDFs_bw.max() for bw, PDFs_bw in PDFs.items()}
+    return PDFs / PDFs.max()
+
 
-        PDF = WeightedKernelDensityEstimation(X, X_W, bandwidth, Y)
-        return pd.Series(PDF / PDF.max())
-    else:  # Kernel Density Estimation
-        # Sklearn
-        kde = KernelDensity(kernel="gaussian", bandwidth=bandwidth).fit(X)
-        # Sklearn returns the results in the form log(density)
-        PDF = np.exp(kde.score_samples(Y))
-        return pd.Series(PDF / PDF.max())
+def get_indices_grid_location(df_indices):
+    """
+        Location of the reference points on their regular grid, given by the
+        integer `row` and `col` columns (see get_indices_grid_from_bbox)
+
+        Parameters
+        ----------
+        df_indices : geopandas.GeoDataFrame
+                reference points
+
+        Returns
+        ----------
+        tuple
+                grid location (see sprawl.utils.get_grid_indices), or None if
+        the points do not carry consistent grid indices
+        """
+    if not {"row", "col"}.issubset(df_indices.columns):
+        return None
+    return get_grid_indices(
+        np.column_stack(
+            [df_indices.geometry.x.values, df_indices.geometry.y.values]
+        ),
+        df_indices["col"].values,
+        df_indices["row"].values,
+    )
+
+
+def get_centroids_coordinates(df_osm):
+    """
+        Get the coordinates of the centroids of input geometries
+
+        Parameters
+        ----------
+        df_osm : geopandas.GeoDataFrame
+                input data frame
+
+        Returns
+        ----------
+        np.array
+                centroids coordinates
+        """
+    centroids = df_osm.geometry.centroid
+    return np.column_stack([centroids.x.values, centroids.y.values])
+
+
+def get_activity_categories(df_osm):
+    """
+        Get the activity categories of each row of input data frame, one
+        row per (position, category) pair
+
+        Parameters
+        ----------
+        df_osm : geopandas.GeoDataFrame
+                input data frame
+
+        Returns
+        ----------
+        pandas.Series
+                activity categories, indexed by row position
+        """
+    if "activity_category" not in df_osm.columns:
+        return pd.Series([], dtype=object)
+    return (
+        pd.Series(df_osm.activity_category.values)
+        .map(lambda x: x if isinstance(x, list) else [])
+        .explode()
+        .dropna()
+    )
+
+
+def get_activity_categories_membership(df_osm, categories):
+    """
+        Get the membership of each row of input data frame to each activity
+        category
+
+        Parameters
+        ----------
+        df_osm : geopandas.GeoDataFrame
+                input data frame
+        categories : list
+                activity categories
+
+        Returns
+        ----------
+        np.array
+                boolean matrix (rows, categories)
+        """
+    membership = np.zeros((len(df_osm), len(categories)), dtype=bool)
+    row_categories = get_activity_categories(df_osm)
+    membership[
+        row_categories.index.values,
+        pd.Index(categories).get_indexer(row_categories.values),
+    ] = True
+    return membership
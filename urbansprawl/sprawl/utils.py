@@ -7,62 +7,968 @@ import numpy as np
 import pandas as pd
 import networkx as nx
 import math
+import os
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
 from shapely.geometry import LineString
 from scipy.spatial.distance import cdist
 
+from .kernels import (
+    gaussian_density,
+    pairs_gaussian_density,
+    get_kernels_backend,
+)
 
-def WeightedKernelDensityEstimation(
-    X, Weights, bandwidth, Y, max_mb_per_chunk=1000
+
+# Default kernel tolerance: Neglected kernel values (relative to its maximum)
+kde_tolerance = 1e-8
+# Default number of threads evaluating kernel chunks (None: all the cores)
+kde_n_jobs = None
+# Fraction of the available memory shared by the chunks being evaluated
+kde_memory_fraction = 0.5
+# Minimum fraction of the evaluated grid cells covered by the points
+# (separable estimation), otherwise densities are estimated at the points
+kde_grid_fill_ratio = 0.25
+
+
+def get_kernel_cutoff(tolerance):
+    """
+    Distance, in number of bandwidths, beyond which the Gaussian kernel is
+    lower than input tolerance (relative to its maximum)
+
+    Parameters
+    ----------
+    tolerance : float
+        kernel tolerance
+
+    Returns
+    ----------
+    float
+        kernel cutoff (infinite if tolerance is not positive: no kernel
+        value is neglected)
+    """
+    if tolerance <= 0:
+        return np.inf
+    return math.sqrt(-2 * math.log(tolerance))
+
+
+def get_kde_n_jobs(n_jobs=None):
+    """
+    Number of threads evaluating kernel chunks
+
+    Parameters
+    ----------
+    n_jobs : int
+        requested number of threads (None: kde_n_jobs, or all the cores)
+
+    Returns
+    ----------
+    int
+        number of threads
+    """
+    return max(1, int(n_jobs or kde_n_jobs or os.cpu_count() or 1))
+
+
+def get_kde_chunk_megabytes(max_mb_per_chunk=None, n_jobs=1):
+    """
+    Memory budget of each kernel chunk: Unless given, a share of the
+    available memory (kde_memory_fraction) among the chunks evaluated
+    simultaneously
+
+    Parameters
+    ----------
+    max_mb_per_chunk : float
+        requested megabytes per chunk
+    n_jobs : int
+        number of chunks evaluated simultaneously
+
+    Returns
+    ----------
+    float
+        megabytes per chunk
+    """
+    if max_mb_per_chunk:
+        return max_mb_per_chunk
+    import psutil
+
+    available_mb = psutil.virtual_memory().available * 1e-6
+    return max(1.0, available_mb * kde_memory_fraction / n_jobs)
+
+
+def get_kde_chunks(
+    n_items, item_megabytes, max_mb_per_chunk, n_jobs, chunk_megabytes=0
 ):
     """
-    Computes a Weighted Kernel Density Estimation
+    Split items in chunks (at least one per thread) within the memory budget
+
+    Parameters
+    ----------
+    n_items : int
+        number of items
+    item_megabytes : float
+        megabytes allocated for each item
+    max_mb_per_chunk : float
+        megabytes per chunk
+    n_jobs : int
+        number of threads
+    chunk_megabytes : float
+        megabytes allocated for each chunk, regardless of its number of
+        items (e.g. output grids)
+
+    Returns
+    ----------
+    list
+        slices of the items of each chunk
+    """
+    items_mb_per_chunk = max(max_mb_per_chunk - chunk_megabytes, item_megabytes)
+    n_chunks = max(
+        n_jobs, int(math.ceil(n_items * item_megabytes / items_mb_per_chunk))
+    )
+    n_chunks = max(1, min(n_chunks, n_items))
+    bounds = np.linspace(0, n_items, n_chunks + 1).astype(int)
+    return [slice(start, end) for start, end in zip(bounds[:-1], bounds[1:])]
+
+
+def map_kde_chunks(function, chunks, n_jobs, accumulate):
+    """
+    Evaluate input function on each chunk, on a thread pool
+    NumPy / SciPy kernels (exp, matrix products, KD-tree queries) release
+    the GIL
+
+    Results are accumulated (in the calling thread) as soon as each chunk
+    is evaluated: At most n_jobs chunk results are held simultaneously
+
+    Parameters
+    ----------
+    function : function
+        function evaluated on each chunk
+    chunks : list
+        chunks
+    n_jobs : int
+        number of threads
+    accumulate : function
+        function called with each chunk and its result
+
+    Returns
+    ----------
+
+    """
+    if n_jobs == 1 or len(chunks) <= 1:
+        for chunk in chunks:
+            accumulate(chunk, function(chunk))
+        return
+    n_jobs = min(n_jobs, len(chunks))
+    pending = {}
+
+    def accumulate_completed():
+        done, _ = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            accumulate(pending.pop(future), future.result())
+
+    with ThreadPoolExecutor(n_jobs) as executor:
+        # Chunks are submitted as the previous ones are accumulated
+        for chunk in chunks:
+            if len(pending) == n_jobs:
+                accumulate_completed()
+            pending[executor.submit(function, chunk)] = chunk
+        while pending:
+            accumulate_completed()
+
+
+def gaussian_exp(values):
+    """
+    In place exponential of input (non-positive) kernel exponents
+
+    In single precision, far kernel values would be subnormal numbers,
+    which slow down exponentials and matrix products by several times:
+    Results below the square root of the smallest normal number are set to
+    zero (up to rounding), and the others shifted by that value
+
+    Parameters
+    ----------
+    values : np.array
+        kernel exponents
+
+    Returns
+    ----------
+    np.array
+        input array, containing the kernel values
+    """
+    if values.dtype == np.float64:
+        return np.exp(values, out=values)
+    floor = np.log(np.finfo(values.dtype).tiny) / 2
+    np.maximum(values, floor, out=values)
+    np.exp(values, out=values)
+    values -= values.dtype.type(math.exp(floor))
+    return values
+
+
+def get_squared_distances(Y, X, dtype=np.float64):
+    """
+    Squared euclidean distances between input points
 
     Parameters
     ----------
+    Y : array
+        points where density estimations will be performed
     X : array
         input points
-    Weights : array
-        array of weights associated to points
+    dtype : numpy.dtype
+        computation precision. Single precision distances are obtained from
+        the coordinates, relative to the input points centre
+
+    Returns
+    ----------
+    np.array
+        squared distances (Y, X)
+    """
+    if np.dtype(dtype) == np.float64:
+        return cdist(Y, X, "sqeuclidean")
+    centre = X.mean(axis=0) if len(X) else 0
+    X, Y = (X - centre).astype(dtype), (Y - centre).astype(dtype)
+    D2 = (
+        np.sum(Y ** 2, axis=1)[:, np.newaxis]
+        + np.sum(X ** 2, axis=1)
+        - 2 * Y @ X.T
+    )
+    return np.maximum(D2, 0, out=D2)
+
+
+def get_bandwidths(bandwidth):
+    """
+    Bandwidths of an estimation: A single bandwidth, or a sweep over a
+    sequence of bandwidths
+
+    Parameters
+    ----------
+    bandwidth : float or list
+        bandwidth(s) for kernel density estimation
+
+    Returns
+    ----------
+    np.array
+        bandwidths
+    """
+    return np.atleast_1d(np.asarray(bandwidth, dtype=float))
+
+
+def get_bandwidth_suffix(bandwidth):
+    """
+    Suffix of the columns computed for input bandwidth (or search radius)
+
+    Parameters
+    ----------
     bandwidth : float
-        bandwidth for kernel density estimation
+        bandwidth
+
+    Returns
+    ----------
+    string
+        columns suffix
+    """
+    if float(bandwidth).is_integer():
+        return "_" + str(int(bandwidth))
+    return "_" + str(bandwidth)
+
+
+def get_weights_matrix(Weights):
+    """
+    Weights of input points as a matrix (one column per estimated density),
+    each column normalized to sum 1
+
+    Parameters
+    ----------
+    Weights : array or pandas.DataFrame
+        weights associated to points: one column per density (a single
+        density for 1-dimensional weights)
+
+    Returns
+    ----------
+    np.array
+        normalized weights matrix
+    """
+    Weights = np.asarray(Weights, dtype=float)
+    Weights = Weights.reshape(len(Weights), -1)
+    return Weights / np.sum(Weights, axis=0)
+
+
+def get_densities_output(PDF, Weights):
+    """
+    Rescale the estimated densities (one column per density) and format
+    them according to the input weights
+
+    Parameters
+    ----------
+    PDF : np.array
+        estimated densities matrix
+    Weights : array or pandas.DataFrame
+        weights associated to points, as given to the estimation
+
+    Returns
+    ----------
+    pd.Series or pd.DataFrame
+        estimated densities (a pd.Series for 1-dimensional weights, a
+        pd.DataFrame with the columns of input weights otherwise)
+    """
+    PDF = PDF / np.sum(PDF, axis=0)
+    if np.ndim(Weights) == 1:
+        return pd.Series(PDF[:, 0])
+    return pd.DataFrame(PDF, columns=getattr(Weights, "columns", None))
+
+
+def get_bandwidths_output(PDFs, Weights, bandwidth):
+    """
+    Rescale and format the estimated densities of each bandwidth
+
+    Parameters
+    ----------
+    PDFs : np.array
+        estimated densities matrix of each bandwidth (bandwidths, Y,
+        densities)
+    Weights : array or pandas.DataFrame
+        weights associated to points, as given to the estimation
+    bandwidth : float or list
+        bandwidth(s), as given to the estimation
+
+    Returns
+    ----------
+    pd.Series, pd.DataFrame or dict
+        estimated densities (see get_densities_output). For a sequence of
+        bandwidths, a dict of the estimated densities of each bandwidth
+    """
+    if np.ndim(bandwidth) == 0:
+        return get_densities_output(PDFs[0], Weights)
+    return {
+        bw: get_densities_output(PDF, Weights)
+        for bw, PDF in zip(bandwidth, PDFs)
+    }
+
+
+def WeightedKernelDensityEstimation(
+    X,
+    Weights,
+    bandwidth,
+    Y,
+    max_mb_per_chunk=None,
+    tolerance=kde_tolerance,
+    n_jobs=None,
+    dtype=np.float64,
+    backend=None,
+    grid=None,
+):
+    """
+    Computes the exact Weighted Kernel Density Estimation
+
+    If the location of Y on a regular grid is given, the separable
+    computation is used (see SeparableKernelDensityEstimation). Otherwise,
+    all pairwise distances are computed: truncated kernels are only used by
+    TreeKernelDensityEstimation
+
+    Several densities can be estimated in a single pass, given one weights
+    column per density
+
+    Parameters
+    ----------
+    X : array
+        input points
+    Weights : array or pandas.DataFrame
+        array of weights associated to points (or matrix, one column per
+        density)
+    bandwidth : float or list
+        bandwidth for kernel density estimation. Given a sequence, the
+        densities of every bandwidth are estimated sharing the distances
     Y : array
         points where density estimations will be performed
+    max_mb_per_chunk : float
+        maximum megabytes allocated for distances / kernel values of each
+        chunk (by default, derived from the available memory)
+    tolerance : float
+        ignored: no kernel value is neglected
+    n_jobs : int
+        number of threads evaluating the chunks (None: all the cores)
+    dtype : numpy.dtype
+        computation precision (e.g. np.float32)
+    backend : string
+        kernels backend for all pairwise distances (see
+        kernels.get_kernels_backend). The compiled kernel fuses distances,
+        kernel values and accumulation, in double precision
+    grid : tuple
+        location of Y on a regular grid (see get_grid_indices). If None,
+        Y are arbitrary points
 
     Returns
     ----------
-    pd.Series
-        returns an array of the estimated densities rescaled between [0;1]
+    pd.Series or pd.DataFrame
+        returns the estimated densities rescaled between [0;1] (one column
+        per density for a weights matrix). For a sequence of bandwidths, a
+        dict of the densities of each bandwidth
     """
+    if grid is not None:
+        return SeparableKernelDensityEstimation(
+            X,
+            Weights,
+            bandwidth,
+            Y,
+            max_mb_per_chunk,
+            grid=grid,
+            n_jobs=n_jobs,
+            dtype=dtype,
+        )
+
+    X = np.asarray(X, dtype=float).reshape(-1, 2)
+    Y = np.asarray(Y, dtype=float).reshape(-1, 2)
+    bandwidths = get_bandwidths(bandwidth)
+    if get_kernels_backend(backend) == "numba":
+        PDFs = np.stack(
+            [
+                gaussian_density(Y, X, get_weights_matrix(Weights), bw)
+                for bw in bandwidths
+            ]
+        )
+        return get_bandwidths_output(PDFs, Weights, bandwidth)
 
-    def get_megabytes_pairwise_distances_allocation(X, Y):
-        # Calculate MB needed to allocate pairwise distances
-        return len(X) * len(Y) * 8 * 1e-6
+    W = get_weights_matrix(Weights).astype(dtype)
+    n_jobs = get_kde_n_jobs(n_jobs)
 
     # During this procedure, pairwise euclidean distances
     # are computed between inputs points X and points to estimate Y
     # For this reason, Y is divided in chunks to avoid big memory allocations
     # At most, X megabytes per chunk are allocated for pairwise distances
-    Y_split = np.array_split(
-        Y,
-        math.ceil(
-            get_megabytes_pairwise_distances_allocation(X, Y)
-            / max_mb_per_chunk
-        ),
+    # Distances and kernel values are allocated simultaneously, together
+    # with the densities of the chunk
+    Y_split = get_kde_chunks(
+        len(Y),
+        (
+            2 * len(X) * np.dtype(dtype).itemsize
+            + len(bandwidths) * W.shape[1] * 8
+        )
+        * 1e-6,
+        get_kde_chunk_megabytes(max_mb_per_chunk, n_jobs),
+        n_jobs,
     )
 
+    def get_chunk_densities(Y_i):
+        # Distances are shared by every bandwidth
+        D2 = get_squared_distances(Y[Y_i], X, dtype)
+        return np.stack(
+            [gaussian_exp(D2 * (-0.5 / bw ** 2)) @ W for bw in bandwidths]
+        )
+
     # Divide Y in chunks to avoid big memory allocations
-    PDF = np.concatenate(
-        [
-            np.sum(
-                np.exp(-0.5 * (cdist(Y_i, X, "euclidean") / bandwidth) ** 2)
-                * (np.array(Weights / np.sum(Weights))),
-                axis=1,
+    PDFs = np.zeros((len(bandwidths), len(Y), W.shape[1]))
+
+    def set_chunk_densities(Y_i, densities):
+        PDFs[:, Y_i] = densities
+
+    map_kde_chunks(get_chunk_densities, Y_split, n_jobs, set_chunk_densities)
+    # Rescale
+    return get_bandwidths_output(PDFs, Weights, bandwidth)
+
+
+def get_grid_indices(Y, cols, rows, tolerance=1e-6):
+    """
+    Locate input points on a regular (square) grid, given their integer
+    column and row indices (e.g. get_indices_grid_from_bbox)
+    Points may cover only part of the grid (e.g. grid with holes)
+
+    Parameters
+    ----------
+    Y : array
+        points to locate
+    cols : array
+        column index of each point
+    rows : array
+        row index of each point
+    tolerance : float
+        tolerance, relative to the grid step, of the points location
+
+    Returns
+    ----------
+    tuple
+        column and row indices of each point (relative to the lowest ones),
+        grid step and grid origin (None if input points do not lie on the
+        grid defined by their indices)
+    """
+    Y = np.asarray(Y, dtype=float).reshape(-1, 2)
+    cols, rows = np.asarray(cols), np.asarray(rows)
+    if len(Y) == 0:
+        return None
+    cols, rows = cols - cols.min(), rows - rows.min()
+    if cols.max() > 0:
+        step = np.ptp(Y[:, 0]) / cols.max()
+    elif rows.max() > 0:
+        step = np.ptp(Y[:, 1]) / rows.max()
+    else:  # Single grid point
+        return None
+    if not step > 0:
+        return None
+    indices = np.column_stack([cols, rows])
+    origin = np.mean(Y - step * indices, axis=0)
+    if np.abs((Y - origin) / step - indices).max() > tolerance:
+        return None
+    return cols.astype(np.int64), rows.astype(np.int64), step, origin
+
+
+def TreeKernelDensityEstimation(
+    X,
+    Weights,
+    bandwidth,
+    Y,
+    max_mb_per_chunk=None,
+    tolerance=kde_tolerance,
+    n_jobs=None,
+    dtype=np.float64,
+    backend=None,
+    grid=None,
+):
+    """
+    Computes a Weighted Kernel Density Estimation at arbitrary points,
+    accumulating only the contributions of the points within the kernel
+    cutoff (KD-tree neighbour search)
+
+    Each neglected contribution is lower than tolerance times its weight:
+    the absolute error on the (normalized) densities is lower than tolerance
+
+    With the 'numba' kernels backend, kernel values are accumulated from the
+    neighbouring pairs by a compiled kernel (see
+    kernels.pairs_gaussian_density), skipping the pairs beyond the cutoff of
+    each bandwidth
+
+    Parameters
+    ----------
+    X : array
+        input points
+    Weights : array or pandas.DataFrame
+        array of weights associated to points (or matrix, one column per
+        density)
+    bandwidth : float or list
+        bandwidth for kernel density estimation. Given a sequence, the
+        densities of every bandwidth are estimated sharing the distances
+    Y : array
+        points where density estimations will be performed
+    max_mb_per_chunk : float
+        maximum megabytes allocated for the neighbouring pairs of a chunk of
+        points Y, estimated from the average number of neighbours (by
+        default, derived from the available memory)
+    tolerance : float
+        neglected kernel values (relative to its maximum). If 0, no kernel
+        value is neglected: all pairwise distances are computed (see
+        WeightedKernelDensityEstimation)
+    n_jobs : int
+        number of threads evaluating the chunks (None: all the cores)
+    dtype : numpy.dtype
+        computation precision of the kernel values (e.g. np.float32). The
+        compiled kernel computes in double precision
+    backend : string
+        kernels backend (see kernels.get_kernels_backend)
+    grid : tuple
+        ignored: points are not required to lie on a grid
+
+    Returns
+    ----------
+    pd.Series or pd.DataFrame
+        returns the estimated densities rescaled between [0;1] (one column
+        per density for a weights matrix). For a sequence of bandwidths, a
+        dict of the densities of each bandwidth
+    """
+    from scipy.spatial import cKDTree
+    from scipy.sparse import csr_matrix
+
+    if not np.isfinite(get_kernel_cutoff(tolerance)):
+        # No cutoff: Every pairwise distance is needed
+        return WeightedKernelDensityEstimation(
+            X,
+            Weights,
+            bandwidth,
+            Y,
+            max_mb_per_chunk,
+            n_jobs=n_jobs,
+            dtype=dtype,
+            backend=backend,
+        )
+
+    X = np.asarray(X, dtype=float).reshape(-1, 2)
+    Y = np.asarray(Y, dtype=float).reshape(-1, 2)
+    W = get_weights_matrix(Weights).astype(dtype)
+    bandwidths = get_bandwidths(bandwidth)
+    # Neighbourhoods of the largest bandwidth are shared by every bandwidth
+    cutoffs = get_kernel_cutoff(tolerance) * bandwidths
+    cutoff = cutoffs.max()
+    compiled = get_kernels_backend(backend) == "numba"
+
+    tree_X = cKDTree(X)
+    n_jobs = get_kde_n_jobs(n_jobs)
+    # Chunks of Y: Bounded number of neighbouring pairs (24 bytes each),
+    # and densities of the chunk
+    sample = Y[:: max(1, len(Y) // 100)]
+    mean_neighbours = max(
+        1.0,
+        np.mean(tree_X.query_ball_point(sample, cutoff, return_length=True)),
+    )
+    Y_split = get_kde_chunks(
+        len(Y),
+        (mean_neighbours * 24 + len(bandwidths) * W.shape[1] * 8) * 1e-6,
+        get_kde_chunk_megabytes(max_mb_per_chunk, n_jobs),
+        n_jobs,
+    )
+
+    def get_chunk_densities(Y_i):
+        Y_i = Y[Y_i]
+        pairs = cKDTree(Y_i).sparse_distance_matrix(
+            tree_X, cutoff, output_type="ndarray"
+        )
+        if compiled:
+            return pairs_gaussian_density(
+                len(Y_i),
+                pairs["i"],
+                pairs["j"],
+                pairs["v"],
+                W,
+                bandwidths,
+                cutoffs,
+            )
+        # Sparse kernel matrices (Y_i, X) layout: Pairs sorted by row
+        order = np.argsort(pairs["i"], kind="stable")
+        indices, distances = pairs["j"][order], pairs["v"][order]
+        indptr = np.zeros(len(Y_i) + 1, dtype=np.int64)
+        indptr[1:] = np.cumsum(np.bincount(pairs["i"], minlength=len(Y_i)))
+
+        densities = []
+        for bw in bandwidths:
+            # Kernel values are shared by every density
+            kernel = csr_matrix(
+                (
+                    np.exp(-0.5 * (distances / bw) ** 2).astype(dtype),
+                    indices,
+                    indptr,
+                ),
+                shape=(len(Y_i), len(X)),
             )
-            for Y_i in Y_split
-        ]
+            densities.append(kernel @ W)
+        return np.stack(densities)
+
+    PDFs = np.zeros((len(bandwidths), len(Y), W.shape[1]))
+
+    def set_chunk_densities(Y_i, densities):
+        PDFs[:, Y_i] = densities
+
+    map_kde_chunks(get_chunk_densities, Y_split, n_jobs, set_chunk_densities)
+    # Rescale
+    return get_bandwidths_output(PDFs, Weights, bandwidth)
+
+
+def SeparableKernelDensityEstimation(
+    X,
+    Weights,
+    bandwidth,
+    Y,
+    max_mb_per_chunk=None,
+    grid=None,
+    n_jobs=None,
+    dtype=np.float64,
+    tolerance=0,
+):
+    """
+    Computes the exact Weighted Kernel Density Estimation on a regular grid
+
+    The Gaussian kernel factorises into x and y terms: the densities on a
+    block of grid cells are the product of the (weighted) x kernel values
+    and the y kernel values of the input points, contracted for every
+    density at once. Kernel evaluations drop from N * nx * ny to
+    N * (nx + ny)
+
+    The grid columns are divided in chunks, each one evaluated on the rows
+    spanned by its points (e.g. grids clipped to a region or to the built-up
+    mask): only the densities of the points are kept. If the points cover
+    less than kde_grid_fill_ratio of the evaluated cells, the estimation is
+    carried out at the points instead (see TreeKernelDensityEstimation)
+
+    Parameters
+    ----------
+    X : array
+        input points
+    Weights : array or pandas.DataFrame
+        array of weights associated to points (or matrix, one column per
+        density)
+    bandwidth : float or list
+        bandwidth for kernel density estimation. Given a sequence, the
+        densities of every bandwidth are estimated sharing the distances
+    Y : array
+        points where density estimations will be performed (regular grid,
+        possibly with holes)
+    max_mb_per_chunk : float
+        maximum megabytes allocated for the kernel values and densities of
+        a chunk of grid columns (by default, derived from the available
+        memory)
+    grid : tuple
+        location of Y on its grid (see get_grid_indices)
+    n_jobs : int
+        number of threads evaluating the chunks (None: all the cores)
+    dtype : numpy.dtype
+        computation precision (e.g. np.float32)
+    tolerance : float
+        neglected kernel values (relative to its maximum) if the estimation
+        is carried out at the points of a sparse grid. If 0, the estimation
+        is exact
+
+    Returns
+    ----------
+    pd.Series or pd.DataFrame
+        returns the estimated densities rescaled between [0;1] (one column
+        per density for a weights matrix). For a sequence of bandwidths, a
+        dict of the densities of each bandwidth
+    """
+    Y = np.asarray(Y, dtype=float)
+    cols, rows, step, origin = grid
+
+    # Grid coordinates along each axis
+    x_grid = origin[0] + step * np.arange(cols.max() + 1)
+    x_grid[cols] = Y[:, 0]
+    y_grid = origin[1] + step * np.arange(rows.max() + 1)
+    y_grid[rows] = Y[:, 1]
+
+    X = np.asarray(X, dtype=float).reshape(-1, 2)
+    W = get_weights_matrix(Weights).astype(dtype)
+    bandwidths = get_bandwidths(bandwidth)
+    n_jobs = get_kde_n_jobs(n_jobs)
+    itemsize = np.dtype(dtype).itemsize
+
+    # Grid columns are divided in chunks to avoid big memory allocations
+    # For each column: x kernel values, weighted for every density, and the
+    # densities of its cells. For each chunk: y distances and kernel values
+    col_split = get_kde_chunks(
+        len(x_grid),
+        (
+            len(X) * (W.shape[1] + 1) * itemsize
+            + len(bandwidths) * W.shape[1] * len(y_grid) * 8
+        )
+        * 1e-6,
+        get_kde_chunk_megabytes(max_mb_per_chunk, n_jobs),
+        n_jobs,
+        len(X) * len(y_grid) * (8 + itemsize) * 1e-6,
+    )
+    # Points of each chunk (sorted by column), and rows spanned by them
+    order = np.argsort(cols, kind="stable")
+    col_bounds = np.searchsorted(cols[order], np.arange(len(x_grid) + 1))
+    chunks = []
+    for col_i in col_split:
+        points = order[col_bounds[col_i.start] : col_bounds[col_i.stop]]
+        if len(points):
+            rows_i = slice(rows[points].min(), rows[points].max() + 1)
+            chunks.append((col_i, rows_i, points))
+
+    evaluated_cells = sum(
+        (col_i.stop - col_i.start) * (rows_i.stop - rows_i.start)
+        for col_i, rows_i, _ in chunks
+    )
+    if len(Y) < kde_grid_fill_ratio * evaluated_cells:
+        # Sparse grid: Estimation at the points
+        return TreeKernelDensityEstimation(
+            X,
+            Weights,
+            bandwidth,
+            Y,
+            max_mb_per_chunk,
+            tolerance,
+            n_jobs=n_jobs,
+            dtype=dtype,
+        )
+
+    def get_chunk_densities(chunk):
+        col_i, rows_i, points = chunk
+        # Axis distances are shared by every bandwidth
+        dx_2 = (X[:, [0]] - x_grid[col_i]) ** 2
+        dy_2 = (X[:, [1]] - y_grid[rows_i]) ** 2
+        densities = []
+        for bw in bandwidths:
+            # Kernel values are shared by every density
+            kernel_x = gaussian_exp((-0.5 / bw ** 2 * dx_2).astype(dtype))
+            kernel_y = gaussian_exp((-0.5 / bw ** 2 * dy_2).astype(dtype))
+            # Every density in a single contraction over the input points:
+            # (X, densities * columns).T @ (X, rows)
+            weighted_x = W[:, :, np.newaxis] * kernel_x[:, np.newaxis, :]
+            density = (
+                weighted_x.reshape(len(X), -1).T @ kernel_y
+            ).reshape(W.shape[1], kernel_x.shape[1], kernel_y.shape[1])
+            densities.append(
+                density[
+                    :, cols[points] - col_i.start, rows[points] - rows_i.start
+                ].T
+            )
+        return np.stack(densities)
+
+    PDFs = np.zeros((len(bandwidths), len(Y), W.shape[1]))
+
+    def set_chunk_densities(chunk, densities):
+        PDFs[:, chunk[2]] = densities
+
+    map_kde_chunks(get_chunk_densities, chunks, n_jobs, set_chunk_densities)
+    # Rescale
+    return get_bandwidths_output(PDFs, Weights, bandwidth)
+
+
+def BinnedFFTKernelDensityEstimation(
+    X,
+    Weights,
+    bandwidth,
+    Y,
+    max_mb_per_chunk=None,
+    tolerance=kde_tolerance,
+    lattice_resolution=8,
+    n_jobs=None,
+    dtype=np.float64,
+    grid=None,
+):
+    """
+    Computes a Weighted Kernel Density Estimation on a regular grid, by
+    means of binning the weighted points onto a fine lattice and convolving
+    it with the Gaussian kernel (Fast Fourier Transform)
+
+    The lattice spacing h is the grid step divided by the smallest integer
+    giving h <= bandwidth / lattice_resolution. Linear binning moves each
+    point's weight by at most h along each axis, which bounds the error
+    with respect to the exact estimation, relative to the maximum density,
+    by approximately (h / bandwidth)^2 / 4 (below 0.4% for the default
+    resolution). The kernel is truncated where it is lower than tolerance
+
+    Falls back to the truncated estimation at arbitrary points (see
+    TreeKernelDensityEstimation) if the location of Y on a regular grid is
+    not given
+
+    Parameters
+    ----------
+    X : array
+        input points
+    Weights : array or pandas.DataFrame
+        array of weights associated to points (or matrix, one column per
+        density)
+    bandwidth : float or list
+        bandwidth for kernel density estimation. Given a sequence, the
+        densities of every bandwidth are estimated sharing the distances
+    Y : array
+        points where density estimations will be performed (regular grid)
+    max_mb_per_chunk : float
+        maximum megabytes allocated (used if no grid is given)
+    tolerance : float
+        neglected kernel values (relative to its maximum). If 0, the kernel
+        spans the whole lattice, which contains every input point
+    lattice_resolution : int
+        minimum number of lattice cells per bandwidth
+    n_jobs : int
+        number of threads (used if no grid is given)
+    dtype : numpy.dtype
+        computation precision of the convolution (e.g. np.float32)
+    grid : tuple
+        location of Y on its grid (see get_grid_indices)
+
+    Returns
+    ----------
+    pd.Series or pd.DataFrame
+        returns the estimated densities rescaled between [0;1] (one column
+        per density for a weights matrix). For a sequence of bandwidths, a
+        dict of the densities of each bandwidth
+    """
+    from scipy.signal import fftconvolve
+
+    if np.ndim(bandwidth) > 0:  # Lattice and kernel depend on the bandwidth
+        return {
+            bw: BinnedFFTKernelDensityEstimation(
+                X,
+                Weights,
+                bw,
+                Y,
+                max_mb_per_chunk,
+                tolerance,
+                lattice_resolution,
+                n_jobs,
+                dtype,
+                grid,
+            )
+            for bw in bandwidth
+        }
+    if grid is None:
+        return TreeKernelDensityEstimation(
+            X,
+            Weights,
+            bandwidth,
+            Y,
+            max_mb_per_chunk,
+            tolerance,
+            n_jobs=n_jobs,
+            dtype=dtype,
+        )
+    cols, rows, step, origin = grid
+
+    # Lattice: Grid refined by the oversampling factor, extended by the
+    # kernel radius
+    oversampling = max(1, int(math.ceil(step * lattice_resolution / bandwidth)))
+    h = step / oversampling
+    X = np.asarray(X, dtype=float).reshape(-1, 2)
+    cutoff = get_kernel_cutoff(tolerance) * bandwidth
+    if not np.isfinite(cutoff):
+        # Full support: The lattice contains every input point, and the
+        # kernel spans the whole lattice
+        grid_end = origin + step * np.array([cols.max(), rows.max()])
+        bounds = np.vstack([origin, grid_end, X])
+        cutoff = np.max(bounds.max(axis=0) - bounds.min(axis=0)) + h
+    radius = int(math.ceil(cutoff / h))
+    lattice_origin = origin - radius * h
+    shape = (
+        cols.max() * oversampling + 2 * radius + 2,
+        rows.max() * oversampling + 2 * radius + 2,
+    )
+
+    # Linear binning: Each point's weight is split among its 4 lattice nodes
+    W = get_weights_matrix(Weights)
+    position = (X - lattice_origin) / h
+    cell = np.floor(position).astype(np.int64)
+    fraction = position - cell
+    within = (
+        (cell[:, 0] >= 0)
+        & (cell[:, 0] < shape[0] - 1)
+        & (cell[:, 1] >= 0)
+        & (cell[:, 1] < shape[1] - 1)
     )
+    cell, fraction, W = cell[within], fraction[within], W[within]
+
+    # One lattice per density
+    binned = np.zeros((W.shape[1], shape[0] * shape[1]))
+    for dx, dy in [(0, 0), (1, 0), (0, 1), (1, 1)]:
+        node = (cell[:, 0] + dx) * shape[1] + (cell[:, 1] + dy)
+        share = (fraction[:, 0] if dx else 1 - fraction[:, 0]) * (
+            fraction[:, 1] if dy else 1 - fraction[:, 1]
+        )
+        for k, W_k in enumerate(W.T):
+            binned[k] += np.bincount(
+                node, weights=W_k * share, minlength=binned.shape[1]
+            )
+    binned = binned.reshape((W.shape[1],) + shape)
+
+    # Gaussian kernel sampled on the lattice
+    offsets = np.arange(-radius, radius + 1) * h
+    kernel_1d = np.exp(-0.5 * (offsets / bandwidth) ** 2)
+    kernel = np.outer(kernel_1d, kernel_1d)
+
+    density = fftconvolve(
+        binned.astype(dtype),
+        kernel[np.newaxis].astype(dtype),
+        mode="same",
+        axes=(1, 2),
+    )
+    PDF = density[
+        :, cols * oversampling + radius, rows * oversampling + radius
+    ].T
+    # Remove FFT round-off negative values
+    PDF = np.clip(PDF.astype(float), 0, None)
     # Rescale
-    return pd.Series(PDF / PDF.sum())
+    return get_densities_output(PDF, Weights)
+
+
+# Kernel Density Estimation engines (see landusemix.calculate_kde)
+kde_engines = {
+    "exact": WeightedKernelDensityEstimation,
+    "tree": TreeKernelDensityEstimation,
+    "fft": BinnedFFTKernelDensityEstimation,
+}
 
 
 def cut_in_two(line):
@@ -151,8 +1057,8 @@ def verify_divide_edge(
     if data.get("geometry", None):  # Geometry exists
         geometry = data["geometry"]
     else:  # Real geometry is a straight line between the two nodes
-        P_U = G.node[u]["x"], G.node[u]["y"]
-        P_V = G.node[v]["x"], G.node[v]["y"]
+        P_U = G.nodes[u]["x"], G.nodes[u]["y"]
+        P_V = G.nodes[v]["x"], G.nodes[v]["y"]
         geometry = LineString((P_U, P_V))
 
         # Get geometries for edge(u,middle), edge(middle,v) and node(middle)
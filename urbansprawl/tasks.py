@@ -49,6 +49,9 @@ from urbansprawl.osm.overpass import (
 from urbansprawl.osm.utils import (
     sanity_check_height_tags,
     associate_structures,
+    get_structure_association,
+    explode_dict_column,
+    compute_closest_building_distance,
 )
 from urbansprawl.osm.classification import (
     classify_tag,
@@ -91,9 +94,6 @@ OSM_TAG_COLUMNS = [
     "building:use",
     "building:part",
 ]
-COLUMNS_OF_INTEREST = OSM_TAG_COLUMNS + ["osm_id", "geometry", "height_tags"]
-COLUMNS_OF_INTEREST_POIS = OSM_TAG_COLUMNS + ["osm_id", "geometry"]
-COLUMNS_OF_INTEREST_LANDUSES = ["osm_id", "geometry", "landuse"]
 HEIGHT_TAGS = [
     "min_height",
     "height",
@@ -105,6 +105,9 @@ HEIGHT_TAGS = [
     "building:levels",
     "building:levels:underground",
 ]
+COLUMNS_OF_INTEREST = OSM_TAG_COLUMNS + ["osm_id", "geometry"] + HEIGHT_TAGS
+COLUMNS_OF_INTEREST_POIS = OSM_TAG_COLUMNS + ["osm_id", "geometry"]
+COLUMNS_OF_INTEREST_LANDUSES = ["osm_id", "geometry", "landuse"]
 BUILDING_PARTS_TO_FILTER = ["no", "roof"]
 MINIMUM_M2_BUILDING_AREA = 9.0
 
@@ -384,15 +387,6 @@ class SanityCheck(luigi.Task):
     def run(self):
         gdf = gpd.read_file(self.input().path)
         sanity_check_height_tags(gdf)
-
-        def remove_nan_dict(x):
-            """Remove entries with nan values
-            """
-            return {k: v for k, v in x.items() if pd.notnull(v)}
-
-        gdf["height_tags"] = gdf[
-            [c for c in HEIGHT_TAGS if c in gdf.columns]
-        ].apply(lambda x: remove_nan_dict(x.to_dict()), axis=1)
         columns_to_drop = [
             col for col in list(gdf.columns) if col not in COLUMNS_OF_INTEREST
         ]
@@ -782,15 +776,21 @@ class ComputeLandUse(luigi.Task):
         # Set the composed classification given, for each building,
         # its containing Points of Interest and building parts classification
         buildings.loc[
-            buildings.apply(
-                lambda x: x.landuses_m2["activity"] > 0
-                and x.landuses_m2["residential"] > 0,
-                axis=1,
-            ),
+            (buildings.m2_activity > 0) & (buildings.m2_residential > 0),
             "classification",
         ] = "mixed"
-        clean_list_in_geodataframe_column(buildings, "containing_parts")
-        clean_list_in_geodataframe_column(buildings, "containing_poi")
+        explode_dict_column(buildings, "key_value", "key_value_", "category")
+        # Nearest building distances: Reused by the dispersion tasks
+        compute_closest_building_distance(buildings)
+        # List views of the structure associations (GeoJSON serialization)
+        for column, structures in [
+            ("containing_parts", building_parts),
+            ("containing_poi", pois),
+        ]:
+            buildings[column] = get_structure_association(
+                buildings, column, structures
+            ).to_lists()
+            clean_list_in_geodataframe_column(buildings, column)
         clean_list_in_geodataframe_column(buildings, "activity_category")
         buildings.to_file(self.output().path, driver="GeoJSON")
 
@@ -869,6 +869,8 @@ class GetIndiceGrid(luigi.Task):
     AAAA-MM-DDThhmm)
     step : int
         Distance (in meters) between each grid structuring points
+    clip_to_city : bool
+        Keep only the grid points within the city boundary
 
     """
 
@@ -876,20 +878,25 @@ class GetIndiceGrid(luigi.Task):
     datapath = luigi.Parameter("./data")
     geoformat = luigi.Parameter("geojson")
     step = luigi.IntParameter(default=400)
+    clip_to_city = luigi.BoolParameter()
 
     def requires(self):
         return GetBoundingBox(self.city, self.datapath)
 
     def output(self):
+        data_ident = str(self.step) + ("-clipped" if self.clip_to_city else "")
         output_path = define_filename(
-            "indice-grid", self.city, self.step, self.datapath, self.geoformat
+            "indice-grid", self.city, data_ident, self.datapath, self.geoformat
         )
         return luigi.LocalTarget(output_path)
 
     def run(self):
-        city_gdf = gpd.read_file(self.input().path)
-        bbox = osmnx.project_gdf(city_gdf).total_bounds
-        indices = get_indices_grid_from_bbox(bbox, self.step)
+        city_gdf = osmnx.project_gdf(gpd.read_file(self.input().path))
+        bbox = city_gdf.total_bounds
+        polygon = city_gdf.unary_union if self.clip_to_city else None
+        indices = get_indices_grid_from_bbox(
+            bbox, self.step, city_gdf.crs, polygon=polygon
+        )
         indices.to_file(self.output().path, driver="GeoJSON")
 
 
@@ -923,6 +930,15 @@ class ComputeGridLandUseMix(luigi.Task):
     meter)
     log_weighted : bool
             apply natural logarithmic function to surface weights
+    kde_engine : str
+            Kernel Density Estimation engine ('exact', 'tree' or 'fft')
+    kde_tolerance : float
+            neglected kernel values (relative to its maximum) of the 'tree'
+    and 'fft' engines
+    kde_n_jobs : int
+            number of threads evaluating the kernel (0: all the cores)
+    kde_float32 : bool
+            compute the kernel values in single precision
 
     """
 
@@ -938,6 +954,10 @@ class ComputeGridLandUseMix(luigi.Task):
     weighted_kde = luigi.BoolParameter()
     pois_weights = luigi.IntParameter(9)
     log_weighted = luigi.BoolParameter()
+    kde_engine = luigi.Parameter("exact")
+    kde_tolerance = luigi.FloatParameter(1e-8)
+    kde_n_jobs = luigi.IntParameter(0)
+    kde_float32 = luigi.BoolParameter()
 
     def requires(self):
         return {
@@ -984,6 +1004,10 @@ class ComputeGridLandUseMix(luigi.Task):
             "weighted_kde": self.weighted_kde,
             "pois_weight": self.pois_weights,
             "log_weighted": self.log_weighted,
+            "kde_engine": self.kde_engine,
+            "kde_tolerance": self.kde_tolerance,
+            "kde_n_jobs": self.kde_n_jobs or None,
+            "kde_float32": self.kde_float32,
         }
         compute_grid_landusemix(grid, buildings, pois, landusemix_args)
         grid.to_file(self.output().path, driver="GeoJSON")
@@ -1021,7 +1045,7 @@ class PlotLandUseMix(luigi.Task):
             apply natural logarithmic function to surface weights
     plotted_feature : str
         Dimension to plot, either `activity_pdf`, `residential_pdf`,
-    `landusemix` or `landuse_intensity`. May also be
+    `landusemix`, `landusemix_categories` or `landuse_intensity`. May also be
     `commercial/industrial_pdf`, `shop_pdf` or `leisure/amenity_pdf` if
     detailed activity have been required (`compute_activity_types_kd` is True).
 
@@ -1376,7 +1400,6 @@ class ComputeGridDispersion(luigi.Task):
     meters_per_level = luigi.IntParameter(3)
     radius_search = luigi.IntParameter(750)
     use_median = luigi.BoolParameter()  # False
-    K_nearest = luigi.IntParameter(50)
 
     def requires(self):
         return {
@@ -1412,7 +1435,6 @@ class ComputeGridDispersion(luigi.Task):
         dispersion_args = {
             "radius_search": self.radius_search,
             "use_median": self.use_median,
-            "K_nearest": self.K_nearest,
         }
         compute_grid_dispersion(grid, buildings, dispersion_args)
         grid.to_file(self.output().path, driver="GeoJSON")
@@ -1460,7 +1482,6 @@ class PlotDispersion(luigi.Task):
     meters_per_level = luigi.IntParameter(3)
     radius_search = luigi.IntParameter(750)
     use_median = luigi.BoolParameter()  # False
-    K_nearest = luigi.IntParameter(50)
     figsize = luigi.IntParameter(8)
 
     def requires(self):
@@ -1475,7 +1496,6 @@ class PlotDispersion(luigi.Task):
                 self.meters_per_level,
                 self.radius_search,
                 self.use_median,
-                self.K_nearest,
             ),
             "graph": GetRouteGraph(
                 self.city, self.datapath, self.geoformat, self.date_query
@@ -2143,7 +2163,6 @@ class PlotGPWData(luigi.Task):
     log_weighted = luigi.BoolParameter()
     radius_search = luigi.IntParameter(750)
     use_median = luigi.BoolParameter()  # False
-    K_nearest = luigi.IntParameter(50)
     batch_size = luigi.IntParameter(32)
     epochs = luigi.IntParameter(50)
 
@@ -2167,7 +2186,6 @@ class PlotGPWData(luigi.Task):
                 self.log_weighted,
                 self.radius_search,
                 self.use_median,
-                self.K_nearest
             )
         else:
             raise ValueError("Unknown scale, enter either 'coarse' or 'fine'.")
@@ -2264,7 +2282,6 @@ class ComputePopulationFeatures(luigi.Task):
             apply natural logarithmic function to surface weights
     radius_search : int
     use_median : bool
-    K_nearest : int
     """
 
     city = luigi.Parameter()
@@ -2281,7 +2298,6 @@ class ComputePopulationFeatures(luigi.Task):
     log_weighted = luigi.BoolParameter()
     radius_search = luigi.IntParameter(750)
     use_median = luigi.BoolParameter()  # False
-    K_nearest = luigi.IntParameter(50)
 
     def requires(self):
         if self.data_source == "insee":
@@ -2345,7 +2361,6 @@ class ComputePopulationFeatures(luigi.Task):
         dispersion_args = {
             "radius_search": self.radius_search,
             "use_median": self.use_median,
-            "K_nearest": self.K_nearest,
         }
         gdf = compute_full_urban_features(
             self.city,
@@ -2398,7 +2413,6 @@ class SplitPopulationFeatures(luigi.Task):
             apply natural logarithmic function to surface weights
     radius_search : int
     use_median : bool
-    K_nearest : int
     """
 
     city = luigi.Parameter()
@@ -2415,7 +2429,6 @@ class SplitPopulationFeatures(luigi.Task):
     log_weighted = luigi.BoolParameter()
     radius_search = luigi.IntParameter(750)
     use_median = luigi.BoolParameter()  # False
-    K_nearest = luigi.IntParameter(50)
 
     def requires(self):
         return ComputePopulationFeatures(
@@ -2433,7 +2446,6 @@ class SplitPopulationFeatures(luigi.Task):
             self.log_weighted,
             self.radius_search,
             self.use_median,
-            self.K_nearest,
         )
 
     def output(self):
@@ -2515,7 +2527,6 @@ class TrainPopulationDownscalingModel(luigi.Task):
             apply natural logarithmic function to surface weights
     radius_search : int
     use_median : bool
-    K_nearest : int
     batch_size : int
         Number of gridded sample to consider in each batch of data (must be
     small if limited computing resources)
@@ -2537,7 +2548,6 @@ class TrainPopulationDownscalingModel(luigi.Task):
     log_weighted = luigi.BoolParameter()
     radius_search = luigi.IntParameter(750)
     use_median = luigi.BoolParameter()  # False
-    K_nearest = luigi.IntParameter(50)
     batch_size = luigi.IntParameter(32)
     epochs = luigi.IntParameter(50)
 
@@ -2558,7 +2568,6 @@ class TrainPopulationDownscalingModel(luigi.Task):
                 self.log_weighted,
                 self.radius_search,
                 self.use_median,
-                self.K_nearest,
             )
 
     def output(self):
@@ -2636,7 +2645,6 @@ class InferINSEEPopulationDownscaling(luigi.Task):
             apply natural logarithmic function to surface weights
     radius_search : int
     use_median : bool
-    K_nearest : int
     batch_size : int
         Number of gridded sample to consider in each batch of data (must be
     small if limited computing resources)
@@ -2659,7 +2667,6 @@ class InferINSEEPopulationDownscaling(luigi.Task):
     log_weighted = luigi.BoolParameter()
     radius_search = luigi.IntParameter(750)
     use_median = luigi.BoolParameter()  # False
-    K_nearest = luigi.IntParameter(50)
     batch_size = luigi.IntParameter(32)
     epochs = luigi.IntParameter(50)
 
@@ -2680,7 +2687,6 @@ class InferINSEEPopulationDownscaling(luigi.Task):
                 self.log_weighted,
                 self.radius_search,
                 self.use_median,
-                self.K_nearest,
             ),
             "features": SplitPopulationFeatures(
                 self.city,
@@ -2697,7 +2703,6 @@ class InferINSEEPopulationDownscaling(luigi.Task):
                 self.log_weighted,
                 self.radius_search,
                 self.use_median,
-                self.K_nearest,
             ),
         }
 
@@ -2756,7 +2761,6 @@ class InferGPWPopulationDownscaling(luigi.Task):
             apply natural logarithmic function to surface weights
     radius_search : int
     use_median : bool
-    K_nearest : int
     batch_size : int
         Number of gridded sample to consider in each batch of data (must be
     small if limited computing resources)
@@ -2778,7 +2782,6 @@ class InferGPWPopulationDownscaling(luigi.Task):
     log_weighted = luigi.BoolParameter()
     radius_search = luigi.IntParameter(750)
     use_median = luigi.BoolParameter()  # False
-    K_nearest = luigi.IntParameter(50)
     batch_size = luigi.IntParameter(32)
     epochs = luigi.IntParameter(50)
 
@@ -2799,7 +2802,6 @@ class InferGPWPopulationDownscaling(luigi.Task):
                 self.log_weighted,
                 self.radius_search,
                 self.use_median,
-                self.K_nearest,
             ),
             "features": SplitPopulationFeatures(
                 self.city,
@@ -2816,7 +2818,6 @@ class InferGPWPopulationDownscaling(luigi.Task):
                 self.log_weighted,
                 self.radius_search,
                 self.use_median,
-                self.K_nearest,
             ),
         }
 
@@ -2872,7 +2873,6 @@ class DownscaleGPWPopulationEstimates(luigi.Task):
             apply natural logarithmic function to surface weights
     radius_search : int
     use_median : bool
-    K_nearest : int
     batch_size : int
         Number of gridded sample to consider in each batch of data (must be
     small if limited computing resources)
@@ -2894,7 +2894,6 @@ class DownscaleGPWPopulationEstimates(luigi.Task):
     log_weighted = luigi.BoolParameter()
     radius_search = luigi.IntParameter(750)
     use_median = luigi.BoolParameter()  # False
-    K_nearest = luigi.IntParameter(50)
     batch_size = luigi.IntParameter(32)
     epochs = luigi.IntParameter(50)
 
@@ -2915,7 +2914,6 @@ class DownscaleGPWPopulationEstimates(luigi.Task):
             self.log_weighted,
             self.radius_search,
             self.use_median,
-            self.K_nearest
         ),
                 "grid": GridGPW(self.datapath, self.city),
                 "inference_grid": CreateInferenceGrid(self.datapath, self.city)
@@ -2946,7 +2944,7 @@ class DownscaleGPWPopulationEstimates(luigi.Task):
         gdf = gpd.GeoDataFrame(
             {"pred": y_preds, "geometry": geoms}, crs=utm_proj
         )
-        gdf_output = gpd.sjoin(gdf, pop_grid, op="contains")
+        gdf_output = gpd.sjoin(gdf, pop_grid, predicate="contains")
         gdf_output["pop_count"] = gdf_output["coarse_pop"] * gdf_output["pred"]
         gdf_output[["geometry", "pop_count"]].to_file(
             self.output().path, driver="GeoJSON"